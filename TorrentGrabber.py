@@ -1,403 +1,3104 @@
 import sys
 import os
+import json
+import socket
+from pathlib import Path
+
+SOCKET_PATH = Path.home() / ".ytsdownloader.sock"
+
+def run_thin_client(argv):
+    """Run a command in the daemon; returns its exit code, or None if no daemon is running"""
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(str(SOCKET_PATH))
+    except OSError:
+        client.close()
+        return None
+    with client, client.makefile('rwb') as stream:
+        request = {"argv": argv, "cwd": os.getcwd(), "tty": sys.stdout.isatty()}
+        stream.write((json.dumps(request) + "\n").encode())
+        stream.flush()
+        for line in stream:
+            message = json.loads(line)
+            if "out" in message:
+                sys.stdout.write(message["out"])
+                sys.stdout.flush()
+            elif "prompt" in message:
+                try:
+                    answer = input(message["prompt"])
+                except EOFError:
+                    answer = ""
+                stream.write((json.dumps({"answer": answer}) + "\n").encode())
+                stream.flush()
+            elif "exit" in message:
+                return message["exit"]
+    print("⚠️  Lost connection to the daemon")
+    return 1
+
+# Thin-client fast path: with a daemon running, hand the command over before
+# importing anything heavier
+if __name__ == "__main__" and SOCKET_PATH.exists() and not {'--daemon', '--no-daemon'} & set(sys.argv[1:]):
+    _exit_code = run_thin_client(sys.argv[1:])
+    if _exit_code is not None:
+        sys.exit(_exit_code)
+
 import asyncio
 import argparse
-import json
-import requests
+import shutil
+import hashlib
+import tempfile
+import sqlite3
+import contextlib
+import contextvars
+import importlib
+import collections
+import ctypes
+import ctypes.util
+import errno
+import fcntl
+import itertools
+import struct
+import concurrent.futures
+import random
+import re
+from difflib import SequenceMatcher
 import time
-from pathlib import Path
-from pyppeteer import launch
-from tqdm import tqdm
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED, TimeoutError as FutureTimeoutError
+from html.parser import HTMLParser
+from urllib.parse import quote, quote_plus, urljoin, urlparse
+
+
+class _LazyModule:
+    """Import a module on first attribute access so thin-client runs never pay for it"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+requests = _LazyModule('requests')
 
 
 # Using Qbittorrent CLI to automate: https://github.com/fedarovich/qbittorrent-cli/releases/tag/v1.7.21116.1
 
 CONFIG_FILE = Path.home() / ".ytsdownloader_config.json"
+STATE_FILE = Path.home() / ".ytsdownloader_state.json"  # Caches we rewrite often: endpoint, session, tracker health
+CACHE_FILE = Path.home() / ".ytsdownloader_cache.sqlite3"
+CACHE_MAX_BYTES = 50 * 1024 * 1024
+TORRENT_CACHE_DIR = Path.home() / ".cache" / "ytsdownloader" / "torrents"
+WATCH_FOLDER = os.path.expanduser("~/TorrentWatch")
+CATALOG_FILE = Path.home() / ".ytsdownloader_catalog.sqlite3"
+OWNED_INDEX_FILE = Path.home() / ".ytsdownloader_owned.sqlite3"
+JOURNAL_FILE = Path.home() / ".ytsdownloader_journal.jsonl"
+BROWSE_CACHE_TTL = 6 * 3600  # Search results change as YTS adds movies
+MOVIE_CACHE_TTL = 7 * 24 * 3600  # Quality listings rarely change once published
 DEFAULT_DOWNLOAD_DIR = str(Path.home() / "Downloads")
+DEFAULT_LIBRARY_CONFIG = {
+    "dir": None,  # e.g. ~/jellyfin/media/Movies; the library stage is off until this is set
+    "mode": "link",  # "link": hardlink/reflink/copy, torrent keeps seeding in place; "move": torrents/setLocation
+    "jellyfin_url": None,
+    "jellyfin_api_key": None,
+    "jellyfin_path": None  # The library dir as Jellyfin sees it (e.g. /media/Movies in the container)
+}
+DEFAULT_BROWSER_CONFIG = {
+    # Only the HTML is read, so images, fonts, stylesheets and trackers are never fetched
+    "block_resource_types": ["image", "media", "font", "stylesheet"],
+    "block_domains": ["google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+                      "adservice.google.com", "facebook.net", "hotjar.com", "popads.net", "propellerads.com"],
+    "page_pool": 4,  # Pre-warmed tabs shared by all titles (also caps concurrent page loads)
+    "page_reuse": 25,  # Loads before a tab is closed and replaced, to cap renderer memory
+    "profile_dir": str(Path.home() / ".cache" / "ytsdownloader" / "chromium"),  # null: throwaway profile
+    "executable": None,  # Chromium binary; null lets pyppeteer find its own
+}
+LIBRARY_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.m4v', '.srt', '.sub', '.ass')
+LIBRARY_MOVE_TIMEOUT = 1800
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.m4v')
+FICLONE = 0x40049409  # ioctl(dst, FICLONE, src): share extents on btrfs/XFS
 DEFAULT_QBITTORRENT_CONFIG = {
     "host": "localhost",
     "port": 8082,
     "username": "admin",
-    "password": "111111"
+    "password": "111111",
+    "persist_session": True
+}
+QBITTORRENT_FALLBACK_PORTS = [8082, 50583, 8080, 8081]
+QBITTORRENT_ENDPOINT_TTL = 24 * 3600  # Re-probe Web UI ports at most once a day
+YTS_BASE_URL = "https://yts.mx"
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/97.0.4692.71 Safari/537.36'
+QUALITY_TYPES = ['BluRay', 'WEB']
+TRACKER_CANDIDATES = [
+    "udp://tracker.opentrackr.org:1337/announce",
+    "udp://open.demonii.com:1337/announce",
+    "udp://open.stealth.si:80/announce",
+    "udp://tracker.torrent.eu.org:451/announce",
+    "udp://exodus.desync.com:6969/announce",
+    "udp://explodie.org:6969/announce",
+    "udp://tracker.openbittorrent.com:80",
+    "udp://tracker.coppersurfer.tk:6969",
+    "udp://glotorrents.pw:6969/announce",
+    "udp://torrent.gresille.org:80/announce",
+    "udp://p4p.arenabg.com:1337",
+    "udp://tracker.leechers-paradise.org:6969",
+    "https://tracker.opentrackr.org:443/announce"
+]
+TRACKER_HEALTH_TTL = 6 * 3600
+TRACKER_PROBE_TIMEOUT = 2
+MAGNET_TRACKER_COUNT = 8
+MIRROR_EWMA_ALPHA = 0.3
+MIRROR_FAILURE_THRESHOLD = 3  # Consecutive failures before a mirror's circuit opens
+MIRROR_COOLDOWN = 60  # Seconds an open circuit stays open
+
+_trace_sink = contextvars.ContextVar('trace_sink', default=None)
+_current_span = contextvars.ContextVar('current_span', default=None)
+# Position of the title being processed in its batch (lower = wanted sooner)
+_batch_position = contextvars.ContextVar('batch_position', default=None)
+
+class TraceFile:
+    """JSONL sink for the spans and counters of one command (--trace)"""
+
+    def __init__(self, path):
+        self.file = open(path, 'w')
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+
+    def write(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock:
+            self.file.write(line)
+
+    def close(self):
+        self.write({"counters": dict(self.counters)})
+        self.file.close()
+
+class Span:
+    """Times one stage; written to the trace file and added to the /metrics totals"""
+    _ids = itertools.count(1)
+
+    def __init__(self, metrics, name, attrs):
+        self.metrics = metrics
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        self.id = next(self._ids)
+        self.parent = _current_span.get()
+        self._token = _current_span.set(self.id)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current_span.reset(self._token)
+        if self.metrics.aggregate:
+            with self.metrics.lock:
+                stage = self.metrics.stages[self.name]
+                stage[0] += 1
+                stage[1] += elapsed
+        sink = _trace_sink.get()
+        if sink is not None:
+            record = {"span": self.name, "id": self.id, "parent": self.parent, "start": self.wall,
+                      "ms": round(elapsed * 1000, 3), **self.attrs}
+            if exc_type is not None:
+                record["error"] = exc_type.__name__
+            sink.write(record)
+        return False
+
+class Metrics:
+    """Stage spans and counters; nearly free unless --trace or the /metrics endpoint is on"""
+
+    def __init__(self):
+        self.aggregate = False  # Keep process-wide totals (set by the daemon's /metrics endpoint)
+        self.lock = threading.Lock()
+        self.counters = collections.Counter()
+        self.stages = collections.defaultdict(lambda: [0, 0.0])
+
+    def span(self, name, **attrs):
+        """Context manager timing one stage (works across awaits within a task)"""
+        if not self.aggregate and _trace_sink.get() is None:
+            return _NO_SPAN
+        return Span(self, name, attrs)
+
+    def count(self, name, value=1):
+        if self.aggregate:
+            with self.lock:
+                self.counters[name] += value
+        sink = _trace_sink.get()
+        if sink is not None:
+            with sink.lock:
+                sink.counters[name] += value
+
+    def prometheus(self):
+        """Render the totals in the Prometheus text exposition format"""
+        lines = []
+        with self.lock:
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE ytsdownloader_{name}_total counter")
+                lines.append(f"ytsdownloader_{name}_total {value}")
+            lines.append("# TYPE ytsdownloader_stage_seconds summary")
+            for name, (count, total) in sorted(self.stages.items()):
+                lines.append(f'ytsdownloader_stage_seconds_count{{stage="{name}"}} {count}')
+                lines.append(f'ytsdownloader_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+        return "\n".join(lines) + "\n"
+
+_NO_SPAN = contextlib.nullcontext()
+metrics = Metrics()
+
+async def serve_metrics(port):
+    """Serve GET /metrics in the Prometheus text format on localhost"""
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip():
+                pass
+            path = request_line.split()[1].decode() if len(request_line.split()) > 1 else ''
+            if path.split('?')[0] == '/metrics':
+                status, body = "200 OK", metrics.prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"Not found\n"
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    metrics.aggregate = True
+    return await asyncio.start_server(handle, '127.0.0.1', port)
+
+
+def get_qbittorrent_config():
+    """Get qBittorrent Web UI configuration"""
+    config = load_config()
+    qbt_config = config.get("qbittorrent", DEFAULT_QBITTORRENT_CONFIG.copy())
+    
+    # Ensure all required keys exist
+    for key, default_value in DEFAULT_QBITTORRENT_CONFIG.items():
+        if key not in qbt_config:
+            qbt_config[key] = default_value
+    
+    return qbt_config
+
+def save_qbittorrent_config(qbt_config):
+    """Save qBittorrent Web UI configuration"""
+    return update_config(qbittorrent=qbt_config)
+
+async def qbittorrent_ready(timeout=3):
+    """Return True if a qBittorrent Web UI answers (re-probing every candidate if the cached one doesn't)"""
+    url = await asyncio.to_thread(resolve_qbittorrent_endpoint, False, timeout)
+    if url and await asyncio.to_thread(probe_qbittorrent_endpoint, url, timeout):
+        return True
+    return await asyncio.to_thread(resolve_qbittorrent_endpoint, True, timeout) is not None
+
+def qbittorrent_process_running():
+    """Return True if a local qBittorrent process exists (reads /proc/*/comm, nothing is spawned)"""
+    try:
+        pids = [entry for entry in os.listdir('/proc') if entry.isdigit()]
+    except OSError:
+        return False
+    for pid in pids:
+        try:
+            with open(f'/proc/{pid}/comm') as f:
+                name = f.read().strip()
+        except OSError:
+            continue  # Exited meanwhile
+        # qbittorrent (also inside the flatpak) or qbittorrent-nox
+        if name.startswith('qbittorrent'):
+            return True
+    return False
+
+async def ensure_qbittorrent_running():
+    """Ensure qBittorrent is running, start it if not"""
+    import subprocess
+    
+    # A Web UI that answers means qBittorrent is running and ready
+    if await qbittorrent_ready():
+        print("✅ qBittorrent is already running")
+        return True
+    
+    try:
+        if await asyncio.to_thread(qbittorrent_process_running):
+            # Running but its Web UI isn't up yet (still starting); launching it again won't help
+            print("⏳ Waiting for qBittorrent to finish starting...")
+        else:
+            print("🚀 Starting qBittorrent...")
+            env = os.environ.copy()
+            env['DISPLAY'] = ':0'
+            env['WAYLAND_DISPLAY'] = 'gamescope-0'
+
+            subprocess.Popen(['flatpak', 'run', 'org.qbittorrent.qBittorrent'],
+                            env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        
+        # Wait up to 20 seconds for the Web UI to come up
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline:
+            if await qbittorrent_ready(timeout=1):
+                print("✅ qBittorrent started successfully")
+                return True
+            await asyncio.sleep(0.5)
+        
+        print("⚠️  qBittorrent may not have started properly")
+        return False
+        
+    except Exception as e:
+        print(f"❌ Failed to start qBittorrent: {e}")
+        return False
+
+# inotify(7) constants
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_MOVED_FROM = 0x00000040
+IN_DELETE = 0x00000200
+
+async def _wait_for_removal_inotify(path):
+    """Resolve as soon as inotify reports path deleted or moved away"""
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+    loop = asyncio.get_running_loop()
+    removed = loop.create_future()
+    name = os.path.basename(path).encode()
+
+    def on_events():
+        try:
+            data = os.read(fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            _, mask, _, length = struct.unpack_from('iIII', data, offset)
+            event_name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+            offset += 16 + length
+            if event_name == name and mask & (IN_DELETE | IN_MOVED_FROM) and not removed.done():
+                removed.set_result(True)
+
+    try:
+        if libc.inotify_add_watch(fd, os.path.dirname(path).encode(), IN_DELETE | IN_MOVED_FROM) < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        loop.add_reader(fd, on_events)
+        try:
+            # The file may already be gone before the watch was in place
+            if os.path.exists(path):
+                await removed
+        finally:
+            loop.remove_reader(fd)
+    finally:
+        os.close(fd)
+
+async def _wait_for_removal_polling(path, interval=0.25):
+    while os.path.exists(path):
+        await asyncio.sleep(interval)
+
+async def wait_for_file_removal(path, timeout):
+    """Wait until path disappears (inotify on Linux, polling elsewhere); False on timeout"""
+    try:
+        if sys.platform.startswith('linux'):
+            waiter = _wait_for_removal_inotify(path)
+        else:
+            waiter = _wait_for_removal_polling(path)
+        await asyncio.wait_for(waiter, timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    except (OSError, AttributeError):
+        # No usable inotify (e.g. watch limit reached); poll instead
+        try:
+            await asyncio.wait_for(_wait_for_removal_polling(path), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+async def wait_for_watch_folder_processing(torrent_filename, torrent_hash, monitor=None):
+    """Wait for qBittorrent to process the torrent file from watch folder"""
+    torrent_path = os.path.join(WATCH_FOLDER, torrent_filename)
+    
+    # Ensure qBittorrent is running before waiting
+    await ensure_qbittorrent_running()
+    
+    print("⏳ Waiting for qBittorrent to process torrent...")
+    
+    # qBittorrent removes the file from the watch folder once it has consumed it
+    with metrics.span("watch_folder.wait", file=torrent_filename):
+        removed = await wait_for_file_removal(torrent_path, timeout=60)
+    if removed:
+        print("✅ Download started!")
+    else:
+        print("⚠️  Torrent not processed - check qBittorrent watch folder settings")
+        return False
+    
+    # Now look for the download in qBittorrent
+    if monitor is not None:
+        monitor.add(torrent_hash)
+        return True
+    return await monitor_qbittorrent_download(torrent_hash)
+
+class QBittorrentClient:
+    """qBittorrent Web API client that logs in once and reuses the SID cookie"""
+
+    def __init__(self, base_url, username, password, persist_session=True):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.persist_session = persist_session
+        self.logins = 0
+        self.logged_in = False
+
+        # One keep-alive connection pool shared by every API call
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Referer'] = self.base_url
+
+        if persist_session:
+            self._restore_session()
+
+    def _restore_session(self):
+        """Reuse the SID saved by a previous run against the same Web UI"""
+        saved = load_state().get("qbittorrent_session") or {}
+        if saved.get("url") == self.base_url and saved.get("username") == self.username and saved.get("sid"):
+            self.session.cookies.set("SID", saved["sid"])
+            self.logged_in = True
+
+    def _save_session(self):
+        sid = self.session.cookies.get("SID")
+        if not sid:
+            return
+        update_state("qbittorrent_session", {"url": self.base_url, "username": self.username, "sid": sid})
+
+    def login(self):
+        """Log in to the Web API and keep the SID cookie"""
+        self.logins += 1
+        metrics.count("qbt_logins")
+        self.session.cookies.clear()
+        login_data = {'username': self.username, 'password': self.password}
+        response = self.session.post(f"{self.base_url}/api/v2/auth/login", data=login_data, timeout=5)
+        # qBittorrent answers bad credentials with 200 "Fails."
+        self.logged_in = response.status_code == 200 and response.text.strip() != "Fails."
+        if self.logged_in and self.persist_session:
+            self._save_session()
+        return self.logged_in
+
+    def request(self, method, path, timeout=5, **kwargs):
+        """Send an API request, logging in first and re-authenticating once on 403"""
+        if not self.logged_in:
+            self.login()
+        url = f"{self.base_url}/api/v2/{path}"
+        metrics.count("qbt_requests")
+        try:
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+        except requests.ConnectionError:
+            # The Web UI moved or went away: re-probe on the next call
+            forget_qbittorrent_endpoint()
+            raise
+        if response.status_code == 403 and self.login():
+            response = self.session.request(method, url, timeout=timeout, **kwargs)
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+_qbittorrent_client = None
+_qbittorrent_lock = threading.Lock()
+_torrent_tracker = None
+
+def probe_qbittorrent_endpoint(base_url, timeout=3):
+    """Return True if a qBittorrent Web UI answers at base_url"""
+    try:
+        response = requests.get(f"{base_url}/api/v2/app/version", timeout=timeout)
+    except Exception:
+        return False
+    # Any API answer (403 included) means a Web UI is listening here
+    return response.status_code in (200, 403)
+
+def qbittorrent_endpoint_candidates():
+    """Candidate Web UI URLs: configured host and port first, then fallbacks"""
+    qbt_config = get_qbittorrent_config()
+    hosts = list(dict.fromkeys([qbt_config["host"], "localhost"]))
+    ports = list(dict.fromkeys([qbt_config["port"]] + QBITTORRENT_FALLBACK_PORTS))
+    return [f"http://{host}:{port}" for host in hosts for port in ports]
+
+def resolve_qbittorrent_endpoint(refresh=False, timeout=3):
+    """Find a live Web UI, probing every candidate at once and caching the winner"""
+    candidates = qbittorrent_endpoint_candidates()
+    cached = load_state().get("qbittorrent_endpoint") or {}
+    if (not refresh and cached.get("url") in candidates
+            and time.time() - cached.get("resolved_at", 0) < QBITTORRENT_ENDPOINT_TTL):
+        return cached["url"]
+
+    winner = None
+    executor = ThreadPoolExecutor(max_workers=len(candidates))
+    futures = {executor.submit(probe_qbittorrent_endpoint, url, timeout): url for url in candidates}
+    try:
+        for future in as_completed(futures, timeout=timeout + 1):
+            if future.result():
+                winner = futures[future]
+                break
+    except FutureTimeoutError:
+        pass
+    # Don't wait for slow or dead candidates once we have an answer
+    executor.shutdown(wait=False, cancel_futures=True)
+
+    if winner:
+        update_state("qbittorrent_endpoint", {"url": winner, "resolved_at": time.time()})
+    return winner
+
+def forget_qbittorrent_endpoint():
+    """Drop the cached endpoint and shared client so the next call re-probes"""
+    global _qbittorrent_client, _torrent_tracker
+    if _qbittorrent_client is not None:
+        _qbittorrent_client.close()
+    _qbittorrent_client = None
+    _torrent_tracker = None
+    update_state("qbittorrent_endpoint", None)
+
+def get_qbittorrent_client():
+    """Get the shared qBittorrent client, resolving the Web UI endpoint on first use"""
+    global _qbittorrent_client
+    with _qbittorrent_lock:
+        if _qbittorrent_client is None:
+            _qbittorrent_client = _connect_qbittorrent_client()
+        return _qbittorrent_client
+
+def _connect_qbittorrent_client():
+    qbt_config = get_qbittorrent_config()
+    for refresh in (False, True):
+        base_url = resolve_qbittorrent_endpoint(refresh=refresh)
+        if not base_url:
+            return None
+        client = QBittorrentClient(base_url, qbt_config["username"], qbt_config["password"],
+                                   persist_session=qbt_config["persist_session"])
+        try:
+            if client.logged_in or client.login():
+                return client
+        except Exception:
+            pass
+        client.close()
+    return None
+
+class TorrentStateTracker:
+    """Hash-keyed torrent state kept current from /api/v2/sync/maindata deltas"""
+
+    def __init__(self, client):
+        self.client = client
+        self.rid = 0
+        self.torrents = {}
+        # Per endpoint: polls, bytes and CPU seconds, summed and at most (a monitor can poll for days)
+        self.poll_stats = {}
+
+    def poll(self, torrent_hashes=()):
+        """Apply the next sync delta, falling back to torrents/info?hashes= for the given hashes"""
+        start_cpu = time.process_time()
+        metrics.count("poll_ticks")
+        response = self.client.get("sync/maindata", params={'rid': self.rid}, timeout=3)
+        if response.status_code == 200:
+            data = response.json()
+            if data.get('full_update'):
+                self.torrents = {}
+            for torrent_hash, changes in (data.get('torrents') or {}).items():
+                self.torrents.setdefault(torrent_hash, {'hash': torrent_hash}).update(changes)
+            for torrent_hash in data.get('torrents_removed') or []:
+                self.torrents.pop(torrent_hash, None)
+            self.rid = data.get('rid', self.rid)
+            endpoint = 'sync/maindata'
+        else:
+            response = self.fetch(torrent_hashes)
+            endpoint = 'torrents/info'
+        self._record_poll(endpoint, len(response.content), time.process_time() - start_cpu)
+        return response.status_code == 200
+
+    def _record_poll(self, endpoint, size, cpu):
+        stats = self.poll_stats.setdefault(endpoint, {'polls': 0, 'bytes': 0, 'cpu': 0.0, 'max_bytes': 0, 'max_cpu': 0.0})
+        stats['polls'] += 1
+        stats['bytes'] += size
+        stats['cpu'] += cpu
+        stats['max_bytes'] = max(stats['max_bytes'], size)
+        stats['max_cpu'] = max(stats['max_cpu'], cpu)
+
+    def fetch(self, torrent_hashes):
+        """Full fetch of only the given torrents (or of every downloading torrent)"""
+        if torrent_hashes:
+            params = {'hashes': '|'.join(torrent_hash.lower() for torrent_hash in torrent_hashes)}
+        else:
+            params = {'filter': 'downloading'}
+        response = self.client.get("torrents/info", params=params, timeout=3)
+        if response.status_code == 200:
+            for torrent in response.json():
+                self.torrents[torrent['hash']] = torrent
+        return response
+
+    def get(self, torrent_hash):
+        return self.torrents.get(torrent_hash.lower())
+
+def get_torrent_tracker():
+    """Get the shared torrent state tracker (None if qBittorrent is unreachable)"""
+    global _torrent_tracker
+    if _torrent_tracker is None:
+        client = get_qbittorrent_client()
+        if client:
+            _torrent_tracker = TorrentStateTracker(client)
+    return _torrent_tracker
+
+def print_poll_stats():
+    """Print a summary of bytes transferred and CPU time per qBittorrent poll endpoint"""
+    if _torrent_tracker is None or not _torrent_tracker.poll_stats:
+        return
+    stats = _torrent_tracker.poll_stats
+    polls = sum(endpoint['polls'] for endpoint in stats.values())
+    print(f"\n⏱️  qBittorrent polls: {polls}")
+    for name, endpoint in stats.items():
+        print(f"  {endpoint['polls']:6} × {name}: {endpoint['bytes']:,} B ({endpoint['bytes'] // endpoint['polls']:,} avg, "
+              f"{endpoint['max_bytes']:,} max) | {endpoint['cpu'] * 1000:.2f} ms CPU "
+              f"({endpoint['cpu'] / endpoint['polls'] * 1000:.2f} avg, {endpoint['max_cpu'] * 1000:.2f} max)")
+    total_bytes = sum(endpoint['bytes'] for endpoint in stats.values())
+    total_cpu = sum(endpoint['cpu'] for endpoint in stats.values())
+    print(f"  total: {total_bytes:,} B | {total_cpu * 1000:.2f} ms CPU")
+
+# qBittorrent 5 reports stoppedDL/stoppedUP where 4.x says pausedDL/pausedUP
+DOWNLOADING_STATES = ('downloading', 'forcedDL', 'metaDL', 'stalledDL', 'queuedDL', 'pausedDL', 'stoppedDL',
+                      'checkingDL', 'checkingResumeData', 'allocating', 'moving')
+COMPLETED_STATES = ('uploading', 'stalledUP', 'queuedUP', 'pausedUP', 'stoppedUP', 'forcedUP')
+WAITING_STATES = ('stalledDL', 'queuedDL', 'pausedDL', 'stoppedDL', 'metaDL')
+MISSING_TORRENT_TIMEOUT = 120  # Give up on a hash qBittorrent never reports after 2 minutes
+
+DEFAULT_SCHEDULER_CONFIG = {
+    "max_active": 2,  # Titles downloading at once; 0 leaves everything to qBittorrent
+    "stall_timeout": 120,  # Seconds without peers before a title gives up its slot
 }
+BACKGROUND_LIMIT_START = 256 * 1024
+BACKGROUND_LIMIT_MIN = 64 * 1024
+BACKGROUND_LIMIT_STEP = 1024 * 1024  # Added per poll while the top title holds its speed
+
+class DownloadScheduler:
+    """Local priority queue over qBittorrent so the first requested titles finish first
+
+    Only `max_active` torrents run; the rest are added stopped and started as slots
+    free up. Once a second title arrives, the top title downloads sequentially with
+    first/last pieces first so it is playable early, and the other active ones get a
+    download limit that grows while the top title keeps its speed and shrinks when it
+    slows down. release() hands everything back to qBittorrent when the run ends.
+    """
+
+    def __init__(self, max_active=2, stall_timeout=120):
+        self.max_active = max_active
+        self.stall_timeout = stall_timeout
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.streaming = None
+        self.head_peak = 0
+        self.link_peak = 0  # Best combined download speed seen; the background limit never exceeds it
+        self.background_limit = BACKGROUND_LIMIT_START
+        self.legacy_api = False  # qBittorrent 4.x calls start/stop resume/pause
+        self._added = 0
+
+    @classmethod
+    def from_config(cls, max_active=None):
+        """Scheduler from the "scheduler" config entry (None when disabled)"""
+        config = dict(DEFAULT_SCHEDULER_CONFIG, **(load_config().get("scheduler") or {}))
+        if max_active is not None:
+            config["max_active"] = max_active
+        if config["max_active"] <= 0:
+            return None
+        return cls(config["max_active"], config["stall_timeout"])
+
+    def admit(self, torrent_hash, position=None):
+        """Queue a torrent about to be added; returns the extra torrents/add fields for it"""
+        torrent_hash = torrent_hash.lower()
+        with self.lock:
+            self._added += 1
+            entry = self.entries.setdefault(torrent_hash, {
+                'position': (position if position is not None else self._added, self._added),
+                'started': False, 'stalled_since': None, 'limit': 0})
+            running = [h for h, e in self.entries.items() if e['started'] and not self._stalled(e, time.monotonic())]
+            if entry['started'] or len(running) >= self.max_active:
+                return {} if entry['started'] else {'paused': 'true', 'stopped': 'true'}
+            entry['started'] = True
+            return {}
+
+    def forget(self, torrent_hash):
+        """Drop a torrent whose add failed"""
+        with self.lock:
+            self.entries.pop(torrent_hash.lower(), None)
+            if self.streaming == torrent_hash.lower():
+                self.streaming = None
+
+    def release(self, client):
+        """Undo what only made sense while we were running: start held-back torrents, lift our limits"""
+        with self.lock:
+            held = [h for h, e in self.entries.items() if not e['started']]
+            limited = [h for h, e in self.entries.items() if e['limit']]
+            self.entries.clear()
+        if held:
+            self._control(client, 'start', held)
+        if limited:
+            client.post("torrents/setDownloadLimit", data={'hashes': '|'.join(limited), 'limit': 0})
+
+    def status(self, torrent_hash):
+        """Monitor line for a torrent the scheduler is holding back (None otherwise)"""
+        entry = self.entries.get(torrent_hash.lower())
+        if entry is not None and not entry['started']:
+            return "⏳ Waiting for a download slot..."
+        return None
+
+    def _stalled(self, entry, now):
+        return entry['stalled_since'] is not None and now - entry['stalled_since'] > self.stall_timeout
+
+    def _control(self, client, action, hashes):
+        """torrents/start|stop, or resume|pause on qBittorrent 4.x"""
+        data = {'hashes': '|'.join(hashes)}
+        if not self.legacy_api:
+            response = client.post(f"torrents/{action}", data=data)
+            if response.status_code != 404:
+                return response.status_code == 200
+            self.legacy_api = True
+        legacy = {'start': 'resume', 'stop': 'pause'}[action]
+        return client.post(f"torrents/{legacy}", data=data).status_code == 200
+
+    def plan(self, tracker):
+        """Re-plan after a poll: fill free slots, demote stalled titles, move streaming and limits
+
+        Returns True if anything was changed in qBittorrent.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for torrent_hash, entry in list(self.entries.items()):
+                torrent = tracker.get(torrent_hash)
+                if torrent is None:
+                    continue
+                if torrent.get('state') in COMPLETED_STATES or torrent.get('progress', 0) >= 1.0:
+                    del self.entries[torrent_hash]
+                elif entry['started'] and torrent.get('state') in ('stalledDL', 'metaDL'):
+                    entry['stalled_since'] = entry['stalled_since'] or now
+                else:
+                    entry['stalled_since'] = None
+            # Stalled titles keep looking for peers but no longer hold a slot
+            ranked = sorted(self.entries, key=lambda h: (self._stalled(self.entries[h], now),
+                                                         self.entries[h]['position']))
+            active = [h for h in ranked if not self._stalled(self.entries[h], now)][:self.max_active]
+            start = [h for h in active if not self.entries[h]['started']]
+            stop = [h for h in ranked if self.entries[h]['started'] and h not in active
+                    and not self._stalled(self.entries[h], now)]
+            head = active[0] if active else None
+        if self.streaming is not None and self.streaming not in self.entries:
+            self.streaming = None
+
+        client = tracker.client
+        changed = False
+        if stop and self._control(client, 'stop', stop):
+            changed = True
+            for torrent_hash in stop:
+                self.entries.get(torrent_hash, {})['started'] = False
+        if start and self._control(client, 'start', start):
+            changed = True
+            for torrent_hash in start:
+                self.entries.get(torrent_hash, {})['started'] = True
+        # Mirror our order in qBittorrent's queue; positions are all 0 when its queueing is off
+        known = [h for h in ranked if tracker.get(h)]
+        if sorted(known, key=lambda h: tracker.get(h).get('priority', 0)) != known:
+            for torrent_hash in reversed(known):
+                client.post("torrents/topPrio", data={'hashes': torrent_hash})
+            changed = True
+        # A lone title keeps qBittorrent's defaults; streaming order only pays off in a batch
+        if head is not None and head != self.streaming and self._added > 1:
+            changed = self._stream(client, tracker, head) or changed
+        if head in self.entries:
+            changed = self._limit(client, tracker, head, [h for h in active[1:] if h in self.entries]) or changed
+        return changed
+
+    def _stream(self, client, tracker, head):
+        """Hand sequential download and first/last-piece priority to the new top title"""
+        torrent = tracker.get(head)
+        if torrent is None:
+            return False
+        previous = tracker.get(self.streaming) if self.streaming else None
+        if previous is not None:
+            # Back to rarest-first for a title that lost the top spot
+            if previous.get('seq_dl'):
+                client.post("torrents/toggleSequentialDownload", data={'hashes': self.streaming})
+            if previous.get('f_l_piece_prio'):
+                client.post("torrents/toggleFirstLastPiecePrio", data={'hashes': self.streaming})
+        if not torrent.get('seq_dl'):
+            client.post("torrents/toggleSequentialDownload", data={'hashes': head})
+        if not torrent.get('f_l_piece_prio'):
+            client.post("torrents/toggleFirstLastPiecePrio", data={'hashes': head})
+        self.streaming = head
+        self.head_peak = 0
+        return True
+
+    def _limit(self, client, tracker, head, background):
+        """Top title unlimited; the others share what it leaves (additive increase, multiplicative decrease)"""
+        changed = False
+        if self.entries[head]['limit'] != 0:
+            client.post("torrents/setDownloadLimit", data={'hashes': head, 'limit': 0})
+            self.entries[head]['limit'] = 0
+            changed = True
+        speed = (tracker.get(head) or {}).get('dlspeed', 0)
+        link = speed + sum((tracker.get(h) or {}).get('dlspeed', 0) for h in background)
+        self.link_peak = max(link, self.link_peak * 0.95)
+        # Nothing to measure against until the top title has actually downloaded something
+        if self.head_peak and speed >= 0.9 * self.head_peak:
+            self.background_limit += BACKGROUND_LIMIT_STEP
+        elif speed < 0.75 * self.head_peak:
+            self.background_limit = int(self.background_limit * 0.7)
+        cap = max(int(self.link_peak), BACKGROUND_LIMIT_START)
+        self.background_limit = max(min(self.background_limit, cap), BACKGROUND_LIMIT_MIN)
+        self.head_peak = max(speed, self.head_peak * 0.95)
+        stale = [h for h in background if self.entries[h]['limit'] != self.background_limit]
+        if stale:
+            client.post("torrents/setDownloadLimit", data={'hashes': '|'.join(stale), 'limit': self.background_limit})
+            for torrent_hash in stale:
+                self.entries[torrent_hash]['limit'] = self.background_limit
+            changed = True
+        return changed
+
+def format_eta(eta):
+    """Format an ETA in seconds as '1h 5m' / '4m 10s' / '30s'"""
+    # qBittorrent reports 8640000 (100 days) for "infinite"
+    if eta <= 0 or eta >= 8640000:
+        return "Unknown"
+    hours = eta // 3600
+    minutes = (eta % 3600) // 60
+    seconds = eta % 60
+    if hours > 0:
+        return f"{hours}h {minutes}m"
+    elif minutes > 0:
+        return f"{minutes}m {seconds}s"
+    return f"{seconds}s"
+
+def format_speed(speed):
+    """Format a transfer speed in bytes per second"""
+    if speed > 1024*1024:
+        return f"{speed/(1024*1024):.1f} MB/s"
+    elif speed > 1024:
+        return f"{speed/1024:.1f} KB/s"
+    return f"{speed} B/s"
+
+def format_torrent_status(torrent):
+    """One status line for a torrent, as shown by the download monitor"""
+    state = torrent.get('state', 'unknown')
+    progress = torrent.get('progress', 0)
+    if state in COMPLETED_STATES or progress >= 1.0:
+        return "✅ Download completed!"
+    elif state == 'downloading':
+        bar_length = 40
+        filled_length = int(bar_length * progress)
+        bar = '█' * filled_length + '░' * (bar_length - filled_length)
+        speed_str = format_speed(torrent.get('dlspeed', 0))
+        eta_str = format_eta(torrent.get('eta', 0))
+        return f"📊 [{bar}] {int(progress * 100)}% | {speed_str} | ETA: {eta_str}"
+    elif state == 'queuedDL':
+        return "⏳ Queued for download..."
+    elif state in ('stalledDL', 'metaDL'):
+        return "🔍 Finding peers..."
+    elif state in ('pausedDL', 'stoppedDL'):
+        return "⏸️  Download paused"
+    elif state == 'checkingResumeData':
+        return "🔄 Checking files..."
+    return f"📊 Status: {state}"
+
+class DownloadMonitor:
+    """Follow any number of torrents from a single polling loop"""
+
+    def __init__(self, on_complete=None, scheduler=None):
+        self.watched = {}
+        self.results = {}
+        # Optional DownloadScheduler, re-planned after every poll
+        self.scheduler = scheduler
+        # Coroutine function run (in the background) for every completed torrent
+        self.on_complete = on_complete
+        self.completions = []
+        self.interactive = sys.stdout.isatty()
+        self._rows_drawn = 0
+
+    def add(self, torrent_hash, label=None):
+        """Start following a torrent hash"""
+        torrent_hash = torrent_hash.lower()
+        if torrent_hash not in self.watched and torrent_hash not in self.results:
+            self.watched[torrent_hash] = {'label': label, 'added': time.monotonic(), 'line': None}
+
+    def next_interval(self, tracker):
+        """Poll fast near completion, slowly while everything is stalled or queued"""
+        intervals = []
+        for torrent_hash in self.watched:
+            torrent = tracker.get(torrent_hash)
+            if not torrent:
+                intervals.append(2)
+            elif torrent.get('state') in WAITING_STATES:
+                intervals.append(10)
+            elif torrent.get('state') == 'downloading' and 0 < torrent.get('eta', 0) < 8640000:
+                intervals.append(min(max(torrent['eta'] / 20, 1), 5))
+            else:
+                intervals.append(3)
+        return min(intervals, default=3)
+
+    def _update(self, tracker):
+        """Record finished and missing torrents; return True if any row changed"""
+        changed = False
+        for torrent_hash, watch in list(self.watched.items()):
+            torrent = tracker.get(torrent_hash)
+            if not torrent:
+                if time.monotonic() - watch['added'] > MISSING_TORRENT_TIMEOUT:
+                    self._finish(torrent_hash, False, "⚠️  Could not find download in qBittorrent")
+                    changed = True
+                continue
+            watch['label'] = torrent.get('name') or watch['label']
+            line = (self.scheduler is not None and self.scheduler.status(torrent_hash)) or format_torrent_status(torrent)
+            changed = changed or line != watch['line']
+            watch['line'] = line
+            if torrent.get('state') in COMPLETED_STATES or torrent.get('progress', 0) >= 1.0:
+                self._finish(torrent_hash, True, line)
+        return changed
+
+    def _finish(self, torrent_hash, success, line):
+        watch = self.watched.pop(torrent_hash)
+        watch['line'] = line
+        self.results[torrent_hash] = success
+        # Finished rows are printed once, above the live display
+        self._clear()
+        print(f"🎬 {watch['label'] or torrent_hash}")
+        print(f"   {line}")
+        if success and self.on_complete is not None:
+            self.completions.append(asyncio.ensure_future(self.on_complete(torrent_hash)))
+
+    def _clear(self):
+        if self.interactive and self._rows_drawn:
+            print(f"\x1b[{self._rows_drawn}F\x1b[J", end='')
+        self._rows_drawn = 0
+
+    def render(self):
+        """Draw one consolidated row per followed torrent"""
+        self._clear()
+        for torrent_hash, watch in self.watched.items():
+            label = (watch['label'] or torrent_hash)[:60]
+            print(f"🎬 {label:<60} {watch['line'] or '🔍 Looking for download...'}")
+        if self.interactive:
+            self._rows_drawn = len(self.watched)
+
+    async def run(self, until=None):
+        """Poll until every followed torrent has completed or gone missing (and `until` is done)"""
+        while self.watched or (until is not None and not until.done()):
+            if not self.watched:
+                # Nothing to follow yet; wait for the batch to add something
+                await asyncio.wait([until], timeout=0.5)
+                continue
+            tracker = await asyncio.to_thread(get_torrent_tracker)
+            if tracker is None:
+                for torrent_hash in list(self.watched):
+                    self._finish(torrent_hash, False, "⚠️  Could not connect to qBittorrent")
+                # Titles still being looked up may reach qBittorrent again (or fall back to the watch folder)
+                continue
+            try:
+                with metrics.span("monitor.poll", torrents=len(self.watched)):
+                    await asyncio.to_thread(tracker.poll, list(self.watched))
+                replanned = False
+                if self.scheduler is not None:
+                    with metrics.span("scheduler.plan"):
+                        replanned = await asyncio.to_thread(self.scheduler.plan, tracker)
+                # Don't draw over a menu another title is showing
+                if not get_prompt_lock().locked() and (self._update(tracker) or self.interactive):
+                    self.render()
+            except Exception:
+                replanned = False
+            # Look again soon after starting or stopping torrents
+            await asyncio.sleep(1 if replanned else self.next_interval(tracker))
+        if self.completions:
+            await asyncio.gather(*self.completions, return_exceptions=True)
+        return self.results
+
+def release_scheduler(scheduler):
+    """Hand the scheduler's torrents back to qBittorrent, reporting (not raising) failures"""
+    try:
+        client = get_qbittorrent_client()
+        if client is not None:
+            scheduler.release(client)
+            return
+    except Exception:
+        pass
+    print("⚠️  Could not restart held-back downloads; start them from qBittorrent")
+
+async def monitor_qbittorrent_download(torrent_hash):
+    """Monitor qBittorrent download progress with real-time updates"""
+    monitor = DownloadMonitor(on_complete=get_completion_hook())
+    monitor.add(torrent_hash)
+    results = await monitor.run()
+    return results.get(torrent_hash.lower(), False)
+
+async def monitor_active_downloads():
+    """Attach the download monitor to every torrent qBittorrent is still downloading"""
+    tracker = get_torrent_tracker()
+    if tracker is None:
+        print("❌ Could not connect to qBittorrent Web UI")
+        return {}
+    await asyncio.to_thread(tracker.poll)
+    if not tracker.torrents:
+        await asyncio.to_thread(tracker.fetch, [])
+    monitor = DownloadMonitor(on_complete=get_completion_hook())
+    for torrent_hash, torrent in tracker.torrents.items():
+        if torrent.get('state') in DOWNLOADING_STATES and torrent.get('progress', 0) < 1.0:
+            monitor.add(torrent_hash, torrent.get('name'))
+    if not monitor.watched:
+        print("No active downloads in qBittorrent")
+        return {}
+    print(f"👀 Monitoring {len(monitor.watched)} download(s)")
+    return await monitor.run()
+
+def get_library_config():
+    """Library placement settings, with the library dir expanded (None when not configured)"""
+    library = dict(DEFAULT_LIBRARY_CONFIG, **(load_config().get("library") or {}))
+    if library["dir"]:
+        library["dir"] = os.path.normpath(os.path.expanduser(library["dir"]))
+    return library
+
+def library_folder_name(torrent_name):
+    """'Inception (2010) [1080p] [BluRay] [YTS.MX]' -> ('Inception (2010)', '1080p')"""
+    match = re.match(r"(.*?\(\d{4}\))", torrent_name)
+    folder = match.group(1) if match else re.sub(r"\s*\[[^]]*\]", '', torrent_name)
+    folder = "".join(c for c in folder if c not in '/\\:*?"<>|').strip() or torrent_name
+    resolution = re.search(r"\b(\d{3,4}p)\b", torrent_name)
+    return folder, resolution.group(1) if resolution else None
+
+def data_segments(fd, size):
+    """(offset, length) of the data regions of a file, skipping holes (one region if unsupported)"""
+    offset = 0
+    while offset < size:
+        try:
+            start = os.lseek(fd, offset, os.SEEK_DATA)
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                return  # Only a hole is left
+            yield offset, size - offset
+            return
+        yield start, end - start
+        offset = end
+
+def copy_file_fast(source, destination):
+    """Copy a file without a userspace read/write loop; returns the method used
+
+    Tries a reflink (shared extents), then copy_file_range (in-kernel, may offload
+    to the filesystem), then sendfile. Holes in sparse files are skipped, not written.
+    """
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+            return 'reflink'
+        except OSError:
+            pass
+        size = os.fstat(src.fileno()).st_size
+        method = 'copy_file_range'
+        for offset, length in data_segments(src.fileno(), size):
+            end = offset + length
+            while offset < end:
+                try:
+                    if method == 'copy_file_range':
+                        copied = os.copy_file_range(src.fileno(), dst.fileno(), end - offset, offset, offset)
+                    else:
+                        dst.seek(offset)
+                        copied = os.sendfile(dst.fileno(), src.fileno(), offset, end - offset)
+                except OSError as e:
+                    if method == 'copy_file_range' and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                                                    errno.EOPNOTSUPP):
+                        # Not supported for this pair of files: continue with sendfile
+                        method = 'sendfile'
+                        continue
+                    raise
+                if copied == 0:
+                    break
+                offset += copied
+        dst.truncate(size)
+        return method
+
+def place_file(source, destination):
+    """Put source at destination without copying data where possible; returns the method used"""
+    os.makedirs(os.path.dirname(destination), exist_ok=True)
+    if os.path.exists(destination):
+        return 'existing'
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError:
+        pass
+    partial = destination + '.part'
+    try:
+        method = copy_file_fast(source, partial)
+        os.replace(partial, destination)
+    finally:
+        if os.path.exists(partial):
+            os.remove(partial)
+    return method
+
+def library_files(client, torrent_hash):
+    """(torrent info, [absolute paths of the torrent's video and subtitle files])"""
+    info = client.get("torrents/info", params={'hashes': torrent_hash}).json()
+    if not info:
+        raise RuntimeError("torrent is no longer in qBittorrent")
+    torrent = info[0]
+    files = client.get("torrents/files", params={'hash': torrent_hash}).json()
+    paths = [os.path.join(torrent['save_path'], f['name']) for f in files
+             if f['name'].lower().endswith(LIBRARY_EXTENSIONS) and f.get('progress', 1) >= 1]
+    return torrent, paths
+
+def link_into_library(torrent, paths, library_dir):
+    """Hardlink (or copy) files into '<library>/Title (Year)/'; the torrent keeps seeding from its own path"""
+    folder, resolution = library_folder_name(torrent['name'])
+    target_dir = os.path.join(library_dir, folder)
+    videos = [path for path in paths if not path.lower().endswith(('.srt', '.sub', '.ass'))]
+    main_video = max(videos, key=os.path.getsize) if videos else None
+    stem = f"{folder} - {resolution}" if resolution else folder
+    methods = collections.Counter()
+    for path in paths:
+        name, ext = os.path.splitext(os.path.basename(path))
+        if path == main_video:
+            destination = os.path.join(target_dir, stem + ext)
+        elif path in videos:
+            destination = os.path.join(target_dir, f"{stem} - {name}{ext}")
+        else:
+            destination = os.path.join(target_dir, f"{stem}.{name}{ext}")
+        methods[place_file(path, destination)] += 1
+    return target_dir, methods
+
+def move_into_library(client, torrent, library_dir):
+    """Let qBittorrent move the torrent into '<library>/Title (Year)/' so it keeps seeding from there
+
+    On one filesystem qBittorrent renames the files; across filesystems it copies them.
+    """
+    folder, _ = library_folder_name(torrent['name'])
+    target_dir = os.path.join(library_dir, folder)
+    os.makedirs(target_dir, exist_ok=True)
+    response = client.post("torrents/setLocation", data={'hashes': torrent['hash'], 'location': target_dir})
+    if response.status_code != 200:
+        raise RuntimeError(f"setLocation failed ({response.status_code} {response.text.strip()})")
+    deadline = time.monotonic() + LIBRARY_MOVE_TIMEOUT
+    while time.monotonic() < deadline:
+        info = client.get("torrents/info", params={'hashes': torrent['hash']}).json()
+        if info and info[0].get('state') != 'moving' and os.path.normpath(info[0]['save_path']) == target_dir:
+            return target_dir, collections.Counter({'setLocation': 1})
+        time.sleep(0.5)
+    raise RuntimeError("qBittorrent did not finish moving the files in time")
+
+def notify_jellyfin(paths, library):
+    """Tell Jellyfin exactly which paths changed instead of waiting for a full library scan"""
+    if not (library["jellyfin_url"] and library["jellyfin_api_key"]):
+        return False
+    if library["jellyfin_path"]:
+        paths = [library["jellyfin_path"].rstrip('/') + path[len(library["dir"].rstrip('/')):] for path in paths]
+    response = requests.post(f"{library['jellyfin_url'].rstrip('/')}/Library/Media/Updated",
+                             json={"Updates": [{"Path": path, "UpdateType": "Created"} for path in paths]},
+                             headers={"X-Emby-Token": library["jellyfin_api_key"]}, timeout=5)
+    return response.status_code in (200, 204)
+
+def add_to_library(torrent_hash):
+    """Place a completed torrent's files in the library and refresh just that folder in Jellyfin"""
+    library = get_library_config()
+    client = get_qbittorrent_client()
+    if not library["dir"] or client is None:
+        return False
+    torrent, paths = library_files(client, torrent_hash)
+    if not paths:
+        print(f"⚠️  Library: no video files in '{torrent['name']}'")
+        return False
+    start = time.perf_counter()
+    if library["mode"] == "move":
+        target_dir, methods = move_into_library(client, torrent, library["dir"])
+    else:
+        target_dir, methods = link_into_library(torrent, paths, library["dir"])
+    how = ", ".join(f"{count} {method}" for method, count in methods.items())
+    print(f"📚 Added to library: {target_dir} ({how}, {time.perf_counter() - start:.1f}s)")
+    try:
+        if notify_jellyfin([target_dir], library):
+            print("📚 Jellyfin refresh requested")
+    except requests.RequestException as e:
+        print(f"⚠️  Jellyfin refresh failed: {e}")
+    return True
+
+async def place_in_library(torrent_hash):
+    """DownloadMonitor completion hook for the library stage"""
+    try:
+        with metrics.span("library.place", hash=torrent_hash):
+            return await asyncio.to_thread(add_to_library, torrent_hash)
+    except Exception as e:
+        print(f"⚠️  Library: {e}")
+        return False
+
+def get_completion_hook():
+    """The monitor's completion hook: the library stage when a library dir is configured"""
+    return place_in_library if get_library_config()["dir"] else None
+
+def owned_title_key(name):
+    """'Inception (2010) [1080p]' or 'Inception.2010.1080p.BluRay.mp4' -> 'inception 2010' (None without a year)"""
+    match = (re.match(r"(.+?)\s*\(((?:19|20)\d{2})\)", name)
+             or re.match(r"(.+)[\s._\[(-]((?:19|20)\d{2})(?:[\s._\])-]|$)", name))
+    if not match:
+        return None
+    return f"{normalize_title(match.group(1))} {match.group(2)}"
+
+def movie_title_key(movie):
+    return f"{normalize_title(movie['title'])} {movie['year']}"
+
+class OwnedIndex:
+    """Titles we already have: qBittorrent's torrents plus video files under the download and library dirs
+
+    Persisted in SQLite. Rescans only list directories whose mtime changed; unchanged
+    ones are stat'ed once and their files and subdirectories come from the index.
+    """
+
+    def __init__(self, path=OWNED_INDEX_FILE):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs (parent);
+            CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, dir TEXT NOT NULL, key TEXT);
+            CREATE INDEX IF NOT EXISTS files_dir ON files (dir);
+            CREATE INDEX IF NOT EXISTS files_key ON files (key);
+            CREATE TABLE IF NOT EXISTS torrents (hash TEXT PRIMARY KEY, key TEXT, name TEXT, state TEXT, path TEXT);
+            CREATE INDEX IF NOT EXISTS torrents_key ON torrents (key);
+        """)
+        self._refresh = None
+        self._claimed = {}
+
+    def scan(self, roots):
+        """Bring the file index up to date; returns (directories listed, directories checked)"""
+        listed = checked = 0
+        seen = set()
+        stack = [os.path.normpath(root) for root in roots if root and os.path.isdir(root)]
+        with self.lock, self.db:
+            known, children = {}, {}
+            for path, parent, mtime in self.db.execute("SELECT path, parent, mtime FROM dirs"):
+                known[path] = mtime
+                children.setdefault(parent, []).append(path)
+            while stack:
+                path = stack.pop()
+                if path in seen:
+                    continue
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    continue
+                seen.add(path)
+                checked += 1
+                if known.get(path) == mtime:
+                    # Nothing was added or removed here; only subdirectories can have changed
+                    stack.extend(children.get(path, ()))
+                    continue
+                listed += 1
+                subdirs, files = [], []
+                try:
+                    with os.scandir(path) as entries:
+                        for entry in entries:
+                            if entry.is_dir(follow_symlinks=False):
+                                subdirs.append(entry.path)
+                            elif entry.name.lower().endswith(VIDEO_EXTENSIONS):
+                                key = owned_title_key(entry.name) or owned_title_key(os.path.basename(path))
+                                files.append((entry.path, path, key))
+                except OSError:
+                    continue
+                self.db.execute("DELETE FROM files WHERE dir = ?", (path,))
+                self.db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?)", files)
+                self.db.execute("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                                (path, os.path.dirname(path), mtime))
+                stack.extend(subdirs)
+            # Forget directories that were deleted or are no longer under a root
+            gone = [(path,) for path in known if path not in seen]
+            self.db.executemany("DELETE FROM dirs WHERE path = ?", gone)
+            self.db.executemany("DELETE FROM files WHERE dir = ?", gone)
+        return listed, checked
+
+    def sync_torrents(self, torrents):
+        """Replace the torrent part of the index with qBittorrent's current list"""
+        rows = []
+        for torrent_hash, torrent in torrents.items():
+            done = torrent.get('progress', 0) >= 1.0 or torrent.get('state') in COMPLETED_STATES
+            rows.append((torrent_hash.lower(), owned_title_key(torrent.get('name') or ''), torrent.get('name'),
+                         'complete' if done else 'downloading', torrent.get('content_path') or torrent.get('save_path')))
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM torrents")
+            self.db.executemany("INSERT OR REPLACE INTO torrents VALUES (?, ?, ?, ?, ?)", rows)
+
+    def refresh(self):
+        """Rescan the download and library dirs and reload qBittorrent's torrents"""
+        roots = [load_config().get("download_dir", DEFAULT_DOWNLOAD_DIR), get_library_config()["dir"],
+                 *load_config().get("owned_dirs", [])]
+        listed, checked = self.scan(roots)
+        tracker = get_torrent_tracker()
+        if tracker is not None:
+            try:
+                tracker.poll()
+                self.sync_torrents(tracker.torrents)
+            except requests.RequestException:
+                pass
+        return listed, checked
+
+    def start_refresh(self):
+        """Refresh in a worker thread (once per run) so it overlaps the first searches"""
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(asyncio.to_thread(self.refresh))
+        return self._refresh
+
+    def lookup(self, torrent_hash, key=None):
+        """(state, location, hash) if we have this torrent or title: state is 'downloading', 'complete' or 'file'"""
+        with self.lock:
+            row = self.db.execute("SELECT state, path, hash FROM torrents WHERE hash = ?",
+                                  (torrent_hash.lower(),)).fetchone()
+            if row is None and key:
+                row = (self.db.execute("SELECT state, path, hash FROM torrents WHERE key = ?", (key,)).fetchone()
+                       or self.db.execute("SELECT 'file', path, NULL FROM files WHERE key = ?", (key,)).fetchone())
+            if row is None:
+                # Another title of this batch may be adding it right now
+                claim = self._claimed.get(torrent_hash.lower()) or (key and self._claimed.get(key))
+                if claim:
+                    return claim
+                self._claimed[torrent_hash.lower()] = ('downloading', 'added earlier in this batch', torrent_hash)
+                if key:
+                    self._claimed[key] = self._claimed[torrent_hash.lower()]
+            return row
+
+    async def find(self, torrent_hash, movie=None):
+        """Look a torrent or movie up once the index has been refreshed"""
+        try:
+            await asyncio.shield(self.start_refresh())
+        except Exception:
+            pass  # A failed refresh still leaves the last persisted index
+        return await asyncio.to_thread(self.lookup, torrent_hash, movie_title_key(movie) if movie else None)
+
+    def stats(self):
+        with self.lock:
+            files = self.db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            dirs = self.db.execute("SELECT COUNT(*) FROM dirs").fetchone()[0]
+            torrents = self.db.execute("SELECT COUNT(*) FROM torrents").fetchone()[0]
+        return {"files": files, "dirs": dirs, "torrents": torrents}
+
+    def close(self):
+        self.db.close()
+
+def _bdecode(data, i=0):
+    """Decode one bencoded value at offset i; returns (value, end offset)"""
+    kind = data[i:i+1]
+    if kind == b'i':
+        end = data.index(b'e', i)
+        return int(data[i+1:end]), end + 1
+    if kind == b'l':
+        i += 1
+        items = []
+        while data[i:i+1] != b'e':
+            item, i = _bdecode(data, i)
+            items.append(item)
+        return items, i + 1
+    if kind == b'd':
+        i += 1
+        items = {}
+        while data[i:i+1] != b'e':
+            key, i = _bdecode(data, i)
+            items[key], i = _bdecode(data, i)
+        return items, i + 1
+    if kind.isdigit():
+        colon = data.index(b':', i)
+        start = colon + 1
+        end = start + int(data[i:colon])
+        if end > len(data):
+            raise ValueError("truncated bencoded string")
+        return data[start:end], end
+    raise ValueError(f"invalid bencoded data at offset {i}")
+
+def torrent_infohash(data):
+    """SHA-1 infohash (hex) of the bencoded info dictionary of a .torrent file"""
+    if data[:1] != b'd':
+        raise ValueError("not a torrent file")
+    i = 1
+    while data[i:i+1] != b'e':
+        key, i = _bdecode(data, i)
+        start = i
+        _, i = _bdecode(data, i)
+        if key == b'info':
+            return hashlib.sha1(data[start:i]).hexdigest()
+    raise ValueError("torrent file has no info dictionary")
+
+def fetch_torrent_file(torrent_hash):
+    """Download a .torrent into the content-addressed cache and verify its infohash; returns its path or None"""
+    torrent_hash = torrent_hash.lower()
+    torrent_path = TORRENT_CACHE_DIR / f"{torrent_hash}.torrent"
+    if torrent_path.exists():
+        return torrent_path
+
+    TORRENT_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = f"/torrent/download/{torrent_hash.upper()}"
+    fd, temp_path = tempfile.mkstemp(dir=TORRENT_CACHE_DIR, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as f, get_mirror_fetcher().get(path, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                f.write(chunk)
+        with open(temp_path, 'rb') as f:
+            infohash = torrent_infohash(f.read())
+        if infohash != torrent_hash:
+            print(f"⚠️  Torrent file infohash mismatch ({infohash[:8]} != {torrent_hash[:8]})")
+            return None
+        os.replace(temp_path, torrent_path)
+        return torrent_path
+    except (requests.RequestException, ValueError):
+        return None
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+UDP_TRACKER_PROTOCOL_ID = 0x41727101980  # BEP 15 magic constant
+
+class _UdpTrackerConnect(asyncio.DatagramProtocol):
+    """Complete the BEP 15 connect handshake with a UDP tracker"""
+
+    def __init__(self, transaction_id, answered):
+        self.transaction_id = transaction_id
+        self.answered = answered
+
+    def datagram_received(self, data, addr):
+        if len(data) >= 16 and not self.answered.done():
+            action, transaction_id = struct.unpack_from('>II', data)
+            if action == 0 and transaction_id == self.transaction_id:
+                self.answered.set_result(True)
+
+    def error_received(self, exc):
+        if not self.answered.done():
+            self.answered.set_exception(exc)
+
+async def probe_udp_tracker(url):
+    """Round-trip time of a BEP 15 connect request"""
+    parsed = urlparse(url)
+    loop = asyncio.get_running_loop()
+    answered = loop.create_future()
+    transaction_id = random.getrandbits(32)
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: _UdpTrackerConnect(transaction_id, answered), remote_addr=(parsed.hostname, parsed.port or 80))
+    try:
+        start = time.perf_counter()
+        transport.sendto(struct.pack('>QII', UDP_TRACKER_PROTOCOL_ID, 0, transaction_id))
+        await answered
+        return time.perf_counter() - start
+    finally:
+        transport.close()
+
+def probe_http_tracker(url, timeout):
+    """Round-trip time of an HTTP announce (any bencoded answer counts as alive)"""
+    params = {
+        'info_hash': bytes(20),
+        'peer_id': b'-YT0001-' + os.urandom(6).hex().encode(),
+        'port': 6881, 'uploaded': 0, 'downloaded': 0, 'left': 0, 'compact': 1, 'numwant': 0
+    }
+    start = time.perf_counter()
+    response = requests.get(url, params=params, timeout=timeout, headers={'User-Agent': USER_AGENT})
+    if response.status_code != 200 or response.content[:1] != b'd':
+        raise ValueError(f"unexpected tracker response ({response.status_code})")
+    return time.perf_counter() - start
+
+async def probe_tracker(url, timeout=TRACKER_PROBE_TIMEOUT):
+    """Latency of a tracker in seconds, or None if it didn't answer"""
+    try:
+        if url.startswith('udp://'):
+            return await asyncio.wait_for(probe_udp_tracker(url), timeout)
+        return await asyncio.to_thread(probe_http_tracker, url, timeout)
+    except Exception:
+        return None
+
+_tracker_probe = None  # Probe round in flight; titles that find the same trackers stale wait on it
+
+async def _probe_trackers(urls):
+    """Probe trackers concurrently and store the results; returns the updated health table"""
+    now = time.time()
+    latencies = await asyncio.gather(*(probe_tracker(url) for url in urls))
+    health = load_state().get("tracker_health") or {}
+    for url, latency in zip(urls, latencies):
+        entry = health.get(url, {'success': 0.5})
+        entry['success'] = 0.5 * (latency is not None) + 0.5 * entry['success']
+        entry['latency'] = latency
+        entry['checked_at'] = now
+        health[url] = entry
+    update_state("tracker_health", health)
+    return health
+
+async def best_trackers(count=MAGNET_TRACKER_COUNT, refresh=False):
+    """Fastest healthy trackers, probing (concurrently) any whose health is unknown or expired
+
+    Concurrent callers share one probe round rather than each probing the same trackers.
+    """
+    global _tracker_probe
+    candidates = load_config().get("trackers") or TRACKER_CANDIDATES
+    health = load_state().get("tracker_health") or {}
+    # With refresh, only results from probes started after this call count as fresh
+    fresh_after = time.time() if refresh else time.time() - TRACKER_HEALTH_TTL
+    stale = [url for url in candidates if health.get(url, {}).get('checked_at', 0) < fresh_after]
+    while stale:
+        if (_tracker_probe is None or _tracker_probe.done()
+                or _tracker_probe.get_loop() is not asyncio.get_running_loop()):
+            _tracker_probe = asyncio.ensure_future(_probe_trackers(stale))
+        # Shielded: a cancelled title doesn't cancel the probe the others are waiting on
+        health = await asyncio.shield(_tracker_probe)
+        # The round joined may have been started for other trackers (or before a forced refresh)
+        stale = [url for url in candidates if health.get(url, {}).get('checked_at', 0) < fresh_after]
+
+    def score(url):
+        # Prefer fast trackers, penalising ones that often fail to answer
+        return health[url]['latency'] / max(health[url]['success'], 0.1)
+    healthy = sorted((url for url in candidates if health.get(url, {}).get('latency') is not None), key=score)
+    # If nothing answered (e.g. UDP is blocked here) the client may still reach them
+    return healthy[:count] or candidates[:count]
+
+def build_magnet(torrent_hash, name, trackers):
+    """Magnet link for an infohash with the given trackers"""
+    magnet = f"magnet:?xt=urn:btih:{torrent_hash}&dn={quote_plus(name)}"
+    return magnet + ''.join(f"&tr={quote(tracker, safe='')}" for tracker in trackers)
+
+def add_trackers(client, torrent_hash, trackers):
+    """Push trackers to a torrent qBittorrent already has"""
+    response = client.post("torrents/addTrackers", data={'hash': torrent_hash.lower(), 'urls': '\n'.join(trackers)})
+    return response.status_code == 200
+
+async def refresh_trackers():
+    """Re-probe trackers and add the best ones to every torrent still downloading"""
+    trackers = await best_trackers(refresh=True)
+    health = load_state().get("tracker_health") or {}
+    print("📡 Tracker ranking:")
+    for url in trackers:
+        print(f"  {health.get(url, {}).get('latency') or 0:6.3f}s  {url}")
+    tracker = await asyncio.to_thread(get_torrent_tracker)
+    if tracker is None:
+        print("❌ Could not connect to qBittorrent Web UI")
+        return False
+    await asyncio.to_thread(tracker.poll)
+    downloading = [torrent_hash for torrent_hash, torrent in tracker.torrents.items()
+                   if torrent.get('state') in DOWNLOADING_STATES and torrent.get('progress', 0) < 1.0]
+    for torrent_hash in downloading:
+        await asyncio.to_thread(add_trackers, tracker.client, torrent_hash, trackers)
+    print(f"✅ Updated trackers on {len(downloading)} torrent(s)")
+    return True
+
+def scan_library():
+    """Bring the owned index up to date and report what it knows about"""
+    owned = OwnedIndex()
+    try:
+        start = time.perf_counter()
+        listed, checked = owned.refresh()
+        stats = owned.stats()
+    finally:
+        owned.close()
+    print(f"📚 Indexed {stats['files']} video file(s) in {stats['dirs']} folder(s) and {stats['torrents']} torrent(s)")
+    print(f"   Listed {listed} of {checked} folder(s) in {time.perf_counter() - start:.2f}s ({OWNED_INDEX_FILE})")
+    return True
+
+async def add_torrent_to_qbittorrent_clean(magnet_link, torrent_hash, monitor=None, trackers=None,
+                                           movie=None, owned=None):
+    """Add torrent to qBittorrent via Web API with clean UI (skipped if the owned index already has it)"""
+    if owned is not None:
+        found = await owned.find(torrent_hash, movie)
+        if found:
+            state, location, owned_hash = found
+            if state == 'downloading':
+                print(f"⏬ Already downloading: {location}")
+                if monitor is not None and owned_hash:
+                    monitor.add(owned_hash)
+            else:
+                print(f"✅ Already have it: {location}")
+            return True
+    scheduler = monitor.scheduler if monitor is not None else None
+    added = False
+    try:
+        with metrics.span("qbt.connect"):
+            client = await asyncio.to_thread(get_qbittorrent_client)
+        if not client:
+            return False
+        
+        add_data = {
+            'autoTMM': 'false',
+            'savepath': await asyncio.to_thread(get_download_dir)
+        }
+        if scheduler is not None:
+            add_data.update(scheduler.admit(torrent_hash, _batch_position.get()))
+        
+        # Upload the .torrent itself so qBittorrent can skip the metadata phase;
+        # fall back to the magnet link if it can't be fetched or verified
+        with metrics.span("torrent.fetch", hash=torrent_hash):
+            torrent_path = await asyncio.to_thread(fetch_torrent_file, torrent_hash)
+        add_response = None
+        if torrent_path:
+            with open(torrent_path, 'rb') as f:
+                files = {'torrents': (torrent_path.name, f.read(), 'application/x-bittorrent')}
+            with metrics.span("qbt.add", kind="torrent"):
+                add_response = await asyncio.to_thread(client.post, "torrents/add", data=add_data, files=files)
+        if add_response is None or add_response.status_code != 200:
+            with metrics.span("qbt.add", kind="magnet"):
+                add_response = await asyncio.to_thread(client.post, "torrents/add",
+                                                       data=dict(add_data, urls=magnet_link))
+        
+        if add_response.status_code != 200:
+            return False
+        added = True
+        print("✅ Added to qBittorrent")
+        if trackers:
+            # Also give .torrent uploads the fastest currently healthy trackers (best effort:
+            # the torrent is in qBittorrent either way)
+            with metrics.span("qbt.add_trackers"), contextlib.suppress(Exception):
+                await asyncio.to_thread(add_trackers, client, torrent_hash, trackers)
+        # Monitor download progress (in the background when part of a batch)
+        if monitor is not None:
+            monitor.add(torrent_hash)
+        else:
+            await monitor_qbittorrent_download(torrent_hash)
+        return True
+            
+    except Exception:
+        # Cancellation (Ctrl-C) propagates instead of triggering the watch-folder fallback
+        return added
+    finally:
+        if scheduler is not None and not added:
+            scheduler.forget(torrent_hash)
+
+def get_yts_base_url():
+    """Get the YTS site base URL (overridable in config for mirrors or local fixtures)"""
+    return load_config().get("yts_base_url", YTS_BASE_URL).rstrip('/')
+
+def _close_response(future):
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+class MirrorFetcher:
+    """Fetch YTS pages from the fastest healthy mirror, hedging slow requests on a second mirror"""
+
+    def __init__(self, mirrors, timeout=30, hedge_percentile=0.9):
+        self.mirrors = [mirror.rstrip('/') for mirror in mirrors]
+        self.timeout = timeout
+        self.hedge_percentile = hedge_percentile
+        self.health = {mirror: {'latency': None, 'errors': 0.0, 'failures': 0, 'open_until': 0}
+                       for mirror in self.mirrors}
+        self.latencies = collections.deque(maxlen=200)
+        self.hedges = 0
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=32)
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=len(self.mirrors), pool_maxsize=16)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = USER_AGENT
+
+    def ranked_mirrors(self):
+        """Mirrors with closed circuits, fastest and most reliable first"""
+        now = time.monotonic()
+        with self.lock:
+            def score(mirror):
+                health = self.health[mirror]
+                latency = health['latency'] if health['latency'] is not None else 0.5
+                return latency * (1 + 4 * health['errors'])
+            available = [mirror for mirror in self.mirrors if self.health[mirror]['open_until'] <= now]
+            # With every circuit open, trying anyway beats failing outright
+            return sorted(available or self.mirrors, key=score)
+
+    def percentile(self, fraction):
+        with self.lock:
+            samples = sorted(self.latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+    def hedge_delay(self):
+        """How long to wait on the first mirror before asking a second one"""
+        if len(self.latencies) < 10:
+            return 0.5
+        return max(0.05, self.percentile(self.hedge_percentile))
+
+    def _record(self, mirror, latency=None):
+        with self.lock:
+            health = self.health[mirror]
+            failed = 1.0 if latency is None else 0.0
+            health['errors'] = MIRROR_EWMA_ALPHA * failed + (1 - MIRROR_EWMA_ALPHA) * health['errors']
+            if latency is None:
+                health['failures'] += 1
+                if health['failures'] >= MIRROR_FAILURE_THRESHOLD:
+                    health['open_until'] = time.monotonic() + MIRROR_COOLDOWN
+                return
+            health['failures'] = 0
+            health['open_until'] = 0
+            if health['latency'] is None:
+                health['latency'] = latency
+            else:
+                health['latency'] = MIRROR_EWMA_ALPHA * latency + (1 - MIRROR_EWMA_ALPHA) * health['latency']
+
+    def _fetch(self, mirror, path, kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.get(mirror + path, timeout=self.timeout, **kwargs)
+        except requests.RequestException:
+            self._record(mirror)
+            raise
+        if response.status_code >= 500:
+            self._record(mirror)
+            response.close()
+            raise requests.HTTPError(f"{response.status_code} from {mirror}", response=response)
+        self._record(mirror, time.perf_counter() - start)
+        metrics.count("http_requests")
+        metrics.count("http_bytes", int(response.headers.get('Content-Length') or 0))
+        return response
+
+    def _path(self, url):
+        if url.startswith('/'):
+            return url
+        for mirror in self.mirrors:
+            if url.startswith(mirror + '/'):
+                return url[len(mirror):]
+        return None
+
+    def get(self, url, **kwargs):
+        """GET a YTS path (or a URL on any mirror) from whichever mirror answers first"""
+        path = self._path(url)
+        if path is None:
+            return self.session.get(url, timeout=self.timeout, **kwargs)
+
+        start = time.perf_counter()
+        candidates = iter(self.ranked_mirrors())
+        pending = {}
+        errors = []
+
+        # Fetches count toward the caller's trace, so they run in its context
+        context = contextvars.copy_context()
+
+        def launch():
+            mirror = next(candidates, None)
+            if mirror is not None:
+                pending[self.executor.submit(context.copy().run, self._fetch, mirror, path, kwargs)] = mirror
+            return mirror is not None
+
+        launch()
+        hedge_delay = self.hedge_delay()
+        while pending:
+            done, _ = wait(pending, timeout=hedge_delay, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first mirror is slower than usual: race a second one
+                if launch():
+                    with self.lock:
+                        self.hedges += 1
+                hedge_delay = None
+                continue
+            for future in done:
+                pending.pop(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                for loser in pending:
+                    loser.add_done_callback(_close_response)
+                # Percentiles (and so the hedge delay) track what callers actually waited
+                with self.lock:
+                    self.latencies.append(time.perf_counter() - start)
+                return response
+            if not pending:
+                # Every request in flight failed; fail over to the next mirror
+                launch()
+        raise errors[-1] if errors else requests.ConnectionError("No YTS mirror available")
+
+_mirror_fetcher = None
+
+def get_mirror_fetcher():
+    """Get the shared YTS fetcher (mirrors come from 'yts_mirrors' in the config)"""
+    global _mirror_fetcher
+    if _mirror_fetcher is None:
+        mirrors = load_config().get("yts_mirrors") or [get_yts_base_url()]
+        _mirror_fetcher = MirrorFetcher(mirrors)
+    return _mirror_fetcher
+
+def print_fetch_stats():
+    """Print YTS fetch latency percentiles and per-mirror health"""
+    if _mirror_fetcher is None or not _mirror_fetcher.latencies:
+        return
+    fetcher = _mirror_fetcher
+    print(f"\n⏱️  YTS fetches: {len(fetcher.latencies)} | p50 {fetcher.percentile(0.5) * 1000:.1f} ms | "
+          f"p99 {fetcher.percentile(0.99) * 1000:.1f} ms | {fetcher.hedges} hedged")
+    for mirror in fetcher.mirrors:
+        health = fetcher.health[mirror]
+        latency = f"{health['latency'] * 1000:.1f} ms" if health['latency'] is not None else "n/a"
+        state = "open" if health['open_until'] > time.monotonic() else "closed"
+        print(f"  {mirror}: latency {latency} | errors {health['errors']:.2f} | circuit {state}")
+
+class BrowseResultsParser(HTMLParser):
+    """Collect .browse-movie-title links from a browse-movies page"""
+
+    def __init__(self):
+        super().__init__()
+        self.results = []
+        self._current = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        attrs = dict(attrs)
+        if 'browse-movie-title' in (attrs.get('class') or '').split():
+            self._current = {'url': attrs.get('href') or '', 'title': ''}
+
+    def handle_data(self, data):
+        if self._current is not None:
+            self._current['title'] += data
+
+    def handle_endtag(self, tag):
+        if tag == 'a' and self._current is not None:
+            self._current['title'] = ' '.join(self._current['title'].split())
+            self.results.append(self._current)
+            self._current = None
+
+class QualityLinksParser(HTMLParser):
+    """Collect BluRay/WEB rel="nofollow" torrent links (and sizes) from a movie page"""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+        self.sizes = {}
+        self._anchor = None
+        self._modal_depth = 0
+        self._modal_href = None
+        self._modal_size = None
+        self._in_size = False
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if tag == 'div':
+            if self._modal_depth:
+                self._modal_depth += 1
+            elif 'modal-torrent' in classes:
+                self._modal_depth = 1
+                self._modal_href = None
+                self._modal_size = None
+        elif tag == 'p' and self._modal_depth and 'quality-size' in classes:
+            self._in_size = True
+        elif tag == 'a':
+            href = attrs.get('href') or ''
+            if self._modal_depth and '/torrent/download/' in href:
+                self._modal_href = href
+            self._anchor = {'href': href, 'rel': attrs.get('rel'), 'text': ''}
+
+    def handle_data(self, data):
+        if self._anchor is not None:
+            self._anchor['text'] += data
+        if self._in_size:
+            text = data.strip()
+            if text[-2:] in ('GB', 'MB'):
+                self._modal_size = text
+
+    def handle_endtag(self, tag):
+        if tag == 'p':
+            self._in_size = False
+        elif tag == 'a' and self._anchor is not None:
+            text = self._anchor['text'].strip()
+            if self._anchor['rel'] == 'nofollow' and any(q in text for q in QUALITY_TYPES):
+                self.links.append({'label': text, 'href': self._anchor['href']})
+            self._anchor = None
+        elif tag == 'div' and self._modal_depth:
+            self._modal_depth -= 1
+            if self._modal_depth == 0 and self._modal_href and self._modal_size:
+                self.sizes[self._modal_href] = self._modal_size
+
+def unique_quality_links(links):
+    """Drop duplicate quality links (same href), keeping first-seen order"""
+    qualities = {}
+    for link in links:
+        if link['href'] and link['href'] not in qualities:
+            link.setdefault('size', None)
+            link['hash'] = link['href'].rstrip('/').split('/')[-1]
+            qualities[link['href']] = link
+    return list(qualities.values())
+
+class HttpSearchEngine:
+    """Search backend that scrapes yts.mx pages over a pooled HTTP session"""
+    name = 'http'
+
+    def __init__(self, headless=True):
+        self.fetcher = get_mirror_fetcher()
+        self.base_url = self.fetcher.mirrors[0]
+        self.timings = []
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def _get(self, url, **kwargs):
+        start = time.perf_counter()
+        response = await asyncio.to_thread(self.fetcher.get, url, **kwargs)
+        response.raise_for_status()
+        self.timings.append((url, time.perf_counter() - start))
+        return response
+
+    async def search(self, movie_title):
+        """Return browse results as [{'title', 'year', 'url'}]"""
+        response = await self._get(f"/browse-movies/{quote(movie_title)}")
+        parser = BrowseResultsParser()
+        parser.feed(response.text)
+        results = []
+        for result in parser.results:
+            url = urljoin(response.url, result['url'])
+            results.append({'title': result['title'], 'year': url.rstrip('/').split('-')[-1], 'url': url})
+        return results
+
+    async def get_qualities(self, movie):
+        """Return quality links as [{'label', 'size', 'href', 'hash'}]"""
+        response = await self._get(movie['url'])
+        parser = QualityLinksParser()
+        parser.feed(response.text)
+        for link in parser.links:
+            link['size'] = parser.sizes.get(link['href'])
+            link['href'] = urljoin(response.url, link['href'])
+        return unique_quality_links(parser.links)
+
+def api_movie_result(movie, base_url):
+    """Convert a YTS API movie object into a search result with its quality listing"""
+    qualities = []
+    for torrent in movie.get('torrents') or []:
+        source = {'bluray': 'BluRay', 'web': 'WEB'}.get((torrent.get('type') or '').lower())
+        if not source:
+            continue
+        qualities.append({
+            'label': f"{torrent.get('quality')}.{source}",
+            'size': torrent.get('size'),
+            'href': f"{base_url}/torrent/download/{torrent.get('hash')}"
+        })
+    return {
+        'title': movie.get('title', 'Unknown Movie'),
+        'year': str(movie.get('year', '')),
+        'url': movie.get('url', ''),
+        'qualities': unique_quality_links(qualities)
+    }
+
+class ApiSearchEngine(HttpSearchEngine):
+    """Search backend that uses the YTS JSON API (torrents come with the search results)"""
+    name = 'api'
+
+    async def search(self, movie_title):
+        response = await self._get("/api/v2/list_movies.json",
+                                   params={'query_term': movie_title, 'limit': 50})
+        movies = (response.json().get('data') or {}).get('movies') or []
+        return [api_movie_result(movie, self.base_url) for movie in movies]
+
+    async def get_qualities(self, movie):
+        if 'qualities' in movie:
+            return movie['qualities']
+        return await super().get_qualities(movie)
+
+def chromium_profile_in_use(profile_dir):
+    """True if a running Chromium holds the profile's SingletonLock (a "host-pid" symlink)"""
+    try:
+        owner = os.readlink(os.path.join(profile_dir, 'SingletonLock'))
+    except OSError:
+        return False
+    host, _, pid = owner.rpartition('-')
+    if host != socket.gethostname():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False  # Stale lock from a crashed browser; Chromium takes it over
+    except (ValueError, PermissionError):
+        return True
+    return True
+
+class BrowserSearchEngine:
+    """Search backend that drives a headless Chromium through pyppeteer
+
+    Pages come from a pool of pre-warmed tabs with request interception, so blocked
+    resource types and domains (config "browser") are never downloaded. The profile
+    directory keeps Chromium's disk cache between runs.
+    """
+    name = 'browser'
+
+    def __init__(self, headless=True):
+        self.headless = headless
+        self.base_url = get_mirror_fetcher().ranked_mirrors()[0]
+        self.browser = None
+        self.timings = []
+        self.config = dict(DEFAULT_BROWSER_CONFIG, **(load_config().get("browser") or {}))
+        self.block_types = frozenset(self.config["block_resource_types"])
+        self.block_domains = tuple(self.config["block_domains"])
+        self.pages = None
+        self.uses = {}
+        self.missing = 0  # Pool tabs whose replacement failed to open
+        self.replacing = set()
+
+    async def start(self):
+        # Browser launch arguments for better compatibility
+        launch_args = [
+            "--no-sandbox",
+            "--disable-setuid-sandbox",
+            "--disable-dev-shm-usage",
+            "--disable-gpu"
+        ]
+
+        if not self.headless:
+            launch_args.append("--window-position=0,0")
+
+        from pyppeteer import launch
+
+        options = dict(headless=self.headless, args=launch_args,
+                       executablePath=self.config["executable"],  # None lets pyppeteer find the browser
+                       handleSIGINT=False, handleSIGTERM=False, handleSIGHUP=False)
+        profile = self.config["profile_dir"] and os.path.expanduser(self.config["profile_dir"])
+        # Another Chromium (e.g. a concurrent run) holding the profile gets a throwaway one instead
+        if profile and not chromium_profile_in_use(profile):
+            os.makedirs(profile, exist_ok=True)
+            options["userDataDir"] = profile
+        start = time.perf_counter()
+        with metrics.span("browser.launch"):
+            self.browser = await launch(**options)
+        self.timings.append(('browser launch', time.perf_counter() - start))
+        start = time.perf_counter()
+        self.pages = asyncio.Queue()
+        for page in await asyncio.gather(*(self._new_page() for _ in range(max(1, self.config["page_pool"])))):
+            self.pages.put_nowait(page)
+        self.timings.append((f"{self.pages.qsize()} pages pre-warmed", time.perf_counter() - start))
+
+    async def close(self):
+        if self.replacing:
+            await asyncio.gather(*self.replacing, return_exceptions=True)
+        if self.browser:
+            await self.browser.close()
+
+    async def _new_page(self):
+        """A tab with our user agent and the block list installed"""
+        page = await self.browser.newPage()
+        await page.setUserAgent(USER_AGENT)
+        if self.block_types or self.block_domains:
+            await page.setRequestInterception(True)
+            # pyppeteer turns the cache off with interception; keep the profile cache useful
+            await page.setCacheEnabled(True)
+            page.on('request', lambda request: asyncio.ensure_future(self._intercept(request)))
+        self.uses[page] = 0
+        return page
+
+    async def _intercept(self, request):
+        host = urlparse(request.url).hostname or ''
+        try:
+            if request.resourceType in self.block_types or any(
+                    host == domain or host.endswith('.' + domain) for domain in self.block_domains):
+                metrics.count("browser_blocked")
+                await request.abort()
+            else:
+                await request.continue_()
+        except Exception:
+            pass  # The page navigated away or was closed meanwhile
+
+    async def _acquire(self):
+        """A tab from the pool, reopening one that an earlier replacement failed to open"""
+        if self.pages.empty() and self.missing:
+            self.missing -= 1
+            try:
+                return await self._new_page()
+            except Exception:
+                self.missing += 1
+                raise
+        return await self.pages.get()
+
+    async def _replace(self, page):
+        """Close a tab and put a fresh one in the pool (retried on the next acquire if that fails)"""
+        self.uses.pop(page, None)
+        with contextlib.suppress(Exception):
+            await page.close()
+        try:
+            self.pages.put_nowait(await self._new_page())
+        except Exception:
+            self.missing += 1
+
+    def _release(self, page, healthy):
+        """Return a tab to the pool, replacing it when broken or used page_reuse times"""
+        self.uses[page] += 1
+        if healthy and self.uses[page] < self.config["page_reuse"]:
+            self.pages.put_nowait(page)
+        else:
+            # A task of its own, so a cancelled load can't interrupt the replacement
+            task = asyncio.ensure_future(self._replace(page))
+            self.replacing.add(task)
+            task.add_done_callback(self.replacing.discard)
+
+    async def _load(self, url, selector, script, *args):
+        """Load a page in a pooled tab, wait for a selector and run a single batched DOM extraction"""
+        start = time.perf_counter()
+        metrics.count("page_loads")
+        page = await self._acquire()
+        healthy = False
+        try:
+            with metrics.span("browser.goto", url=url):
+                await page.goto(url, waitUntil='domcontentloaded')
+            try:
+                # The footer is parsed after the (server-rendered) results, so an
+                # empty result page resolves immediately too
+                await page.waitForSelector(f'{selector}, footer', timeout=10000)
+            except Exception:
+                pass
+            payload = await page.evaluate(script, *args)
+            healthy = True
+        finally:
+            # Failed or cancelled loads don't hand a half-loaded tab to the next title
+            self._release(page, healthy)
+        self.timings.append((f"{url} [1 evaluate]", time.perf_counter() - start))
+        return payload
+
+    async def search(self, movie_title):
+        url = f'{self.base_url}/browse-movies/{movie_title}'
+        movies = await self._load(url, '.browse-movie-title', BROWSE_RESULTS_SCRIPT)
+        return [{'title': ' '.join(movie['title'].split()),
+                 'year': movie['url'].split('-')[-1],
+                 'url': movie['url']} for movie in movies]
+
+    async def get_qualities(self, movie):
+        links = await self._load(movie['url'], 'a[rel="nofollow"]', QUALITY_LINKS_SCRIPT, QUALITY_TYPES)
+        links = [{'label': link['label'], 'size': link['size'], 'href': link['href']}
+                 for link in links if link['visible'] and link['rel'] == 'nofollow']
+        return unique_quality_links(links)
+
+# Extract every search result in one CDP round-trip (element.href is already absolute)
+BROWSE_RESULTS_SCRIPT = """() =>
+    Array.from(document.querySelectorAll('.browse-movie-title')).map(element => ({
+        title: element.textContent,
+        url: element.href || ''
+    }))
+"""
+
+# Extract every quality link (label, size, href, rel, visibility) in one CDP round-trip
+QUALITY_LINKS_SCRIPT = """(qualities) => {
+    const sizes = {};
+    document.querySelectorAll('.modal-torrent').forEach(modal => {
+        const link = modal.querySelector('a[href*="/torrent/download/"]');
+        const size = Array.from(modal.querySelectorAll('.quality-size'))
+            .map(element => element.textContent.trim())
+            .find(text => /[GM]B$/.test(text));
+        if (link && size) sizes[link.href] = size;
+    });
+    return Array.from(document.querySelectorAll('a'))
+        .filter(element => qualities.some(quality => element.textContent.includes(quality)))
+        .map(element => ({
+            label: element.textContent.trim(),
+            href: element.href,
+            rel: element.getAttribute('rel'),
+            size: sizes[element.href] || null,
+            visible: !!(element.offsetWidth || element.offsetHeight || element.getClientRects().length)
+        }));
+}
+"""
+
+SEARCH_ENGINES = {
+    'http': HttpSearchEngine,
+    'api': ApiSearchEngine,
+    'browser': BrowserSearchEngine
+}
+
+class SearchCache:
+    """SQLite cache of browse results and per-movie quality listings with TTLs and LRU eviction"""
+
+    def __init__(self, path=CACHE_FILE, max_bytes=CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript("""
+            -- It's only a cache: WAL without a sync per commit keeps long batches off the disk's fsync latency
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                expires REAL NOT NULL,
+                accessed REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed);
+            CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+
+    def _count(self, name):
+        self.db.execute("INSERT INTO counters VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1", (name,))
+
+    def get(self, key, allow_expired=False):
+        """Return the cached value for key, or None on a miss"""
+        with self.lock, self.db:
+            row = self.db.execute("SELECT value, expires FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or (row[1] < time.time() and not allow_expired):
+                self._count("misses")
+                return None
+            self.db.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._count("hits")
+            return json.loads(row[0])
+
+    def put(self, key, value, ttl):
+        """Store value for ttl seconds, evicting least recently used entries over max_bytes"""
+        data = json.dumps(value)
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                            (key, data, len(data), now + ttl, now))
+            total = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            if total > self.max_bytes:
+                for old_key, size in self.db.execute("SELECT key, size FROM entries ORDER BY accessed").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    self.db.execute("DELETE FROM entries WHERE key = ?", (old_key,))
+                    total -= size
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            counters = dict(self.db.execute("SELECT name, value FROM counters").fetchall())
+        return {"entries": entries, "bytes": size, "hits": counters.get("hits", 0), "misses": counters.get("misses", 0)}
+
+    def close(self):
+        self.db.close()
+
+class CachedSearchEngine:
+    """Search backend wrapper that answers from the SQLite cache and starts the real engine only on a miss"""
+
+    def __init__(self, engine, cache, offline=False, refresh=False, keep_engine=False):
+        self.engine = engine
+        self.cache = cache
+        self.offline = offline
+        self.refresh = refresh
+        self.name = engine.name
+        self.timings = engine.timings
+        # A kept (daemon-owned, already started) engine outlives this wrapper
+        self.keep_engine = keep_engine
+        self._started = keep_engine
+        self._start_lock = asyncio.Lock()
+
+    async def start(self):
+        # The real engine (and its browser) is started lazily on the first cache miss
+        pass
+
+    async def close(self):
+        if self._started and not self.keep_engine:
+            await self.engine.close()
+        self.cache.close()
+
+    async def _engine(self, what):
+        if self.offline:
+            raise RuntimeError(f"{what} is not cached (running with --offline)")
+        async with self._start_lock:
+            if not self._started:
+                await self.engine.start()
+                self._started = True
+        return self.engine
+
+    def _cached(self, key):
+        start = time.perf_counter()
+        # Offline, stale entries are better than nothing
+        value = None if self.refresh else self.cache.get(key, allow_expired=self.offline)
+        if value is not None:
+            self.timings.append((f"{key} [cache]", time.perf_counter() - start))
+        return value
+
+    async def search(self, movie_title):
+        key = f"browse:{' '.join(movie_title.lower().split())}"
+        movies = self._cached(key)
+        if movies is None:
+            engine = await self._engine(f"Search for '{movie_title}'")
+            movies = await engine.search(movie_title)
+            self.cache.put(key, movies, BROWSE_CACHE_TTL)
+            # The API engine returns quality listings along with the results
+            for movie in movies:
+                if 'qualities' in movie:
+                    self.cache.put(f"movie:{movie['url']}", movie['qualities'], MOVIE_CACHE_TTL)
+        return movies
+
+    async def get_qualities(self, movie):
+        key = f"movie:{movie['url']}"
+        qualities = self._cached(key)
+        if qualities is None:
+            engine = await self._engine(f"'{movie['title']}'")
+            qualities = await engine.get_qualities(movie)
+            self.cache.put(key, qualities, MOVIE_CACHE_TTL)
+        return qualities
+
+def normalize_title(title):
+    """Lowercase a title and reduce punctuation to single spaces"""
+    return ' '.join(re.sub(r"[^\w]+", ' ', title.lower()).split())
+
+def title_similarity(query, title):
+    """Fuzzy score in [0, 1] of a normalized query against a title or any run of its words"""
+    best = SequenceMatcher(None, query, title).ratio()
+    words = title.split()
+    span = len(query.split())
+    for i in range(len(words) - span + 1):
+        best = max(best, SequenceMatcher(None, query, ' '.join(words[i:i + span])).ratio())
+    return best
+
+class CatalogIndex:
+    """Local full-text (trigram) index of the YTS catalog for instant, typo-tolerant search
+
+    Searches run in worker threads; the lock keeps them to one at a time on the shared connection.
+    """
+
+    def __init__(self, path=CATALOG_FILE):
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS movies (
+                id INTEGER PRIMARY KEY,
+                title TEXT NOT NULL,
+                year TEXT,
+                url TEXT,
+                date_added INTEGER NOT NULL DEFAULT 0,
+                result TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        """)
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS titles USING fts5(title, tokenize='trigram')")
+            self.trigram = True
+        except sqlite3.OperationalError:
+            # SQLite < 3.34 has no trigram tokenizer; fall back to scanning titles
+            self.trigram = False
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM movies").fetchone()[0]
+
+    def cursor(self):
+        """date_added (unix time) of the newest indexed movie"""
+        with self.lock:
+            row = self.db.execute("SELECT value FROM meta WHERE key = 'date_added_cursor'").fetchone()
+        return int(row[0]) if row else 0
+
+    def upsert(self, movies, base_url):
+        """Add or update YTS API movie objects and advance the date_added cursor"""
+        newest = 0
+        with self.lock, self.db:
+            for movie in movies:
+                result = api_movie_result(movie, base_url)
+                date_added = int(movie.get('date_added_unix') or 0)
+                newest = max(newest, date_added)
+                self.db.execute("INSERT OR REPLACE INTO movies VALUES (?, ?, ?, ?, ?, ?)",
+                                (movie['id'], result['title'], result['year'], result['url'],
+                                 date_added, json.dumps(result)))
+                if self.trigram:
+                    self.db.execute("DELETE FROM titles WHERE rowid = ?", (movie['id'],))
+                    self.db.execute("INSERT INTO titles (rowid, title) VALUES (?, ?)",
+                                    (movie['id'], normalize_title(result['title'])))
+            if newest > self.cursor():
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('date_added_cursor', ?)", (str(newest),))
+
+    def _candidates(self, query, limit):
+        grams = {query[i:i + 3] for i in range(len(query) - 2)}
+        with self.lock:
+            if self.trigram and grams:
+                # Any shared trigram makes a candidate so typos still match; bm25 keeps the best few hundred
+                match = ' OR '.join('"' + gram.replace('"', '""') + '"' for gram in grams)
+                return self.db.execute("""
+                    SELECT movies.title, movies.result FROM titles JOIN movies ON movies.id = titles.rowid
+                    WHERE titles MATCH ? ORDER BY rank LIMIT ?""", (match, limit)).fetchall()
+            return self.db.execute("SELECT title, result FROM movies WHERE title LIKE ? LIMIT ?",
+                                   (f"%{query}%", limit)).fetchall()
+
+    def search(self, query, limit=20, min_score=0.75):
+        """Ranked fuzzy title search; returns search results with their quality listings"""
+        query = normalize_title(query)
+        if not query:
+            return []
+        scored = []
+        for title, result in self._candidates(query, 200):
+            title = normalize_title(title)
+            score = title_similarity(query, title)
+            if score >= min_score:
+                scored.append((score, SequenceMatcher(None, query, title).ratio(), result))
+        scored.sort(key=lambda item: item[:2], reverse=True)
+        return [json.loads(result) for _, _, result in scored[:limit]]
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+def sync_catalog(full=False):
+    """Page through the YTS listing (newest first) into the local catalog index"""
+    catalog = CatalogIndex()
+    cursor = 0 if full else catalog.cursor()
+    fetcher = get_mirror_fetcher()
+    base_url = fetcher.mirrors[0]
+    start = time.perf_counter()
+    page = 1
+    synced = 0
+    print("📚 Syncing YTS catalog..." if cursor == 0 else "📚 Syncing new YTS catalog entries...")
+    try:
+        while True:
+            response = fetcher.get("/api/v2/list_movies.json", params={
+                'sort_by': 'date_added', 'order_by': 'desc', 'limit': 50, 'page': page})
+            response.raise_for_status()
+            movies = (response.json().get('data') or {}).get('movies') or []
+            # Movies added in the cursor's second are fetched again; the upsert makes that harmless
+            fresh = [movie for movie in movies if int(movie.get('date_added_unix') or 0) >= cursor]
+            catalog.upsert(fresh, base_url)
+            synced += len(fresh)
+            print(f"\r  {synced} movies", end='', flush=True)
+            if not movies or len(fresh) < len(movies):
+                break
+            page += 1
+        print(f"\r✅ Synced {synced} movies in {time.perf_counter() - start:.1f}s ({len(catalog)} in catalog)")
+        return True
+    except Exception as e:
+        print(f"\n❌ Catalog sync failed: {e}")
+        return False
+    finally:
+        catalog.close()
+
+class CatalogSearchEngine:
+    """Search backend wrapper that answers from the local catalog index before searching remotely"""
+
+    def __init__(self, engine, catalog):
+        self.engine = engine
+        self.catalog = catalog
+        self.name = engine.name
+        self.timings = engine.timings
+
+    async def start(self):
+        await self.engine.start()
+
+    async def close(self):
+        self.catalog.close()
+        await self.engine.close()
+
+    async def search(self, movie_title):
+        start = time.perf_counter()
+        # Scoring a few hundred candidates takes milliseconds; keep it off the event loop
+        movies = await asyncio.to_thread(self.catalog.search, movie_title)
+        self.timings.append((f"catalog:{movie_title}", time.perf_counter() - start))
+        query = normalize_title(movie_title)
+        if any(normalize_title(movie['title']) == query for movie in movies):
+            return movies
+        # Only near matches: the catalog may predate the wanted title, so ask the site too
+        # and keep the catalog's guesses as fuzzy extras that are never picked unprompted
+        fuzzy = [dict(movie, fuzzy=True) for movie in movies]
+        try:
+            remote = await self.engine.search(movie_title)
+        except Exception:
+            if not fuzzy:
+                raise
+            return fuzzy
+        urls = {movie['url'] for movie in remote}
+        return remote + [movie for movie in fuzzy if movie['url'] not in urls]
+
+    async def get_qualities(self, movie):
+        if 'qualities' in movie:
+            return movie['qualities']
+        return await self.engine.get_qualities(movie)
+
+def create_search_engine(name='http', headless=True):
+    """Create a search backend by name (http, api or browser)"""
+    return SEARCH_ENGINES[name](headless=headless)
+
+def print_timings(engine):
+    """Print per-page timings collected by a search backend"""
+    print(f"\n⏱️  Timings ({engine.name} engine):")
+    for label, elapsed in engine.timings:
+        print(f"  {elapsed * 1000:8.1f} ms  {label}")
+    print(f"  {sum(elapsed for _, elapsed in engine.timings) * 1000:8.1f} ms  total")
+
+_prompt_locks = {}
+
+def get_prompt_lock():
+    """Lock that serializes interactive prompts between concurrently processed titles"""
+    loop = asyncio.get_running_loop()
+    if loop not in _prompt_locks:
+        # asyncio locks are bound to one event loop
+        _prompt_locks.clear()
+        _prompt_locks[loop] = asyncio.Lock()
+    return _prompt_locks[loop]
+
+def ask(question):
+    """input() that, inside the daemon, asks the connected thin client instead"""
+    connection = _client_connection.get()
+    if connection is not None:
+        return connection.ask(question)
+    return input(question)
+
+def read_choice(question, count):
+    """Read a menu choice in [0, count) from stdin"""
+    answer = int(ask("{} [0-{}]: ".format(question, count-1)))
+    while answer not in list(range(count)):
+        answer = int(ask("Invalid choice. Please select 0-{}: ".format(count-1)))
+    return answer
+
+async def choose(heading, options, question, width=50):
+    """Show a numbered menu and read a choice, one prompt at a time"""
+    async with get_prompt_lock():
+        print("\n" + "="*width)
+        print(f"{heading}:")
+        print("="*width)
+        for i, option in enumerate(options):
+            print(f"  {i}: {option}")
+        print("="*width)
+        return await asyncio.to_thread(read_choice, question, len(options))
+
+SIZE_UNITS = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+def parse_size(text):
+    """Parse a size like '1.85 GB' or '700MB' into bytes (None if unknown)"""
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]B)\s*", text or '', re.IGNORECASE)
+    if not match:
+        return None
+    return int(float(match.group(1)) * SIZE_UNITS[match.group(2).upper()])
+
+def split_title_year(text):
+    """Split 'Inception (2010)' into ('Inception', '2010'); the year is None when absent"""
+    match = re.fullmatch(r"\s*(.*\S)\s*\((\d{4})\)\s*", text)
+    if match:
+        return match.group(1), match.group(2)
+    return text.strip(), None
+
+class SelectionPolicy:
+    """Rules that pick a movie and a quality without prompting (for unattended batches)
+
+    prefer: quality rules tried in order, e.g. ["1080p.BluRay", "720p.WEB"]; every
+    dot-separated part of a rule must appear in the label ("BluRay" matches any
+    resolution). max_size: skip torrents larger than this (e.g. "3 GB").
+    """
+
+    def __init__(self, prefer=None, max_size=None):
+        self.prefer = [rule.lower().split('.') for rule in (prefer or ["1080p.BluRay", "1080p.WEB",
+                                                                      "720p.BluRay", "720p.WEB"])]
+        self.max_size = parse_size(max_size) if isinstance(max_size, str) else max_size
+
+    @classmethod
+    def from_config(cls, prefer=None, max_size=None):
+        """Policy from the "selection_policy" config entry, overridden by CLI values"""
+        config = load_config().get("selection_policy", {})
+        return cls(prefer=prefer or config.get("prefer"), max_size=max_size or config.get("max_size"))
+
+    def pick_movie(self, movies, query, year=None):
+        """Pick a search result: exact year match when a year is given, exact title match first,
+        never a fuzzy catalog guess"""
+        if year:
+            movies = [movie for movie in movies if movie['year'] == year]
+        exact = [movie for movie in movies if normalize_title(movie['title']) == normalize_title(query)]
+        candidates = exact or [movie for movie in movies if not movie.get('fuzzy')]
+        return candidates[0] if candidates else None
+
+    def pick_quality(self, qualities):
+        """Return the index of the first quality matching a rule within the size limit, or None"""
+        for rule in self.prefer:
+            for i, quality in enumerate(qualities):
+                parts = quality['label'].lower().split('.')
+                if not all(part in parts for part in rule):
+                    continue
+                size = parse_size(quality.get('size'))
+                if self.max_size and size and size > self.max_size:
+                    continue
+                return i
+        return None
+
+class BatchJournal:
+    """Append-only record of finished titles so an interrupted batch can resume"""
 
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.completed = set()
+        if self.path.exists():
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A line cut short by a crash; that title simply runs again
+                        continue
+                    if entry.get("status") == "added":
+                        self.completed.add(normalize_title(entry["title"]))
+        self.file = open(self.path, 'a')
 
-def get_qbittorrent_config():
-    """Get qBittorrent Web UI configuration"""
-    config = load_config()
-    qbt_config = config.get("qbittorrent", DEFAULT_QBITTORRENT_CONFIG.copy())
-    
-    # Ensure all required keys exist
-    for key, default_value in DEFAULT_QBITTORRENT_CONFIG.items():
-        if key not in qbt_config:
-            qbt_config[key] = default_value
-    
-    return qbt_config
+    def done(self, title):
+        return normalize_title(title) in self.completed
 
-def save_qbittorrent_config(qbt_config):
-    """Save qBittorrent Web UI configuration"""
-    config = load_config()
-    config["qbittorrent"] = qbt_config
-    return save_config(config)
+    def record(self, title, status, torrent_hash=None):
+        """Append one entry and fsync it before the next title can be reported as finished"""
+        entry = {"title": title, "status": status, "hash": torrent_hash, "time": time.time()}
+        with self.lock:
+            self.file.write(json.dumps(entry) + "\n")
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            if status == "added":
+                self.completed.add(normalize_title(title))
 
-def ensure_qbittorrent_running():
-    """Ensure qBittorrent is running, start it if not"""
-    import subprocess
-    
-    # Check if qBittorrent is running
-    try:
-        result = subprocess.run(['pgrep', '-f', 'qbittorrent'], capture_output=True, text=True)
-        if result.returncode == 0:
-            print("✅ qBittorrent is already running")
-            return True
-    except:
-        pass
-    
-    # qBittorrent not running, start it
-    print("🚀 Starting qBittorrent...")
+    def close(self):
+        self.file.close()
+
+def read_manifest(path):
+    """Yield titles from a manifest file (or stdin for '-'), one per line, skipping blanks and # comments"""
+    stream = sys.stdin if path == '-' else open(path)
     try:
-        env = os.environ.copy()
-        env['DISPLAY'] = ':0'
-        env['WAYLAND_DISPLAY'] = 'gamescope-0'
-        
-        subprocess.Popen(['flatpak', 'run', 'org.qbittorrent.qBittorrent'],
-                        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        # Wait for qBittorrent to start
-        for i in range(10):
-            time.sleep(2)
-            result = subprocess.run(['pgrep', '-f', 'qbittorrent'], capture_output=True, text=True)
-            if result.returncode == 0:
-                print("✅ qBittorrent started successfully")
-                return True
-        
-        print("⚠️  qBittorrent may not have started properly")
-        return False
-        
-    except Exception as e:
-        print(f"❌ Failed to start qBittorrent: {e}")
-        return False
+        for line in stream:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
 
-async def wait_for_watch_folder_processing(torrent_filename, torrent_hash):
-    """Wait for qBittorrent to process the torrent file from watch folder"""
-    watch_folder = os.path.expanduser("~/TorrentWatch")
-    torrent_path = os.path.join(watch_folder, torrent_filename)
-    
-    # Ensure qBittorrent is running before waiting
-    ensure_qbittorrent_running()
-    
-    print("⏳ Waiting for qBittorrent to process torrent...")
-    
-    # Wait for file to be processed (disappear from watch folder)
-    for attempt in range(30):  # Wait up to 60 seconds
-        if not os.path.exists(torrent_path):
-            print("✅ Download started!")
-            break
-        await asyncio.sleep(2)
-    else:
-        print("⚠️  Torrent not processed - check qBittorrent watch folder settings")
-        return False
-    
-    # Now look for the download in qBittorrent
-    return await monitor_qbittorrent_download(torrent_hash)
+class TitleReader:
+    """Pull (position, title) pairs from any iterable in a thread, a few titles ahead of the workers
 
-async def monitor_qbittorrent_download(torrent_hash, movie_name_shown=False):
-    """Monitor qBittorrent download progress with real-time updates"""
-    # Get qBittorrent configuration
-    qbt_config = get_qbittorrent_config()
-    host = qbt_config["host"]
-    primary_port = qbt_config["port"]
-    username = qbt_config["username"]
-    password = qbt_config["password"]
-    
-    # Try primary port first, then fallback ports
-    ports_to_try = [primary_port, 8082, 50583, 8080, 8081]
-    # Remove duplicates while preserving order
-    ports_to_try = list(dict.fromkeys(ports_to_try))
-    
-    last_line_length = 0
-    
-    for attempt in range(60):  # Try for 2 minutes
-        for port in ports_to_try:
-            try:
-                session = requests.Session()
-                login_data = {'username': username, 'password': password}
-                login_response = session.post(f"http://{host}:{port}/api/v2/auth/login", data=login_data, timeout=3)
-                
-                if login_response.status_code == 200:
-                    torrents_response = session.get(f"http://localhost:{port}/api/v2/torrents/info", timeout=3)
-                    if torrents_response.status_code == 200:
-                        torrents = torrents_response.json()
-                        
-                        # Find our torrent
-                        for torrent in torrents:
-                            if torrent_hash.lower() in torrent.get('hash', '').lower():
-                                name = torrent.get('name', 'Unknown Movie')
-                                progress = torrent.get('progress', 0)
-                                state = torrent.get('state', 'unknown')
-                                eta = torrent.get('eta', 0)
-                                dlspeed = torrent.get('dlspeed', 0)
-                                
-                                # Show movie name once
-                                if not movie_name_shown:
-                                    print(f"🎬 {name}")
-                                    movie_name_shown = True
-                                
-                                # Clear previous line
-                                if last_line_length > 0:
-                                    print('\r' + ' ' * last_line_length + '\r', end='')
-                                
-                                if state == 'downloading':
-                                    progress_percent = int(progress * 100)
-                                    bar_length = 40
-                                    filled_length = int(bar_length * progress)
-                                    bar = '█' * filled_length + '░' * (bar_length - filled_length)
-                                    
-                                    # Format ETA
-                                    if eta > 0:
-                                        hours = eta // 3600
-                                        minutes = (eta % 3600) // 60
-                                        seconds = eta % 60
-                                        if hours > 0:
-                                            eta_str = f"{hours}h {minutes}m"
-                                        elif minutes > 0:
-                                            eta_str = f"{minutes}m {seconds}s"
-                                        else:
-                                            eta_str = f"{seconds}s"
-                                    else:
-                                        eta_str = "Unknown"
-                                    
-                                    # Format speed
-                                    if dlspeed > 1024*1024:
-                                        speed_str = f"{dlspeed/(1024*1024):.1f} MB/s"
-                                    elif dlspeed > 1024:
-                                        speed_str = f"{dlspeed/1024:.1f} KB/s"
-                                    else:
-                                        speed_str = f"{dlspeed} B/s"
-                                    
-                                    # Print progress on new line (clean and readable)
-                                    print(f"📊 [{bar}] {progress_percent}% | {speed_str} | ETA: {eta_str}")
-                                    
-                                    if progress >= 1.0:
-                                        print("\n✅ Download completed!")
-                                        return True
-                                    
-                                elif state == 'uploading':
-                                    print("\n✅ Download completed! (Now seeding)")
-                                    return True
-                                elif state == 'queuedDL':
-                                    print("⏳ Queued for download...")
-                                elif state == 'stalledDL':
-                                    print("🔍 Finding peers...")
-                                elif state == 'pausedDL':
-                                    print("⏸️  Download paused")
-                                elif state == 'checkingResumeData':
-                                    print("🔄 Checking files...")
-                                elif state == 'stalledUP':
-                                    print("✅ Download completed! (Seeding stalled)")
-                                    return True
-                                else:
-                                    print(f"📊 Status: {state}")
-                                
-                                await asyncio.sleep(3)
-                                return await monitor_qbittorrent_download(torrent_hash, True)
-                        
-                        break
-            except:
-                continue
-        
-        await asyncio.sleep(2)
-    
-    print("\n⚠️  Could not find download in qBittorrent")
-    return False
+    A manifest on stdin blocks for as long as whatever writes it, so it is never read
+    on the event loop. The thread is a daemon thread rather than an executor worker:
+    a read still blocked on stdin must not hold up exiting after Ctrl-C.
+    """
 
-async def add_torrent_to_qbittorrent_clean(magnet_link, torrent_hash):
-    """Add torrent to qBittorrent via Web API with clean UI"""
-    try:
-        # Find qBittorrent Web API port
-        ports_to_try = [50583, 8080, 8081]
-        qbt_url = None
-        
-        for port in ports_to_try:
+    def __init__(self, movie_titles, ahead):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=ahead)
+        self.closed = False
+        threading.Thread(target=self._read, args=(movie_titles,), daemon=True).start()
+
+    def _put(self, item):
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while not self.closed:
             try:
-                test_url = f"http://localhost:{port}"
-                test_response = requests.get(f"{test_url}/api/v2/app/version", timeout=3)
-                if test_response.status_code == 200:
-                    qbt_url = test_url
-                    break
-            except:
+                return future.result(timeout=0.5)
+            except concurrent.futures.TimeoutError:
                 continue
-        
-        if not qbt_url:
-            return False
-        
-        # Login to qBittorrent Web API
-        login_data = {'username': 'admin', 'password': '111111'}
-        session = requests.Session()
-        login_response = session.post(f"{qbt_url}/api/v2/auth/login", data=login_data, timeout=5)
-        
-        if login_response.status_code != 200:
-            return False
-        
-        # Add magnet link
-        add_data = {
-            'urls': magnet_link,
-            'autoTMM': 'false',
-            'savepath': get_download_dir()
-        }
-        
-        add_response = session.post(f"{qbt_url}/api/v2/torrents/add", data=add_data, timeout=5)
-        
-        if add_response.status_code == 200:
-            print("✅ Added to qBittorrent")
-            # Monitor download progress
-            await monitor_qbittorrent_download(torrent_hash)
-            return True
-        else:
-            return False
-            
-    except:
-        return False
+        future.cancel()
+        raise EOFError("title reader closed")
 
-async def grabTorrent(page):
-    ## Grab all torrent links with quality
-    all = []
-    qualities = ['BluRay', 'WEB']
-    for quality in qualities:
-        possible = await page.Jx(f"//a[contains(., '{quality}')]")
-        for element in possible:
-            if await page.evaluate("(element) => $(element).is(':visible')", element) == True:
-                all.append(element)
-    
-    quality = {}
-    for button in all:
-        text = await page.evaluate('(element) => element.textContent', button)
-        link = await page.evaluate('(element) => element.getAttribute("href")', button)
-        rel = await page.evaluate('(element) => element.getAttribute("rel")', button)
-        if any(typeOfMovie in text for typeOfMovie in qualities) and rel == "nofollow":
-            quality[link] = button
-
-    ## Make a map for all buttons
-    buttons = {}
-    print("\n" + "="*50)
-    print("Available Qualities:")
-    print("="*50)
-    for i, link in enumerate(quality):
-        button = quality[link]
-        QualityAsText = await page.evaluate('(element) => element.textContent', button)
-        print(f"  {i}: {QualityAsText}")
-        buttons[i] = button
-    print("="*50)
-    
-    ## Grab user input to get what quality they want
-    answer = int(input("Choose quality [0-{}]: ".format(len(quality)-1)))
-    while answer not in list(range(len(quality))):
-        answer = int(input("Invalid choice. Please select 0-{}: ".format(len(quality)-1)))
-
-    # Get the torrent download link and extract hash
-    torrent_link = await page.evaluate('(element) => element.getAttribute("href")', buttons[answer])
-    torrent_hash = torrent_link.split('/')[-1]
+    def _read(self, movie_titles):
+        try:
+            for item in enumerate(movie_titles):
+                if self.closed:
+                    return
+                self._put(item)
+            self._put(None)
+        except BaseException as e:
+            # Hand read errors to the workers (unless the batch is already gone)
+            with contextlib.suppress(BaseException):
+                self._put(e)
+
+    async def get(self):
+        """The next (position, title), or None once the titles have run out"""
+        item = await self.queue.get()
+        if item is None or isinstance(item, BaseException):
+            # Leave the end (or the error) for the other workers too
+            self.queue.put_nowait(item)
+        if isinstance(item, BaseException):
+            raise item
+        return item
+
+    def close(self):
+        self.closed = True
+
+async def grabTorrent(qualities, movie, monitor=None, policy=None, owned=None):
+    ## Show all torrent links with quality and grab the one the user wants
+    options = [quality['label'] + (f" ({quality['size']})" if quality.get('size') else "")
+               for quality in qualities]
+    if policy is not None:
+        answer = policy.pick_quality(qualities)
+        if answer is None:
+            print(f"⏭️  No quality of '{movie['title']}' matches the selection policy")
+            return None
+        print(f"🤖 {movie['title']} ({movie['year']}): {options[answer]}")
+    else:
+        with metrics.span("prompt.quality"):
+            answer = await choose(f"Available Qualities - {movie['title']}", options, "Choose quality")
+
+    # Get the torrent hash from the download link
+    torrent_hash = qualities[answer]['hash']
     
-    # Create magnet link
-    magnet_link = f"magnet:?xt=urn:btih:{torrent_hash}&dn=YTS+Movie&tr=udp://open.demonii.com:1337/announce&tr=udp://tracker.openbittorrent.com:80&tr=udp://tracker.coppersurfer.tk:6969&tr=udp://glotorrents.pw:6969/announce&tr=udp://tracker.opentrackr.org:1337/announce&tr=udp://torrent.gresille.org:80/announce&tr=udp://p4p.arenabg.com:1337&tr=udp://tracker.leechers-paradise.org:6969"
+    # Create magnet link with the currently fastest healthy trackers
+    with metrics.span("trackers"):
+        trackers = await best_trackers()
+    magnet_link = build_magnet(torrent_hash, movie['title'], trackers)
     
     print("\nProcessing download...")
     
     # Try to add magnet link via qBittorrent Web API
-    success = await add_torrent_to_qbittorrent_clean(magnet_link, torrent_hash)
+    with metrics.span("qbt.add_torrent", hash=torrent_hash):
+        success = await add_torrent_to_qbittorrent_clean(magnet_link, torrent_hash, monitor, trackers,
+                                                         movie=movie, owned=owned)
     
     if not success:
         # Try watch folder automation
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/97.0.4692.71 Safari/537.36'
-            }
-            
-            torrent_download_url = f"https://yts.mx/torrent/download/{torrent_hash}"
-            response = requests.get(torrent_download_url, headers=headers, timeout=30)
-            response.raise_for_status()
+            cached_torrent = await asyncio.to_thread(fetch_torrent_file, torrent_hash)
+            if cached_torrent is None:
+                raise RuntimeError("could not download a valid .torrent file")
             
             # Save to watch folder
-            watch_folder = os.path.expanduser("~/TorrentWatch")
-            movie_title = await page.evaluate('document.title')
+            movie_title = movie['title']
             safe_title = "".join(c for c in movie_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
             torrent_filename = f"{safe_title}_{torrent_hash[:8]}.torrent"
-            torrent_path = os.path.join(watch_folder, torrent_filename)
+            torrent_path = os.path.join(WATCH_FOLDER, torrent_filename)
             
-            with open(torrent_path, 'wb') as f:
-                f.write(response.content)
+            shutil.copyfile(cached_torrent, torrent_path)
             
             print("✅ Torrent added to download queue")
             
             # Wait for watch folder processing and monitor download
-            success = await wait_for_watch_folder_processing(torrent_filename, torrent_hash)
+            success = await wait_for_watch_folder_processing(torrent_filename, torrent_hash, monitor)
             
         except Exception as e:
             print(f"❌ Download failed: {e}")
             print(f"📋 Magnet link: {magnet_link}")
     
-    return magnet_link
+    return torrent_hash if success else None
 
 
-async def main(movie_title, headless=False):
-    # Browser launch arguments for better compatibility
-    launch_args = [
-        "--no-sandbox",
-        "--disable-setuid-sandbox",
-        "--disable-dev-shm-usage",
-        "--disable-gpu"
-    ]
-    
-    if not headless:
-        launch_args.append("--window-position=0,0")
-    
+class QualityPrefetcher:
+    """Loads the quality listings of the top search results while the movie menu is open
+
+    count is how many results are prefetched per menu; concurrency bounds the pages
+    (HTTP requests or browser tabs) loading at once across every title in the batch.
+    """
+
+    def __init__(self, engine, count=3, concurrency=2):
+        self.engine = engine
+        self.count = count
+        self.limit = asyncio.Semaphore(concurrency)
+
+    def start(self, movies):
+        """Begin loading the first `count` results; returns their tasks"""
+        tasks = [asyncio.create_task(self._load(movie)) for movie in movies[:self.count]]
+        for task in tasks:
+            # Failures fall back to a normal load; don't log them as unretrieved
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return tasks
+
+    async def _load(self, movie):
+        async with self.limit:
+            with metrics.span("prefetch", movie=movie['title']):
+                return await self.engine.get_qualities(movie)
+
+    async def get_qualities(self, tasks, movies, answer):
+        """Qualities of the chosen result from its prefetch; the other prefetches are cancelled"""
+        for i, task in enumerate(tasks):
+            if i != answer:
+                task.cancel()
+        if answer < len(tasks):
+            try:
+                qualities = await tasks[answer]
+                metrics.count("prefetch_hits")
+                return qualities
+            except Exception:
+                pass
+        return await self.engine.get_qualities(movies[answer])
+
+async def main(movie_title, engine, monitor=None, policy=None, prefetcher=None, owned=None):
+    """Search, pick and add one title using a shared search engine; return the added hash or None"""
+    year = None
+    qualities = None
+    if policy is not None:
+        movie_title, year = split_title_year(movie_title)
+    with metrics.span("search", query=movie_title):
+        movies = await engine.search(movie_title)
+
+    if len(movies) == 0:
+        print(f"No movies found for '{movie_title}'")
+        return None
+    elif policy is not None:
+        movie = policy.pick_movie(movies, movie_title, year)
+        if movie is None:
+            print(f"⏭️  No result for '{movie_title}' from {year}" if year else
+                  f"⏭️  Only near matches for '{movie_title}', skipping")
+            return None
+    elif len(movies) == 1 and not movies[0].get('fuzzy'):
+        movie = movies[0]
+    else:
+        options = [f"{movie['title']} ({movie['year']})" + (" - near match" if movie.get('fuzzy') else '')
+                   for movie in movies]
+        # Load the likely picks while the user is still reading the menu
+        prefetches = prefetcher.start(movies) if prefetcher is not None else []
+        try:
+            with metrics.span("prompt.movie"):
+                answer = await choose(f"Search Results - {movie_title}", options, "Choose movie", width=60)
+        except BaseException:
+            for task in prefetches:
+                task.cancel()
+            raise
+        movie = movies[answer]
+        if prefetcher is not None:
+            with metrics.span("qualities", movie=movie['title']):
+                qualities = await prefetcher.get_qualities(prefetches, movies, answer)
+
+    if qualities is None:
+        with metrics.span("qualities", movie=movie['title']):
+            qualities = await engine.get_qualities(movie)
+    if not qualities:
+        print(f"No BluRay/WEB torrents found for '{movie['title']}'")
+        return None
+    return await grabTorrent(qualities, movie, monitor, policy, owned)
+
+async def run_batch(movie_titles, headless=True, engine_name='http', show_timings=False, concurrency=8,
+                    offline=False, refresh=False, warm_engine=None, policy=None, journal=None, prefetch=None,
+                    force=False, max_active=None):
+    """Look up titles concurrently over one engine and monitor all downloads together
+
+    movie_titles may be any iterable (e.g. a manifest read line by line); titles are
+    pulled as workers free up, so a long manifest is never held in memory. Titles the
+    journal already lists as added are skipped, and every outcome is appended to it.
+    While a movie menu is open, the quality listings of its top `prefetch` results
+    are loaded in the background (config "prefetch_results", default 3). Unless
+    `force` is set, titles already in qBittorrent or on disk are not added again.
+    At most `max_active` titles download at once, in the order they were given
+    (config "scheduler", default 2; 0 lets qBittorrent run them all).
+    """
+    if warm_engine is None:
+        # Blocking HTTP calls run in worker threads; size the pool for the batch
+        # rather than the CPU count so lookups and adds really overlap
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=2 * concurrency + 8))
+    engine = warm_engine or create_search_engine(engine_name, headless=headless)
+    cache = SearchCache(max_bytes=load_config().get("cache_max_bytes", CACHE_MAX_BYTES))
+    engine = CachedSearchEngine(engine, cache, offline=offline, refresh=refresh,
+                                keep_engine=warm_engine is not None)
+    if CATALOG_FILE.exists():
+        engine = CatalogSearchEngine(engine, CatalogIndex())
+    config = load_config()
+    prefetch = config.get("prefetch_results", 3) if prefetch is None else prefetch
+    prefetcher = None
+    if prefetch > 0 and policy is None:
+        prefetcher = QualityPrefetcher(engine, prefetch, config.get("prefetch_concurrency", 2))
+    monitor = DownloadMonitor(on_complete=get_completion_hook(), scheduler=DownloadScheduler.from_config(max_active))
+    owned = None if force else OwnedIndex()
+    # Workers share one reader, so each title is taken by exactly one of them
+    titles = TitleReader(movie_titles, concurrency)
+    skipped = 0
+
+    async def worker():
+        nonlocal skipped
+        while True:
+            item = await titles.get()
+            if item is None:
+                break
+            position, title = item
+            if journal is not None and journal.done(title):
+                skipped += 1
+                continue
+            _batch_position.set(position)
+            try:
+                with metrics.span("title", title=title):
+                    torrent_hash = await main(title, engine, monitor, policy=policy, prefetcher=prefetcher,
+                                              owned=owned)
+            except Exception as e:
+                print(f"Error processing movie '{title}': {e}")
+                torrent_hash, status = None, "failed"
+            else:
+                status = "added" if torrent_hash else "skipped"
+            if journal is not None:
+                await asyncio.to_thread(journal.record, title, status, torrent_hash)
+
     try:
-        browser = await launch(
-            headless=headless,
-            args=launch_args,
-            executablePath=None,  # Let pyppeteer find the browser
-            handleSIGINT=False,
-            handleSIGTERM=False,
-            handleSIGHUP=False
-        )
-        page = await browser.newPage()
-        await page.setUserAgent('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/97.0.4692.71 Safari/537.36')
-        await page.goto(f'https://yts.mx/browse-movies/{movie_title}')
-        await asyncio.sleep(1)  # Fixed: use await with asyncio.sleep
-        movies = await page.querySelectorAll(".browse-movie-title")
-        options = {}
-
-        if len(movies) == 0:
-            print(f"No movies found for '{movie_title}'")
-            await browser.close()
-            return
-        elif len(movies) == 1:
-            movie_link = await page.evaluate('(element) => element.getAttribute("href")', movies[0])
-            await page.goto(f'{movie_link}')
-            await grabTorrent(page)
+        if owned is not None:
+            owned.start_refresh()
+        await engine.start()
+        lookups = asyncio.gather(*(worker() for _ in range(concurrency)))
+        try:
+            # Downloads are monitored while the remaining titles are still being looked up
+            await monitor.run(until=lookups)
+        except BaseException:
+            lookups.cancel()
+            raise
+        finally:
+            if monitor.scheduler is not None and monitor.scheduler.entries:
+                # Interrupted (Ctrl-C, client gone, error): don't leave titles stopped or throttled
+                await asyncio.shield(asyncio.to_thread(release_scheduler, monitor.scheduler))
+        await lookups
+        if skipped:
+            print(f"⏭️  Skipped {skipped} title(s) already added in an earlier run ({journal.path})")
+        if show_timings:
+            print_timings(engine)
+            print_fetch_stats()
+            print_poll_stats()
+    finally:
+        titles.close()
+        await engine.close()
+        if owned is not None:
+            owned.close()
+
+_client_connection = contextvars.ContextVar('client_connection', default=None)
+
+class DaemonConnection:
+    """A thin client connected to the daemon: carries the output and prompts of its command"""
+
+    def __init__(self, reader, writer, tty):
+        self.loop = asyncio.get_running_loop()
+        self.reader = reader
+        self.writer = writer
+        self.tty = tty
+        self.answers = collections.deque()
+
+    def send(self, message):
+        data = (json.dumps(message) + "\n").encode()
+        try:
+            in_loop = asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self.writer.write(data)
         else:
-            print("\n" + "="*60)
-            print("Search Results:")
-            print("="*60)
-            for i in range(len(movies)):
-                url = await page.evaluate('(element) => element.getAttribute("href")', movies[i])
-                title = await page.evaluate('(element) => element.textContent', movies[i])
-                year = url.split('-')[-1]
-                options[i] = url
-                print(f"  {i}: {title} ({year})")
-            print("="*60)
-            
-            answer = int(input("Choose movie [0-{}]: ".format(len(movies)-1)))
-            while answer not in list(range(len(movies))):
-                answer = int(input("Invalid choice. Please select 0-{}: ".format(len(movies)-1)))
-            
-            await page.goto(options[answer])
-            await grabTorrent(page)
-        
-        await browser.close()
-        
-    except Exception as e:
-        print(f"❌ Error: {e}")
+            self.loop.call_soon_threadsafe(self.writer.write, data)
+
+    def ask(self, question):
+        """Ask the client a question and block (in a worker thread) for the answer"""
+        answer = concurrent.futures.Future()
+
+        def request():
+            self.answers.append(answer)
+            self.send({"prompt": question})
+        self.loop.call_soon_threadsafe(request)
+        return answer.result()
+
+    async def read_answers(self):
+        """Feed the client's answers to waiting prompts until it disconnects"""
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            if "answer" in message and self.answers:
+                self.answers.popleft().set_result(message["answer"])
+        while self.answers:
+            self.answers.popleft().set_exception(EOFError("client disconnected"))
+
+class _ConnectionStream:
+    """sys.stdout/sys.stderr stand-in that sends output to the client whose command is running"""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        connection = _client_connection.get()
+        if connection is None:
+            return self.stream.write(text)
+        connection.send({"out": text})
+        return len(text)
+
+    def flush(self):
+        if _client_connection.get() is None:
+            self.stream.flush()
+
+    def isatty(self):
+        connection = _client_connection.get()
+        return connection.tty if connection is not None else self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+_client_config = None
+
+def drop_stale_clients():
+    """Forget the shared qBittorrent client and YTS fetcher if their config changed since they were made
+
+    The daemon outlives config edits (--set-qbt-*, hand-edited mirrors); returns True
+    when the mirrors changed, so engines built on the old fetcher must go too.
+    """
+    global _client_config, _mirror_fetcher
+    config = load_config()
+    current = (config.get("qbittorrent"), config.get("yts_mirrors"), config.get("yts_base_url"))
+    previous, _client_config = _client_config, current
+    if previous is None or previous == current:
+        return False
+    if previous[0] != current[0]:
+        forget_qbittorrent_endpoint()
+    if previous[1:] != current[1:]:
+        _mirror_fetcher = None
+        return True
+    return False
+
+async def run_client_command(argv, cwd, engines):
+    """Parse and run a thin client's command line inside the daemon"""
+    try:
+        args = parse_arguments(argv)
+    except SystemExit as e:
+        # -h or a usage error; argparse already printed the message
+        return e.code or 0
+    if drop_stale_clients():
+        for engine in engines.values():
+            await engine.close()
+        engines.clear()
+    return await run_command(args, cwd=cwd, engines=engines)
+
+async def run_daemon(metrics_port=None):
+    """Serve CLI commands over a Unix socket, keeping engines, sessions and caches warm"""
+    if SOCKET_PATH.exists():
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(SOCKET_PATH))
+            print(f"⚠️  A daemon is already listening on {SOCKET_PATH}")
+            return 1
+        except OSError:
+            # Left behind by a daemon that didn't shut down cleanly
+            SOCKET_PATH.unlink()
+        finally:
+            probe.close()
+
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=32))
+    sys.stdout = _ConnectionStream(sys.stdout)
+    sys.stderr = _ConnectionStream(sys.stderr)
+    engines = {}
+    drop_stale_clients()
+
+    async def handle(reader, writer):
+        request = json.loads(await reader.readline() or b'{}')
+        connection = DaemonConnection(reader, writer, request.get("tty", False))
+        # Each connection runs in its own task, so this only affects this command
+        _client_connection.set(connection)
+        answers = asyncio.create_task(connection.read_answers())
+        command = asyncio.create_task(run_client_command(request.get("argv", []), request.get("cwd"), engines))
+        await asyncio.wait([command, answers], return_when=asyncio.FIRST_COMPLETED)
+        if not command.done():
+            # The client went away (e.g. Ctrl+C); drop its command
+            command.cancel()
+        try:
+            code = await command
+        except (Exception, asyncio.CancelledError) as e:
+            print(f"❌ Error: {e}")
+            code = 1
+        answers.cancel()
+        try:
+            connection.send({"exit": code})
+            await writer.drain()
+            writer.close()
+        except ConnectionError:
+            pass
+
+    server = await asyncio.start_unix_server(handle, path=str(SOCKET_PATH))
+    os.chmod(SOCKET_PATH, 0o600)
+    print(f"🟢 TorrentGrabber daemon listening on {SOCKET_PATH}")
+    metrics_port = metrics_port or load_config().get("metrics_port")
+    metrics_server = None
+    if metrics_port:
+        metrics_server = await serve_metrics(metrics_port)
+        print(f"📈 Metrics at http://127.0.0.1:{metrics_port}/metrics")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        if metrics_server is not None:
+            metrics_server.close()
+        for engine in engines.values():
+            await engine.close()
+        if SOCKET_PATH.exists():
+            SOCKET_PATH.unlink()
+    return 0
+
+# Guards every read-modify-write of the config and state files (worker threads write them too)
+_config_lock = threading.RLock()
+
+def write_json_atomic(path, data):
+    """Write JSON to a temp file and rename it over path, so readers never see a partial file"""
+    fd, temp_path = tempfile.mkstemp(dir=Path(path).parent, prefix=f".{Path(path).name}.")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(temp_path)
         raise
 
 def load_config():
@@ -415,13 +3116,42 @@ def load_config():
 def save_config(config):
     """Save configuration to file"""
     try:
-        with open(CONFIG_FILE, 'w') as f:
-            json.dump(config, f, indent=2)
+        with _config_lock:
+            write_json_atomic(CONFIG_FILE, config)
         return True
     except IOError:
         print(f"Warning: Could not save config to {CONFIG_FILE}")
         return False
 
+def update_config(**sections):
+    """Replace top-level config entries in one locked read-modify-write"""
+    with _config_lock:
+        config = load_config()
+        config.update(sections)
+        return save_config(config)
+
+def load_state():
+    """Volatile caches kept out of the user's config file"""
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def update_state(key, value):
+    """Set (or with None, drop) one state entry in a locked read-modify-write"""
+    with _config_lock:
+        state = load_state()
+        if value is None:
+            if state.pop(key, None) is None:
+                return
+        else:
+            state[key] = value
+        try:
+            write_json_atomic(STATE_FILE, state)
+        except OSError:
+            pass  # Only a cache
+
 def get_download_dir():
     """Get download directory from config or prompt user to set it"""
     config = load_config()
@@ -430,7 +3160,7 @@ def get_download_dir():
     # Check if directory exists
     if not os.path.exists(download_dir):
         print(f"Download directory '{download_dir}' does not exist.")
-        download_dir = input(f"Enter download directory (default: {DEFAULT_DOWNLOAD_DIR}): ").strip()
+        download_dir = ask(f"Enter download directory (default: {DEFAULT_DOWNLOAD_DIR}): ").strip()
         if not download_dir:
             download_dir = DEFAULT_DOWNLOAD_DIR
         
@@ -438,13 +3168,12 @@ def get_download_dir():
         os.makedirs(download_dir, exist_ok=True)
         
         # Save new directory to config
-        config["download_dir"] = download_dir
-        save_config(config)
+        update_config(download_dir=download_dir)
         print(f"Download directory set to: {download_dir}")
     
     return download_dir
 
-def parse_arguments():
+def parse_arguments(argv=None):
     parser = argparse.ArgumentParser(
         description='YTSDownloader - Download torrents from yts.mx',
         epilog='Example: TorrentGrabber "Inception" "The Matrix"'
@@ -459,11 +3188,137 @@ def parse_arguments():
         action='store_true',
         help='Run browser with GUI (default is headless mode)'
     )
+    parser.add_argument(
+        '--engine',
+        choices=sorted(SEARCH_ENGINES),
+        default='http',
+        help='Search backend: http (default, no browser), api (YTS JSON API) or browser (Chromium)'
+    )
+    parser.add_argument(
+        '--timing',
+        action='store_true',
+        help='Print per-page timings for the search backend'
+    )
+    parser.add_argument(
+        '--trace',
+        metavar='FILE',
+        help='Write a JSONL trace of every stage (spans) and request counters to FILE'
+    )
+    parser.add_argument(
+        '--concurrency',
+        metavar='N',
+        type=int,
+        default=8,
+        help='Number of titles to look up at the same time (default: 8)'
+    )
+    parser.add_argument(
+        '--prefetch',
+        metavar='N',
+        type=int,
+        help='Load the qualities of the top N search results while the movie menu is open (default: 3, 0 disables)'
+    )
+    parser.add_argument(
+        '--max-active',
+        metavar='N',
+        type=int,
+        help='Download at most N titles at once, first requested first (default: 2, 0 lets qBittorrent run all)'
+    )
+    parser.add_argument(
+        '--offline',
+        action='store_true',
+        help='Only use cached search results and quality listings (no network)'
+    )
+    parser.add_argument(
+        '--refresh',
+        action='store_true',
+        help='Ignore cached search results and fetch everything again'
+    )
+    parser.add_argument(
+        '--manifest',
+        metavar='FILE',
+        help='Read titles from FILE, one per line ("-" for stdin); implies --auto and resumes from the journal'
+    )
+    parser.add_argument(
+        '--auto',
+        action='store_true',
+        help='Pick movies and qualities with the selection policy instead of prompting'
+    )
+    parser.add_argument(
+        '--prefer',
+        metavar='RULES',
+        help='Comma-separated quality preference for --auto, e.g. 1080p.BluRay,720p.WEB'
+    )
+    parser.add_argument(
+        '--max-size',
+        metavar='SIZE',
+        help='Skip torrents larger than SIZE in --auto mode, e.g. "3 GB"'
+    )
+    parser.add_argument(
+        '--sync-catalog',
+        action='store_true',
+        help='Download (or update) the local YTS catalog index used for instant fuzzy search'
+    )
+    parser.add_argument(
+        '--refresh-trackers',
+        action='store_true',
+        help='Re-probe trackers and add the fastest ones to torrents still downloading'
+    )
+    parser.add_argument(
+        '--scan-library',
+        action='store_true',
+        help='Update the index of movies already in qBittorrent or on disk'
+    )
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Add torrents even if the movie is already downloading or on disk'
+    )
+    parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='Run as a resident daemon that keeps engines and sessions warm for later commands'
+    )
+    parser.add_argument(
+        '--metrics-port',
+        metavar='PORT',
+        type=int,
+        help='With --daemon, serve Prometheus metrics on http://127.0.0.1:PORT/metrics'
+    )
+    parser.add_argument(
+        '--no-daemon',
+        action='store_true',
+        help='Run in this process even if a daemon is running'
+    )
+    parser.add_argument(
+        '--monitor-only',
+        action='store_true',
+        help='Only monitor torrents qBittorrent is already downloading'
+    )
     parser.add_argument(
         '--set-download-dir',
         metavar='PATH',
         help='Set the download directory and save it to config'
     )
+    parser.add_argument(
+        '--set-library-dir',
+        metavar='PATH',
+        help='Place completed downloads in PATH as "Title (Year)" folders (e.g. ~/jellyfin/media/Movies)'
+    )
+    parser.add_argument(
+        '--set-library-mode',
+        choices=['link', 'move'],
+        help='link: hardlink/copy into the library and keep seeding in place; move: have qBittorrent move the torrent there'
+    )
+    parser.add_argument(
+        '--set-jellyfin-url',
+        metavar='URL',
+        help='Jellyfin server to notify about new library folders (e.g. http://localhost:8096)'
+    )
+    parser.add_argument(
+        '--set-jellyfin-key',
+        metavar='KEY',
+        help='Jellyfin API key (Dashboard > API Keys)'
+    )
     parser.add_argument(
         '--show-config',
         action='store_true',
@@ -490,11 +3345,25 @@ def parse_arguments():
         metavar='PASSWORD',
         help='Set qBittorrent Web UI password'
     )
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
-if __name__ == "__main__":
-    args = parse_arguments()
-    
+async def run_command(args, cwd=None, engines=None):
+    """Run parsed CLI arguments and return the exit code (engines: warm engines kept by the daemon)"""
+    if not args.trace:
+        return await _run_command(args, cwd, engines)
+    trace_path = args.trace
+    if cwd and not os.path.isabs(trace_path):
+        trace_path = os.path.join(cwd, trace_path)
+    trace = TraceFile(trace_path)
+    # Only this command's task (and the threads it starts) write to this trace
+    token = _trace_sink.set(trace)
+    try:
+        return await _run_command(args, cwd, engines)
+    finally:
+        _trace_sink.reset(token)
+        trace.close()
+
+async def _run_command(args, cwd, engines):
     # Handle qBittorrent configuration commands
     if args.set_qbt_host or args.set_qbt_port or args.set_qbt_username or args.set_qbt_password:
         config = load_config()
@@ -516,24 +3385,48 @@ if __name__ == "__main__":
             qbt_config["password"] = args.set_qbt_password
             print("qBittorrent password updated")
         
-        config["qbittorrent"] = qbt_config
-        if save_config(config):
+        if update_config(qbittorrent=qbt_config):
             print("qBittorrent configuration saved")
         else:
             print("Failed to save qBittorrent configuration")
-        sys.exit(0)
+        return 0
     
     # Handle configuration commands
     if args.set_download_dir:
-        config = load_config()
-        download_dir = os.path.expanduser(args.set_download_dir)
+        download_dir = os.path.join(cwd or os.getcwd(), os.path.expanduser(args.set_download_dir))
         os.makedirs(download_dir, exist_ok=True)
-        config["download_dir"] = download_dir
-        if save_config(config):
+        if update_config(download_dir=download_dir):
             print(f"Download directory set to: {download_dir}")
         else:
             print("Failed to save configuration")
-        sys.exit(0)
+        return 0
+    
+    if args.set_library_dir or args.set_library_mode or args.set_jellyfin_url or args.set_jellyfin_key:
+        config = load_config()
+        library = dict(DEFAULT_LIBRARY_CONFIG, **(config.get("library") or {}))
+        
+        if args.set_library_dir:
+            library["dir"] = os.path.join(cwd or os.getcwd(), os.path.expanduser(args.set_library_dir))
+            os.makedirs(library["dir"], exist_ok=True)
+            print(f"Library directory set to: {library['dir']}")
+        
+        if args.set_library_mode:
+            library["mode"] = args.set_library_mode
+            print(f"Library mode set to: {args.set_library_mode}")
+        
+        if args.set_jellyfin_url:
+            library["jellyfin_url"] = args.set_jellyfin_url
+            print(f"Jellyfin URL set to: {args.set_jellyfin_url}")
+        
+        if args.set_jellyfin_key:
+            library["jellyfin_api_key"] = args.set_jellyfin_key
+            print("Jellyfin API key updated")
+        
+        if update_config(library=library):
+            print("Library configuration saved")
+        else:
+            print("Failed to save library configuration")
+        return 0
     
     if args.show_config:
         config = load_config()
@@ -543,22 +3436,105 @@ if __name__ == "__main__":
         print(f"  qBittorrent host: {qbt_config.get('host', 'localhost')}")
         print(f"  qBittorrent port: {qbt_config.get('port', 8082)}")
         print(f"  qBittorrent username: {qbt_config.get('username', 'admin')}")
+        print(f"  qBittorrent session reuse: {'on' if qbt_config.get('persist_session', True) else 'off'}")
+        scheduler = dict(DEFAULT_SCHEDULER_CONFIG, **(config.get("scheduler") or {}))
+        print(f"  Download slots: {scheduler['max_active'] or 'unlimited'}")
+        library = get_library_config()
+        if library["dir"]:
+            print(f"  Library: {library['dir']} ({library['mode']})")
+            print(f"  Jellyfin: {library['jellyfin_url'] or 'not configured'}")
         print(f"  Config file: {CONFIG_FILE}")
-        sys.exit(0)
+        try:
+            cache = SearchCache()
+            stats = cache.stats()
+            cache.close()
+            print(f"  Search cache: {stats['entries']} entries, {stats['bytes'] / 1024:.1f} KB, "
+                  f"{stats['hits']} hits / {stats['misses']} misses ({CACHE_FILE})")
+        except sqlite3.Error:
+            pass
+        if OWNED_INDEX_FILE.exists():
+            try:
+                owned = OwnedIndex()
+                stats = owned.stats()
+                owned.close()
+                print(f"  Owned index: {stats['files']} files, {stats['torrents']} torrents ({OWNED_INDEX_FILE})")
+            except sqlite3.Error:
+                pass
+        if engines is not None:
+            print(f"  Daemon: running ({len(engines)} warm engine(s))")
+        return 0
+    
+    if args.sync_catalog:
+        return 0 if await asyncio.to_thread(sync_catalog) else 1
+    
+    if args.refresh_trackers:
+        return 0 if await refresh_trackers() else 1
+    
+    if args.scan_library:
+        return 0 if await asyncio.to_thread(scan_library) else 1
+    
+    if args.monitor_only:
+        await monitor_active_downloads()
+        if args.timing:
+            print_poll_stats()
+        return 0
     
     # Require movies if not showing config or setting download dir
-    if not args.movies:
+    if not args.movies and not args.manifest:
         print("Error: No movies specified. Use -h for help.")
-        sys.exit(1)
+        return 1
     
-    # Fixed deprecation warning by using asyncio.run() instead of get_event_loop()
-    for movie in args.movies:
-        try:
-            # Default to headless mode unless --gui is specified
-            headless_mode = not args.gui
-            asyncio.run(main(movie, headless=headless_mode))
-        except Exception as e:
-            print(f"Error processing movie '{movie}': {e}")
-            continue
+    movie_titles, policy, journal = args.movies, None, None
+    if args.auto or args.manifest:
+        if args.max_size and parse_size(args.max_size) is None:
+            print(f"Error: Invalid size '{args.max_size}' (expected e.g. 700MB or 3 GB)")
+            return 1
+        policy = SelectionPolicy.from_config(
+            prefer=args.prefer.split(',') if args.prefer else None, max_size=args.max_size)
+    if args.manifest:
+        manifest = args.manifest
+        if manifest == '-' and engines is not None:
+            print("Error: The daemon can't read your stdin; pass a manifest file or use --no-daemon")
+            return 1
+        if manifest != '-' and cwd and not os.path.isabs(manifest):
+            manifest = os.path.join(cwd, manifest)
+        if manifest != '-' and not os.path.isfile(manifest):
+            print(f"Error: Manifest '{args.manifest}' not found")
+            return 1
+        movie_titles = itertools.chain(args.movies, read_manifest(manifest))
+        journal = BatchJournal(load_config().get("journal_file", JOURNAL_FILE))
+    
+    # Default to headless mode unless --gui is specified
+    headless_mode = not args.gui
+    warm_engine = None
+    if engines is not None:
+        key = (args.engine, headless_mode)
+        if key not in engines:
+            engines[key] = create_search_engine(args.engine, headless=headless_mode)
+            await engines[key].start()
+        warm_engine = engines[key]
+    
+    # All titles share one event loop, one search engine and one download monitor
+    try:
+        await run_batch(movie_titles, headless=headless_mode, engine_name=args.engine,
+                        show_timings=args.timing, concurrency=max(1, args.concurrency),
+                        offline=args.offline, refresh=args.refresh, warm_engine=warm_engine,
+                        policy=policy, journal=journal, prefetch=args.prefetch, force=args.force,
+                        max_active=args.max_active)
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return 1
+    finally:
+        if journal is not None:
+            journal.close()
+    return 0
+
+if __name__ == "__main__":
+    args = parse_arguments()
+    
+    if args.daemon:
+        sys.exit(asyncio.run(run_daemon(args.metrics_port)))
+    
+    sys.exit(asyncio.run(run_command(args)))
 
     
@@ -0,0 +1,1496 @@
+#!/usr/bin/env python3
+"""Offline benchmark for TorrentGrabber against a fake YTS site and a fake qBittorrent Web API
+
+Each scenario runs TorrentGrabber.py in a subprocess with HOME pointed at a scratch
+directory, so the real config, caches and qBittorrent are never touched. The fake
+servers run in this process and count every request they answer. Micro benchmarks
+time single components in-process, each in a child process with its own scratch HOME.
+
+Usage:
+    python benchmark.py                          # run every scenario, write benchmark_baseline.json
+    python benchmark.py --scenario batch-manifest --repeat 3
+    python benchmark.py --micro catalog-50k --micro tracing-overhead
+    python benchmark.py --output new.json --compare benchmark_baseline.json
+"""
+import argparse
+import asyncio
+import collections
+import email
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlparse
+
+import TorrentGrabber
+from TorrentGrabber import normalize_title, torrent_infohash
+
+SCRIPT = Path(__file__).resolve().parent / "TorrentGrabber.py"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "benchmark_baseline.json"
+
+# Titles as listed on yts.mx; batch scenarios add generated ones
+RECORDED_MOVIES = [
+    ("Inception", 2010), ("Interstellar", 2014), ("The Dark Knight", 2008),
+    ("The Matrix", 1999), ("The Matrix Reloaded", 2003), ("The Matrix Resurrections", 2021),
+    ("Blade Runner", 1982), ("Blade Runner 2049", 2017), ("Dune", 2021),
+    ("Dune: Part Two", 2024), ("Arrival", 2016), ("Parasite", 2019),
+]
+RECORDED_QUALITIES = [
+    ("720p", "BluRay", 1.12), ("1080p", "BluRay", 2.25), ("2160p", "BluRay", 5.61), ("1080p", "WEB", 2.02),
+]
+GENERATED_MOVIES = 1000
+
+# Page assets as heavy as the real site's: a browser engine that loads them pays for all of
+# them. Ad and analytics scripts come from *.localhost hosts (loopback in Chromium).
+ASSET_SIZES = {".jpg": 120 * 1024, ".css": 90 * 1024, ".woff2": 110 * 1024, ".js": 180 * 1024}
+AD_HOSTS = ["ads.localhost", "analytics.localhost"]
+
+# qBittorrent state script for every added torrent: (state, seconds), then "uploading"
+DEFAULT_STATE_SCRIPT = [("queuedDL", 0.3), ("stalledDL", 0.4), ("downloading", 1.5)]
+
+# Shared-bandwidth simulation: one link split between running torrents, each capped
+# by its swarm; a title is playable once its first pieces and its last piece are in
+SIMULATION = {"link": 8 * 1024 ** 2, "swarm": 5 * 1024 ** 2, "size": 16 * 1024 ** 2}
+SIMULATION_PIECES = 100
+PLAYABLE_PREFIX = 5
+SIMULATION_STEP = 0.05
+
+# Seconds a magnet-added torrent spends fetching metadata from peers (metaDL) before any
+# data flows; an uploaded .torrent already has it. Minutes on real swarms.
+METADATA_PHASE = 2.0
+
+def bencode(value):
+    """Bencode ints, strings, bytes, lists and dicts (keys sorted as BEP 3 requires)"""
+    if isinstance(value, int):
+        return b"i%de" % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b"%d:%s" % (len(value), value)
+    if isinstance(value, list):
+        return b"l" + b"".join(bencode(item) for item in value) + b"e"
+    return b"d" + b"".join(bencode(key) + bencode(value[key]) for key in sorted(value)) + b"e"
+
+def slugify(title, year):
+    return f"{'-'.join(normalize_title(title).split())}-{year}"
+
+def build_catalog(generated=GENERATED_MOVIES):
+    """Fixture movies with their quality listings, bencoded .torrent files and torrent names"""
+    movies = RECORDED_MOVIES + [(f"Benchmark Movie {i:04d}", 1990 + i % 35) for i in range(generated)]
+    catalog = []
+    torrents = {}
+    names = {}
+    for title, year in movies:
+        qualities = []
+        for resolution, source, gigabytes in RECORDED_QUALITIES:
+            size = int(gigabytes * 1024 ** 3)
+            name = f"{title} ({year}) [{resolution}] [{source}] [YTS.MX]"
+            info = {"name": name, "length": size, "piece length": 2 ** 21,
+                    "pieces": hashlib.sha1(name.encode()).digest()}
+            data = bencode({"announce": "udp://tracker.opentrackr.org:1337/announce", "info": info})
+            infohash = hashlib.sha1(bencode(info)).hexdigest().upper()
+            torrents[infohash] = data
+            names[infohash.lower()] = name
+            qualities.append({"quality": resolution, "type": source, "size": f"{gigabytes:.2f} GB",
+                              "size_bytes": size, "hash": infohash})
+        catalog.append({"title": title, "year": year, "slug": slugify(title, year), "qualities": qualities})
+    return catalog, torrents, names
+
+def page_head(port):
+    """Stylesheet (which pulls a web font), the site script and third-party ad/analytics scripts"""
+    third_party = "".join(f'<script src="http://{host}:{port}/assets/js/{host.split(".")[0]}.js"></script>'
+                          for host in AD_HOSTS)
+    return ('<link rel="stylesheet" href="/assets/css/main.css">'
+            f'<script src="/assets/js/app.js"></script>{third_party}')
+
+def asset_body(path):
+    """Filler of the size ASSET_SIZES gives the path's extension (CSS also references the font)"""
+    size = ASSET_SIZES.get(os.path.splitext(path)[1], 0)
+    if path.endswith(".css"):
+        head = "@font-face{font-family:yts;src:url(/assets/fonts/main.woff2)}body{font-family:yts}"
+        return (head + "/*" + "x" * (size - len(head) - 4) + "*/").encode()
+    return b"\0" * size
+
+def browse_page(movies, port=0):
+    cards = "".join(
+        f'<div class="browse-movie-wrap col-xs-10 col-sm-4 col-md-5 col-lg-4">'
+        f'<a href="/movies/{movie["slug"]}" class="browse-movie-link"><figure>'
+        f'<img class="img-responsive" src="/assets/images/movies/{movie["slug"]}/medium-cover.jpg"></figure></a>'
+        f'<div class="browse-movie-bottom"><a href="/movies/{movie["slug"]}" class="browse-movie-title">'
+        f'{movie["title"]}</a><div class="browse-movie-year">{movie["year"]}</div></div></div>\n'
+        for movie in movies)
+    return (f'<html><head><title>Browse Movies - YTS</title>{page_head(port)}</head><body><div class="browse-content">'
+            f'<h2><b>{len(movies)}</b> YIFY Movies found</h2><section><div class="row">\n{cards}'
+            f'</div></section></div><footer><p>YTS</p></footer></body></html>')
+
+def movie_page(movie, port=0):
+    links = " ".join(
+        f'<a href="/torrent/download/{q["hash"]}" rel="nofollow" title="Download {movie["title"]} '
+        f'{q["quality"]} {q["type"]} Torrent">{q["quality"]}.{q["type"]}</a>'
+        for q in movie["qualities"])
+    modals = "".join(
+        f'<div class="modal-torrent"><div class="modal-quality" id="modal-quality-{q["quality"]}">'
+        f'<span>{q["quality"]}</span></div><p class="quality-size">{q["type"]}</p>'
+        f'<p class="quality-size">{q["size"]}</p><a href="/torrent/download/{q["hash"]}" rel="nofollow" '
+        f'class="download-torrent button-green-download2-big">Download</a>'
+        f'<a href="magnet:?xt=urn:btih:{q["hash"]}" class="magnet-download download-torrent magnet" '
+        f'rel="nofollow">Magnet</a></div>'
+        for q in movie["qualities"])
+    screenshots = "".join(f'<img src="/assets/images/movies/{movie["slug"]}/medium-screenshot{i}.jpg">'
+                          for i in range(1, 4))
+    return (f'<html><head><title>{movie["title"]} ({movie["year"]}) YIFY - YTS</title>{page_head(port)}</head><body>'
+            f'<div id="movie-poster"><img src="/assets/images/movies/{movie["slug"]}/medium-cover.jpg"></div>'
+            f'<div id="movie-info"><h1>{movie["title"]}</h1><h2>{movie["year"]}</h2>'
+            f'<p class="hidden-xs hidden-sm"><em>Available in: </em>&nbsp;{links}</p></div>'
+            f'<div class="modal-content">{modals}</div><div id="screenshots">{screenshots}</div>'
+            f'<footer><p>YTS</p></footer></body></html>')
+
+class FakeYTS(ThreadingHTTPServer):
+    """yts.mx stand-in: browse, movie, .torrent and list_movies.json endpoints"""
+    daemon_threads = True
+
+    def __init__(self, catalog, torrents, latency=0.02):
+        super().__init__(('127.0.0.1', 0), FakeYTSHandler)
+        self.catalog = catalog
+        self.torrents = torrents
+        self.by_slug = {movie["slug"]: movie for movie in catalog}
+        self.latency = latency
+        self.serve_torrents = True  # False answers .torrent downloads with 404, forcing magnets
+        self.requests = collections.Counter()
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def search(self, query):
+        words = normalize_title(query).split()
+        return [movie for movie in self.catalog
+                if all(word in normalize_title(movie["title"]).split() for word in words)][:20]
+
+    def reset(self):
+        with self.lock:
+            self.requests.clear()
+            self.bytes_sent = 0
+            self.serve_torrents = True
+
+class FakeYTSHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/html; charset=UTF-8", headers=None):
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.bytes_sent += len(body)
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        url = urlparse(self.path)
+        parts = [unquote(part) for part in url.path.strip('/').split('/')]
+        if parts[0] == 'browse-movies':
+            kind = 'browse'
+            self._send(200, browse_page(server.search(parts[1] if len(parts) > 1 else ''), server.server_port))
+        elif parts[0] == 'movies' and len(parts) > 1 and parts[1] in server.by_slug:
+            kind = 'movie'
+            self._send(200, movie_page(server.by_slug[parts[1]], server.server_port))
+        elif parts[0] == 'assets':
+            # Third-party hosts are counted apart from the site's own assets
+            host = (self.headers.get('Host') or '').split(':')[0]
+            kind = 'third_party' if host in AD_HOSTS else 'asset'
+            self._send(200, asset_body(url.path), "application/octet-stream",
+                       {'Cache-Control': 'public, max-age=86400'})
+        elif (parts[:2] == ['torrent', 'download'] and len(parts) > 2 and parts[2].upper() in server.torrents
+              and server.serve_torrents):
+            kind = 'torrent'
+            self._send(200, server.torrents[parts[2].upper()], "application/x-bittorrent")
+        elif url.path == '/api/v2/list_movies.json':
+            kind = 'api'
+            query = parse_qs(url.query).get('query_term', [''])[0]
+            movies = [{"title": movie["title"], "year": movie["year"],
+                       "url": f"{server.url}/movies/{movie['slug']}",
+                       "torrents": [{"hash": q["hash"], "quality": q["quality"], "type": q["type"].lower(),
+                                     "size": q["size"], "size_bytes": q["size_bytes"]}
+                                    for q in movie["qualities"]]}
+                      for movie in server.search(query)]
+            self._send(200, json.dumps({"status": "ok", "data": {"movie_count": len(movies), "movies": movies}}),
+                       "application/json")
+        else:
+            kind = 'not_found'
+            self._send(404, "<html><body>404</body></html>")
+        with server.lock:
+            server.requests[kind] += 1
+
+class FakeQBittorrent(ThreadingHTTPServer):
+    """qBittorrent Web API stand-in whose torrents follow a scripted state sequence"""
+    daemon_threads = True
+
+    def __init__(self, username="admin", password="adminadmin", script=None, names=None):
+        super().__init__(('127.0.0.1', 0), FakeQBittorrentHandler)
+        self.username = username
+        self.password = password
+        self.script = script or DEFAULT_STATE_SCRIPT
+        self.names = names or {}  # infohash -> name, for uploaded .torrent files
+        self.save_path = None  # When set, added torrents get a (sparse) video file here
+        self.simulation = None  # When set (see SIMULATION), torrents share bandwidth instead of following the script
+        self.lose_after = None  # When set, go down this many seconds after the first add
+        self.down = False  # Drop every connection without an answer, like a qBittorrent that quit
+        self.simulated_at = 0
+        self.torrents = {}
+        self.sessions = set()
+        self.snapshots = collections.OrderedDict()
+        self.rid = 0
+        self.requests = collections.Counter()
+        self.lock = threading.Lock()
+
+    def reset(self, keep_torrents=False):
+        """Forget torrents and request counts (sessions survive, as they would in qBittorrent)"""
+        with self.lock:
+            if not keep_torrents:
+                self.torrents.clear()
+                self.snapshots.clear()
+            self.requests.clear()
+            self.save_path = None
+            self.simulation = None
+            self.lose_after = None
+            self.down = False
+
+    def add(self, infohash, name, size, options=None, magnet=False):
+        options = options or {}
+        with self.lock:
+            if infohash.lower() in self.torrents:
+                return
+            if self.lose_after is not None:
+                threading.Timer(self.lose_after, setattr, (self, "down", True)).start()
+                self.lose_after = None
+            self.simulate(time.time())
+            if self.simulation:
+                size = self.simulation["size"]
+            torrent = {"name": name, "size": size, "added_on": time.time(), "created": time.time(), "save_path": self.save_path or "/downloads",
+                       "stopped": options.get("paused") == "true" or options.get("stopped") == "true",
+                       "seq_dl": options.get("sequentialDownload") == "true",
+                       "f_l_piece_prio": options.get("firstLastPiecePrio") == "true",
+                       "dl_limit": 0, "priority": len(self.torrents) + 1,
+                       "downloaded": 0, "rate": 0, "pieces": set(), "completed_at": None, "playable_at": None,
+                       "metadata_until": time.time() + METADATA_PHASE if magnet else 0, "first_byte_at": None,
+                       "random": random.Random(infohash)}
+            self.torrents[infohash.lower()] = torrent
+        if self.save_path:
+            path = Path(self.save_path, name, f"{name}.mp4")
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, 'wb') as f:
+                f.truncate(size)
+
+    def files(self, torrent):
+        return [{"name": f"{torrent['name']}/{torrent['name']}.mp4", "size": torrent["size"], "progress": 1}]
+
+    def set_location(self, infohash, location):
+        """Move a torrent's files like qBittorrent does (a rename on one filesystem)"""
+        with self.lock:
+            torrent = self.torrents[infohash.lower()]
+            source = Path(torrent["save_path"], torrent["name"])
+            if source.exists():
+                Path(location).mkdir(parents=True, exist_ok=True)
+                shutil.move(str(source), str(Path(location, torrent["name"])))
+            torrent["save_path"] = location
+
+    def seed(self, count):
+        """Pre-load torrents that are already downloading (for --monitor-only)"""
+        for i in range(count):
+            infohash = hashlib.sha1(f"seeded {i}".encode()).hexdigest()
+            self.add(infohash, f"Seeded Movie {i:03d}", 700 * 1024 ** 2)
+
+    def control(self, action, hashes, value=None):
+        """Apply a start/stop/queue/limit/toggle call to the given torrents"""
+        with self.lock:
+            self.simulate(time.time())
+            for infohash in hashes:
+                torrent = self.torrents.get(infohash.lower())
+                if torrent is None:
+                    continue
+                if action in ("start", "resume") and torrent["stopped"]:
+                    torrent["stopped"] = False
+                    torrent["added_on"] = time.time()  # The state script starts over
+                elif action in ("stop", "pause"):
+                    torrent["stopped"] = True
+                elif action == "topPrio":
+                    torrent["priority"] = min((t["priority"] for t in self.torrents.values()), default=1) - 1
+                elif action == "setDownloadLimit":
+                    torrent["dl_limit"] = int(value)
+                elif action in ("toggleSequentialDownload", "toggleFirstLastPiecePrio"):
+                    key = "seq_dl" if action == "toggleSequentialDownload" else "f_l_piece_prio"
+                    torrent[key] = not torrent[key]
+
+    def simulate(self, now):
+        """Advance the shared-bandwidth model to `now` (caller holds the lock)"""
+        if not self.simulation:
+            self.simulated_at = now
+            return
+        while self.simulated_at < now:
+            step = min(SIMULATION_STEP, now - self.simulated_at)
+            running = [t for t in self.torrents.values() if not t["stopped"] and t["downloaded"] < t["size"]
+                       and t["metadata_until"] <= self.simulated_at]
+            if not running:
+                self.simulated_at = now
+                break
+            # Water-filling: each torrent gets an equal share of the link, up to its own cap
+            remaining = self.simulation["link"]
+            caps = sorted(running, key=lambda t: min(self.simulation["swarm"], t["dl_limit"] or float("inf")))
+            for index, torrent in enumerate(caps):
+                cap = min(self.simulation["swarm"], torrent["dl_limit"] or float("inf"))
+                torrent["rate"] = min(cap, remaining / (len(caps) - index))
+                remaining -= torrent["rate"]
+            self.simulated_at += step
+            for torrent in running:
+                self.receive(torrent, torrent["rate"] * step, self.simulated_at)
+            for torrent in self.torrents.values():
+                if torrent["stopped"] or torrent["downloaded"] >= torrent["size"]:
+                    torrent["rate"] = 0
+
+    def receive(self, torrent, amount, now):
+        """Add downloaded bytes, completing pieces in the order the torrent's flags ask for"""
+        torrent["downloaded"] = min(torrent["size"], torrent["downloaded"] + amount)
+        if torrent["first_byte_at"] is None and torrent["downloaded"] > 0:
+            torrent["first_byte_at"] = now
+        pieces = torrent["pieces"]
+        target = int(torrent["downloaded"] * SIMULATION_PIECES / torrent["size"])
+        while len(pieces) < target:
+            missing = [i for i in range(SIMULATION_PIECES) if i not in pieces]
+            edges = [i for i in (0, SIMULATION_PIECES - 1) if i not in pieces]
+            if torrent["f_l_piece_prio"] and edges:
+                pieces.add(edges[0])
+            elif torrent["seq_dl"]:
+                pieces.add(missing[0])
+            else:
+                pieces.add(torrent["random"].choice(missing))
+        if torrent["playable_at"] is None and SIMULATION_PIECES - 1 in pieces \
+                and all(i in pieces for i in range(PLAYABLE_PREFIX)):
+            torrent["playable_at"] = now
+        if torrent["completed_at"] is None and torrent["downloaded"] >= torrent["size"]:
+            torrent["completed_at"] = now
+
+    def simulation_report(self):
+        """Seconds from the first add to the first/mean completion and playability"""
+        with self.lock:
+            self.simulate(time.time())
+            torrents = list(self.torrents.values())
+        if not torrents:
+            return {}
+        start = min(t["created"] for t in torrents)
+        report = {"titles": len(torrents)}
+        for key, label in (("completed_at", "complete"), ("playable_at", "playable")):
+            times = [t[key] - start for t in torrents if t[key] is not None]
+            if times:
+                report[f"first_{label}_s"] = round(min(times), 2)
+                report[f"mean_{label}_s"] = round(statistics.mean(times), 2)
+        return report
+
+    def first_byte_report(self, since):
+        """Seconds from `since` (the tool's launch) to the first downloaded byte"""
+        with self.lock:
+            self.snapshot()
+            times = [t["first_byte_at"] - since for t in self.torrents.values() if t["first_byte_at"]]
+        return {"first_byte_s": round(min(times), 2)} if times else {}
+
+    def info(self, infohash, torrent, now):
+        """Current torrents/info entry for a torrent, following the state script or the simulation"""
+        flags = {"seq_dl": torrent["seq_dl"], "f_l_piece_prio": torrent["f_l_piece_prio"],
+                 "dl_limit": torrent["dl_limit"], "priority": torrent["priority"]}
+        if self.simulation:
+            done = torrent["downloaded"] >= torrent["size"]
+            if done:
+                state = "pausedUP" if torrent["stopped"] else "uploading"
+            elif torrent["stopped"]:
+                state = "pausedDL"
+            elif now < torrent["metadata_until"]:
+                state = "metaDL"
+            else:
+                state = "downloading" if torrent["rate"] else "stalledDL"
+            rate = int(torrent["rate"])
+            return {"hash": infohash, "name": torrent["name"], "size": torrent["size"], "state": state,
+                    "progress": round(torrent["downloaded"] / torrent["size"], 4), "dlspeed": rate,
+                    "eta": int((torrent["size"] - torrent["downloaded"]) / rate) + 1 if rate else 8640000,
+                    "added_on": int(torrent["added_on"]), "save_path": torrent["save_path"],
+                    "content_path": os.path.join(torrent["save_path"], torrent["name"]), **flags}
+        if torrent["stopped"]:
+            return {"hash": infohash, "name": torrent["name"], "size": torrent["size"], "state": "pausedDL",
+                    "progress": 0.0, "dlspeed": 0, "eta": 8640000, "added_on": int(torrent["added_on"]),
+                    "save_path": torrent["save_path"],
+                    "content_path": os.path.join(torrent["save_path"], torrent["name"]), **flags}
+        if now < torrent["metadata_until"]:
+            return {"hash": infohash, "name": torrent["name"], "size": torrent["size"], "state": "metaDL",
+                    "progress": 0.0, "dlspeed": 0, "eta": 8640000, "added_on": int(torrent["added_on"]),
+                    "save_path": torrent["save_path"],
+                    "content_path": os.path.join(torrent["save_path"], torrent["name"]), **flags}
+        started = max(torrent["added_on"], torrent["metadata_until"])
+        elapsed = now - started
+        # The script's first byte arrives when its downloading phase begins
+        waiting = sum(duration for _, duration in itertools.takewhile(lambda step: step[0] != "downloading", self.script))
+        if torrent["first_byte_at"] is None and elapsed >= waiting:
+            torrent["first_byte_at"] = started + waiting
+        state, progress, dlspeed, eta = "uploading", 1.0, 0, 8640000
+        for name, duration in self.script:
+            if elapsed < duration:
+                state = name
+                if name == "downloading":
+                    progress = elapsed / duration
+                    dlspeed = int(torrent["size"] / duration)
+                    eta = int(duration - elapsed) + 1
+                else:
+                    progress, dlspeed, eta = 0.0, 0, 8640000
+                break
+            elapsed -= duration
+        return {"hash": infohash, "name": torrent["name"], "size": torrent["size"], "state": state,
+                "progress": round(progress, 4), "dlspeed": dlspeed, "eta": eta,
+                "added_on": int(torrent["added_on"]), "save_path": torrent["save_path"],
+                "content_path": os.path.join(torrent["save_path"], torrent["name"]), **flags}
+
+    def snapshot(self):
+        now = time.time()
+        self.simulate(now)
+        return {infohash: self.info(infohash, torrent, now) for infohash, torrent in self.torrents.items()}
+
+    def maindata(self, rid):
+        """sync/maindata: a full update for unknown rids, otherwise only changed fields"""
+        with self.lock:
+            current = self.snapshot()
+            previous = self.snapshots.get(rid)
+            self.rid += 1
+            self.snapshots[self.rid] = current
+            while len(self.snapshots) > 64:
+                self.snapshots.popitem(last=False)
+            if previous is None:
+                return {"rid": self.rid, "full_update": True,
+                        "torrents": {h: {k: v for k, v in info.items() if k != "hash"} for h, info in current.items()}}
+            torrents = {}
+            for infohash, info in current.items():
+                before = previous.get(infohash, {})
+                changed = {k: v for k, v in info.items() if k != "hash" and before.get(k) != v}
+                if changed:
+                    torrents[infohash] = changed
+            data = {"rid": self.rid, "torrents": torrents}
+            removed = [infohash for infohash in previous if infohash not in current]
+            if removed:
+                data["torrents_removed"] = removed
+            return data
+
+# qBittorrent 4.x: torrents/start and torrents/stop are 5.x names and answer 404 here
+CONTROL_ENDPOINTS = {f"torrents/{action}" for action in (
+    "resume", "pause", "topPrio", "setDownloadLimit", "toggleSequentialDownload", "toggleFirstLastPiecePrio")}
+
+class FakeQBittorrentHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, headers=None):
+        if not isinstance(body, (str, bytes)):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode()
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        cookies = dict(part.strip().split('=', 1) for part in (self.headers.get('Cookie') or '').split(';')
+                       if '=' in part)
+        return cookies.get('SID') in self.server.sessions
+
+    def _route(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        endpoint = url.path.removeprefix('/api/v2/')
+        with server.lock:
+            server.requests[endpoint] += 1
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0)) if method == 'POST' else b''
+        if server.down:
+            self.close_connection = True
+            return
+
+        if endpoint == 'auth/login' and method == 'POST':
+            form = parse_qs(body.decode())
+            if form.get('username') == [server.username] and form.get('password') == [server.password]:
+                sid = os.urandom(16).hex()
+                with server.lock:
+                    server.sessions.add(sid)
+                return self._send(200, "Ok.", {'Set-Cookie': f"SID={sid}; HttpOnly; path=/"})
+            return self._send(200, "Fails.")
+        if not self._authorized():
+            return self._send(403, "Forbidden")
+
+        params = parse_qs(url.query)
+        if endpoint == 'app/version':
+            return self._send(200, "v4.6.4")
+        if endpoint == 'torrents/add' and method == 'POST':
+            return self._add(body)
+        if endpoint == 'torrents/addTrackers' and method == 'POST':
+            return self._send(200, "")
+        if endpoint in CONTROL_ENDPOINTS and method == 'POST':
+            form = parse_qs(body.decode())
+            server.control(endpoint.removeprefix('torrents/'), form.get('hashes', [''])[0].split('|'),
+                           form.get('limit', [None])[0])
+            return self._send(200, "")
+        if endpoint == 'torrents/files':
+            torrent = server.torrents.get(params.get('hash', [''])[0].lower())
+            return self._send(200, server.files(torrent)) if torrent else self._send(404, "Not Found")
+        if endpoint == 'torrents/setLocation' and method == 'POST':
+            form = parse_qs(body.decode())
+            for infohash in form.get('hashes', [''])[0].split('|'):
+                server.set_location(infohash, form['location'][0])
+            return self._send(200, "")
+        if endpoint == 'torrents/info':
+            with server.lock:
+                torrents = list(server.snapshot().values())
+            if 'hashes' in params:
+                wanted = set(params['hashes'][0].lower().split('|'))
+                torrents = [t for t in torrents if t["hash"] in wanted]
+            if params.get('filter') == ['downloading']:
+                torrents = [t for t in torrents if t["state"] in ("downloading", "stalledDL", "queuedDL", "metaDL")]
+            return self._send(200, torrents)
+        if endpoint == 'sync/maindata':
+            return self._send(200, server.maindata(int(params.get('rid', ['0'])[0])))
+        return self._send(404, "Not Found")
+
+    def _add(self, body):
+        """torrents/add with either uploaded .torrent files or urls= magnet links"""
+        content_type = self.headers.get('Content-Type') or ''
+        added = 0
+        if content_type.startswith('multipart/form-data'):
+            message = email.message_from_bytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+            fields, uploads = {}, []
+            for part in message.get_payload():
+                name = part.get_param('name', header='content-disposition')
+                if name == 'torrents':
+                    uploads.append(part)
+                else:
+                    fields[name] = part.get_payload(decode=True).decode()
+            for part in uploads:
+                infohash = torrent_infohash(part.get_payload(decode=True))
+                self.server.add(infohash, self.server.names.get(infohash, part.get_filename()), 2 * 1024 ** 3, fields)
+                added += 1
+            added += self._add_magnets(fields.get('urls', ''), fields)
+        else:
+            fields = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+            added += self._add_magnets(fields.get('urls', ''), fields)
+        return self._send(200, "Ok." if added else "Fails.")
+
+    def _add_magnets(self, urls, options):
+        added = 0
+        for url in urls.split('\n'):
+            params = parse_qs(urlparse(url.strip()).query)
+            for topic in params.get('xt', []):
+                if topic.startswith('urn:btih:'):
+                    self.server.add(topic[len('urn:btih:'):], params.get('dn', ['magnet'])[0], 1024 ** 3, options,
+                                    magnet=True)
+                    added += 1
+        return added
+
+    def do_GET(self):
+        self._route('GET')
+
+    def do_POST(self):
+        self._route('POST')
+
+class FakeJellyfin(ThreadingHTTPServer):
+    """Jellyfin stand-in that records /Library/Media/Updated notifications"""
+    daemon_threads = True
+    api_key = "benchmark-key"
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), FakeJellyfinHandler)
+        self.updates = []
+
+    def reset(self):
+        self.updates.clear()
+
+class FakeJellyfinHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('X-Emby-Token') != self.server.api_key:
+            status = 401
+        elif self.path == '/Library/Media/Updated':
+            self.server.updates.extend(json.loads(body).get("Updates", []))
+            status = 204
+        else:
+            status = 404
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+BROWSER_TITLES = ["--engine", "browser", "--max-active", "0", "--auto",
+                  "Inception (2010)", "Interstellar (2014)", "The Matrix (1999)", "Arrival (2016)"]
+
+SCENARIOS = [
+    {"name": "show-config", "argv": ["--show-config"]},
+    # The same command with a daemon running: handed over its socket vs. run in-process
+    {"name": "show-config-daemon", "daemon": True, "thin_client": True, "warmup": ["--show-config"],
+     "argv": ["--show-config"]},
+    {"name": "show-config-no-daemon", "daemon": True, "argv": ["--show-config"]},
+    {"name": "search-add-http", "argv": ["--auto", "Inception (2010)"]},
+    {"name": "search-add-api", "argv": ["--engine", "api", "--auto", "Inception (2010)"]},
+    {"name": "search-add-cached", "warmup": ["--auto", "Inception (2010)"],
+     "argv": ["--offline", "--auto", "Inception (2010)"]},
+    # Lookup throughput: every title may download at once, so the fake's script paces completion
+    {"name": "batch-manifest", "manifest": 50,
+     "argv": ["--manifest", "titles.txt", "--concurrency", "8", "--max-active", "0"]},
+    # Manifest throughput at scale, reported in titles per minute
+    {"name": "batch-1000", "manifest": 1000, "throughput": True,
+     "argv": ["--manifest", "titles.txt", "--concurrency", "8", "--max-active", "0"]},
+    {"name": "batch-owned", "manifest": 50, "owned": True,
+     "argv": ["--manifest", "titles.txt", "--concurrency", "8"]},
+    # Eight titles over one shared link, all at once vs. scheduled two at a time
+    {"name": "bandwidth-all-at-once", "manifest": 8, "simulation": True,
+     "argv": ["--manifest", "titles.txt", "--max-active", "0"]},
+    {"name": "bandwidth-scheduled", "manifest": 8, "simulation": True,
+     "argv": ["--manifest", "titles.txt", "--max-active", "2"]},
+    # Ctrl-C mid-batch: titles held back or throttled by the scheduler must be handed back
+    {"name": "batch-interrupted", "manifest": 8, "simulation": True, "interrupt": 3,
+     "argv": ["--manifest", "titles.txt", "--max-active", "2"]},
+    # Browser engine against the heavy fixture pages (needs Chromium, see --chromium); the
+    # warmup run fills the profile cache that the lean mode keeps between runs
+    {"name": "browser-full", "browser": "full", "warmup": BROWSER_TITLES, "argv": BROWSER_TITLES},
+    {"name": "browser-lean", "browser": "lean", "warmup": BROWSER_TITLES, "argv": BROWSER_TITLES},
+    # Time to first byte: uploaded .torrent vs. magnet (the fake YTS withholds the .torrent,
+    # so the tool falls back to the magnet and qBittorrent sits in metaDL first)
+    {"name": "first-byte-torrent", "first_byte": True, "argv": ["--auto", "Inception (2010)"]},
+    {"name": "first-byte-magnet", "first_byte": True, "magnet": True, "argv": ["--auto", "Inception (2010)"]},
+    # qBittorrent goes away after the first add while slow lookups of unknown titles are still
+    # running: every title must still be looked up and journaled
+    {"name": "batch-qbt-lost", "manifest": 1, "unknown": 20, "lose_qbt": 0.1, "yts_latency": 0.3,
+     "argv": ["--manifest", "titles.txt", "--concurrency", "1"]},
+    {"name": "monitor-only", "seed": 50, "argv": ["--monitor-only"]},
+    {"name": "library-link", "library": "link", "argv": ["--auto", "Inception (2010)"]},
+    {"name": "library-move", "library": "move", "argv": ["--auto", "Inception (2010)"]},
+]
+
+# Browser engine settings per scenario: "full" loads everything in a fresh tab per page
+# like the engine used to, "lean" is the default block list plus the fixture's ad hosts
+BROWSER_MODES = {
+    "full": {"block_resource_types": [], "block_domains": [], "page_pool": 8, "page_reuse": 1, "profile_dir": None},
+    "lean": {"block_domains": AD_HOSTS},
+}
+
+def prepare_home(yts, qbt, jellyfin, library_mode=None, browser=None, chromium=None):
+    """Scratch HOME with a config pointing at the fake servers and pre-probed trackers (in the state file)"""
+    home = Path(tempfile.mkdtemp(prefix="ytsbench-"))
+    (home / "Downloads").mkdir()
+    (home / "TorrentWatch").mkdir()
+    tracker = f"{yts.url}/announce"
+    config = {
+        "download_dir": str(home / "Downloads"),
+        "yts_mirrors": [yts.url],
+        "qbittorrent": {"host": "127.0.0.1", "port": qbt.server_port, "username": qbt.username,
+                        "password": qbt.password, "persist_session": True},
+        "trackers": [tracker],
+    }
+    if library_mode:
+        config["library"] = {"dir": str(home / "Movies"), "mode": library_mode,
+                             "jellyfin_url": f"http://127.0.0.1:{jellyfin.server_port}",
+                             "jellyfin_api_key": jellyfin.api_key, "jellyfin_path": "/media/Movies"}
+    if browser:
+        config["browser"] = dict(BROWSER_MODES[browser], executable=chromium)
+    (home / ".ytsdownloader_config.json").write_text(json.dumps(config, indent=2))
+    state = {"tracker_health": {tracker: {"success": 1.0, "latency": 0.001, "checked_at": time.time()}}}
+    (home / ".ytsdownloader_state.json").write_text(json.dumps(state, indent=2))
+    return home
+
+def descendants_rss_kb(pid):
+    """Combined RSS of every process below pid (e.g. Chromium and its renderers)"""
+    children = collections.defaultdict(list)
+    rss = {}
+    page_kb = os.sysconf('SC_PAGE_SIZE') // 1024
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat') as f:
+                parent = int(f.read().rsplit(')', 1)[1].split()[1])
+            with open(f'/proc/{entry}/statm') as f:
+                rss[int(entry)] = int(f.read().split()[1]) * page_kb
+        except (OSError, IndexError, ValueError):
+            continue
+        children[parent].append(int(entry))
+    total, stack = 0, list(children[pid])
+    while stack:
+        child = stack.pop()
+        total += rss.get(child, 0)
+        stack.extend(children[child])
+    return total
+
+def peak_rss_kb(pid):
+    """VmHWM of a running process: its own peak RSS, unlike ru_maxrss (0 once it has exited)"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (OSError, ValueError):
+        pass
+    return 0
+
+def run_tool(home, argv, interrupt=None, thin_client=False):
+    """Run TorrentGrabber.py once
+
+    Returns (exit code, wall seconds, rusage, peak RSS, output, peak RSS of its children).
+
+    With `interrupt`, the run gets a SIGINT (Ctrl-C) after that many seconds. Runs pass
+    --no-daemon unless `thin_client` lets them hand the command to a running daemon.
+    """
+    env = dict(os.environ, HOME=str(home), PYTHONUNBUFFERED="1")
+    with open(home / "output.log", "w+") as output:
+        start = time.perf_counter()
+        process = subprocess.Popen([sys.executable, str(SCRIPT), *([] if thin_client else ["--no-daemon"]), *argv],
+                                   cwd=home, env=env,
+                                   stdin=subprocess.DEVNULL, stdout=output, stderr=subprocess.STDOUT)
+        # ru_maxrss starts from this (much larger) process's RSS at fork and misses the browser
+        # the tool launches, so sample both the tool's own peak and its children
+        done = threading.Event()
+        own, peak = [0], [0]
+
+        def sample():
+            while True:
+                own[0] = max(own[0], peak_rss_kb(process.pid))
+                peak[0] = max(peak[0], descendants_rss_kb(process.pid))
+                if done.wait(0.02):
+                    break
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        if interrupt:
+            threading.Timer(interrupt, process.send_signal, [signal.SIGINT]).start()
+        _, status, usage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        done.set()
+        sampler.join()
+        process.returncode = os.waitstatus_to_exitcode(status)
+        output.seek(0)
+        # A run too short to be sampled falls back to ru_maxrss
+        return process.returncode, wall, usage, own[0] or usage.ru_maxrss, output.read(), peak[0]
+
+def start_daemon(home, timeout=10):
+    """Start `--daemon` in a scratch HOME and wait for its socket; returns the process"""
+    log = open(home / "daemon.log", "w")
+    process = subprocess.Popen([sys.executable, str(SCRIPT), "--daemon"], cwd=home, stdin=subprocess.DEVNULL,
+                               stdout=log, stderr=subprocess.STDOUT,
+                               env=dict(os.environ, HOME=str(home), PYTHONUNBUFFERED="1"))
+    log.close()
+    deadline = time.monotonic() + timeout
+    while not (home / ".ytsdownloader.sock").exists() and process.poll() is None and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return process
+
+def stop_daemon(process):
+    """Ctrl-C the daemon; True if it was still running and shut down cleanly"""
+    if process.poll() is not None:
+        return False
+    process.send_signal(signal.SIGINT)
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+        return False
+    return True
+
+def read_trace(path):
+    """Total milliseconds per span name, and the counters, from a --trace file"""
+    stages = collections.defaultdict(float)
+    counters = {}
+    if path.exists():
+        for line in path.read_text().splitlines():
+            record = json.loads(line)
+            if "span" in record:
+                stages[record["span"]] += record["ms"]
+            elif "counters" in record:
+                counters = record["counters"]
+    return {name: round(ms, 1) for name, ms in sorted(stages.items())}, counters
+
+def run_scenario(scenario, yts, qbt, jellyfin, repeat, chromium=None):
+    """Run one scenario `repeat` times; report medians of time and CPU and the peak RSS"""
+    runs = []
+    for _ in range(repeat):
+        home = prepare_home(yts, qbt, jellyfin, scenario.get("library"), scenario.get("browser"), chromium)
+        if scenario.get("manifest"):
+            titles = [f"{title} ({year})" for title, year in
+                      [(movie["title"], movie["year"]) for movie in yts.catalog[-scenario["manifest"]:]]]
+            titles += [f"Unlisted Movie {i} (2000)" for i in range(scenario.get("unknown", 0))]
+            (home / "titles.txt").write_text("\n".join(titles) + "\n")
+        qbt.reset()
+        daemon = start_daemon(home) if scenario.get("daemon") else None
+        if scenario.get("warmup"):
+            run_tool(home, scenario["warmup"], thin_client=scenario.get("thin_client"))
+            qbt.reset()
+        if scenario.get("owned"):
+            # The same batch again with a fresh journal: every title is already in qBittorrent
+            run_tool(home, scenario["argv"])
+            (home / ".ytsdownloader_journal.jsonl").unlink(missing_ok=True)
+            qbt.reset(keep_torrents=True)
+        if scenario.get("seed"):
+            qbt.seed(scenario["seed"])
+        if scenario.get("library"):
+            qbt.save_path = str(home / "Downloads")
+        if scenario.get("simulation"):
+            with qbt.lock:
+                qbt.simulated_at = time.time()
+                qbt.simulation = SIMULATION
+        yts.reset()
+        jellyfin.reset()
+        if scenario.get("magnet"):
+            yts.serve_torrents = False
+        latency = yts.latency
+        yts.latency = scenario.get("yts_latency", latency)
+        qbt.lose_after = scenario.get("lose_qbt")
+        launched = time.time()
+        code, wall, usage, rss, output, children_rss = run_tool(home, [*scenario["argv"], "--trace", "trace.jsonl"],
+                                                           scenario.get("interrupt"), scenario.get("thin_client"))
+        yts.latency = latency
+        if daemon is not None and not stop_daemon(daemon):
+            # The daemon must have been up for the whole run
+            code = code or 1
+        stages, counters = read_trace(home / "trace.jsonl")
+        simulation = qbt.simulation_report() if scenario.get("simulation") else None
+        first_byte = qbt.first_byte_report(launched) if scenario.get("first_byte") else None
+        if scenario.get("first_byte") and (not first_byte or bool(yts.requests.get("torrent")) == bool(scenario.get("magnet"))):
+            # A byte must arrive, over the add path the scenario is about
+            code = code or 1
+        if scenario.get("library") and not (jellyfin.updates and list((home / "Movies").rglob("*.mp4"))):
+            # The library stage must place the file and notify Jellyfin
+            code = code or 1
+        if scenario.get("interrupt"):
+            # Interrupted on purpose; it passes if nothing is left stopped or limited
+            with qbt.lock:
+                held = [t for t in qbt.torrents.values() if t["stopped"] or t["dl_limit"]]
+            code = 1 if held or not qbt.requests.get("torrents/add") else 0
+        journal = home / ".ytsdownloader_journal.jsonl"
+        journaled = len(journal.read_text().splitlines()) if journal.exists() else 0
+        if scenario.get("lose_qbt"):
+            # Losing qBittorrent fails its downloads, not the titles still to be looked up
+            if not qbt.down or journaled != scenario["manifest"] + scenario.get("unknown", 0):
+                code = code or 1
+        if scenario.get("throughput") and journaled != scenario["manifest"]:
+            # Every title of the manifest must be looked up and journaled
+            code = code or 1
+        if scenario.get("owned") and qbt.requests.get("torrents/add"):
+            # Owned titles must not be added again
+            code = code or 1
+        qbt.save_path = qbt.simulation = None
+        shutil.rmtree(home, ignore_errors=True)
+        runs.append({
+            "exit_code": code,
+            "wall_s": wall,
+            "cpu_s": usage.ru_utime + usage.ru_stime,
+            "peak_rss_kb": rss,
+            "yts_requests": dict(yts.requests),
+            "yts_bytes": yts.bytes_sent,
+            "qbt_requests": dict(qbt.requests),
+            "jellyfin_updates": len(jellyfin.updates),
+            "stages_ms": stages,
+            "counters": counters,
+            "output_tail": output.strip().splitlines()[-3:],
+            "simulation": simulation,
+            "first_byte": first_byte,
+            "children_rss_kb": children_rss,
+        })
+        if code != 0:
+            break
+    last = runs[-1]
+    ok = all(run["exit_code"] == 0 for run in runs)
+    result = {
+        "ok": ok,
+        "runs": len(runs),
+        "wall_s": round(statistics.median(run["wall_s"] for run in runs), 3),
+        "cpu_s": round(statistics.median(run["cpu_s"] for run in runs), 3),
+        "peak_rss_kb": max(run["peak_rss_kb"] for run in runs),
+        "yts_requests": last["yts_requests"],
+        "yts_bytes": last["yts_bytes"],
+        "qbt_requests": last["qbt_requests"],
+        "jellyfin_updates": last["jellyfin_updates"],
+        "stages_ms": last["stages_ms"],
+        "counters": last["counters"],
+    }
+    if scenario.get("browser"):
+        loads = last["counters"].get("page_loads") or 1
+        result["browser"] = {
+            "page_loads": last["counters"].get("page_loads", 0),
+            "mean_page_load_ms": round(last["stages_ms"].get("browser.goto", 0) / loads, 1),
+            "blocked": last["counters"].get("browser_blocked", 0),
+            "chromium_peak_rss_kb": max(run["children_rss_kb"] for run in runs),
+        }
+    if last["simulation"]:
+        result["simulation"] = {key: round(statistics.median(run["simulation"].get(key, 0) for run in runs), 2)
+                                for key in last["simulation"]}
+    if scenario.get("throughput"):
+        result["titles_per_min"] = round(scenario["manifest"] / result["wall_s"] * 60, 1)
+    if last["first_byte"]:
+        result["first_byte_s"] = round(statistics.median(run["first_byte"]["first_byte_s"] for run in runs), 2)
+    if not ok:
+        result["output_tail"] = last["output_tail"]
+    return result
+
+# In-process checks of single components, each run in a child process with a scratch HOME
+# (TorrentGrabber resolves its config and state paths at import time)
+
+def micro_tracing(calls=200_000):
+    """Per-call cost of a span and a counter with tracing off (every normal run) and on"""
+    def per_call(body):
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            body()
+            best = min(best, time.perf_counter() - start)
+        return best / calls * 1e9
+
+    def bare():
+        for _ in range(calls):
+            pass
+
+    def spans():
+        for _ in range(calls):
+            with TorrentGrabber.metrics.span("bench", title="x"):
+                pass
+
+    def counters():
+        for _ in range(calls):
+            TorrentGrabber.metrics.count("bench")
+
+    loop_ns = per_call(bare)
+    result = {"span_off_ns": round(per_call(spans) - loop_ns), "count_off_ns": round(per_call(counters) - loop_ns)}
+    trace = TorrentGrabber.TraceFile(os.devnull)
+    token = TorrentGrabber._trace_sink.set(trace)
+    try:
+        result["span_on_ns"] = round(per_call(spans) - loop_ns)
+        result["count_on_ns"] = round(per_call(counters) - loop_ns)
+    finally:
+        TorrentGrabber._trace_sink.reset(token)
+        trace.close()
+    # A run records a few hundred spans; at under 2 µs each, disabled tracing costs below a millisecond
+    result["ok"] = result["span_off_ns"] < 2000 and result["count_off_ns"] < 2000
+    return result
+
+# Syllables for made-up title words: varied enough that, as in real titles, most
+# letter trigrams are shared by only a small part of the catalog
+SYLLABLES = [consonant + vowel + coda for consonant in "bcdfghklmnprstvwz" for vowel in "aeiou" for coda in ("", "n", "r", "s")]
+
+def micro_catalog(size=50_000, queries=200):
+    """Build a synthetic catalog of `size` titles, then time typo'd and exact lookups against it"""
+    rng = random.Random(size)
+    words = sorted({"".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(4000)})
+    titles = set()
+    while len(titles) < size:
+        titles.add(" ".join(rng.choice(words).capitalize() for _ in range(rng.randint(1, 4))))
+    titles = sorted(titles)
+    movies = [{"id": i + 1, "title": title, "year": 1950 + i % 75, "url": f"https://yts.invalid/movies/{i + 1}",
+               "date_added_unix": i + 1, "torrents": [{"quality": "1080p", "type": "bluray", "size": "2 GB",
+                                                       "hash": f"{i + 1:040x}"}]}
+              for i, title in enumerate(titles)]
+    catalog = TorrentGrabber.CatalogIndex(Path.home() / "catalog.sqlite3")
+    start = time.perf_counter()
+    for page in range(0, size, 50):
+        catalog.upsert(movies[page:page + 50], "https://yts.invalid")
+    build_s = time.perf_counter() - start
+
+    def typo(title):
+        # One dropped or swapped letter (every made-up word has at least two syllables)
+        words = title.split()
+        i = rng.randrange(len(words))
+        word, j = words[i], rng.randrange(len(words[i]) - 1)
+        if rng.random() < 0.5:
+            words[i] = word[:j] + word[j + 1:]
+        else:
+            words[i] = word[:j] + word[j + 1] + word[j] + word[j + 2:]
+        return " ".join(words)
+
+    latencies = {"exact": [], "typo": []}
+    hits = 0
+    for title in rng.sample(titles, queries):
+        for kind, query in (("exact", title), ("typo", typo(title))):
+            start = time.perf_counter()
+            results = catalog.search(query)
+            latencies[kind].append(time.perf_counter() - start)
+            if kind == "typo":
+                hits += bool(results) and any(movie["title"] == title for movie in results[:3])
+    catalog.close()
+
+    def p(kind, q):
+        return round(statistics.quantiles(latencies[kind], n=100)[q - 1] * 1000, 2)
+    result = {"titles": size, "trigram": catalog.trigram, "build_s": round(build_s, 2),
+              "exact_p50_ms": p("exact", 50), "typo_p50_ms": p("typo", 50), "typo_p99_ms": p("typo", 99),
+              "typo_top3": round(hits / queries, 3)}
+    result["ok"] = result["typo_top3"] >= 0.9
+    return result
+
+def micro_watch_handoff(runs=20, delay=0.05):
+    """Watch-folder handoff: how long after a simulated consumer takes the .torrent we notice"""
+    async def measure(wait, count):
+        directory = tempfile.mkdtemp(dir=Path.home())
+        latencies = []
+        for i in range(count):
+            path = os.path.join(directory, f"{i}.torrent")
+            Path(path).touch()
+            removed = []
+
+            def consume():
+                removed.append(time.perf_counter())
+                os.remove(path)
+            threading.Timer(delay, consume).start()
+            await wait(path)
+            latencies.append(time.perf_counter() - removed[0])
+        return round(statistics.median(latencies) * 1000, 2)
+
+    async def run():
+        return {
+            "inotify_p50_ms": await measure(lambda path: TorrentGrabber.wait_for_file_removal(path, 5), runs),
+            "polling_p50_ms": await measure(TorrentGrabber._wait_for_removal_polling, runs),
+            # What the watch folder cost before: os.path.exists every 2 seconds
+            "old_2s_polling_p50_ms": await measure(lambda path: TorrentGrabber._wait_for_removal_polling(path, 2), 3),
+        }
+    result = asyncio.run(run())
+    result["ok"] = result["inotify_p50_ms"] < 50
+    return result
+
+class TrackerStandIn(BaseHTTPRequestHandler):
+    """HTTP tracker that answers every announce with an empty peer list after the server's delay"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        body = bencode({"interval": 1800, "peers": b""})
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+class UdpTrackerStandIn(asyncio.DatagramProtocol):
+    """BEP 15 tracker that answers connect requests after a delay (or never, with delay None)"""
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        if self.delay is None or len(data) < 16:
+            return
+        _, action, transaction_id = struct.unpack_from('>QII', data)
+        reply = struct.pack('>IIQ', action, transaction_id, random.getrandbits(64))
+        asyncio.get_running_loop().call_later(self.delay, self.transport.sendto, reply, addr)
+
+def unused_port(kind=socket.SOCK_STREAM):
+    """A local port nothing listens on"""
+    with socket.socket(socket.AF_INET, kind) as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def micro_tracker_probe():
+    """Rank UDP and HTTP tracker stand-ins (fast, slow, silent, dead) by probing them all at once"""
+    async def run():
+        loop = asyncio.get_running_loop()
+        trackers = {}
+        for name, delay in (("udp-fast", 0.01), ("udp-slow", 0.3), ("udp-silent", None)):
+            transport, _ = await loop.create_datagram_endpoint(lambda d=delay: UdpTrackerStandIn(d),
+                                                               local_addr=('127.0.0.1', 0))
+            trackers[name] = f"udp://127.0.0.1:{transport.get_extra_info('sockname')[1]}/announce"
+        for name, delay in (("http-fast", 0.05), ("http-slow", 0.6)):
+            server = ThreadingHTTPServer(('127.0.0.1', 0), TrackerStandIn)
+            server.daemon_threads = True
+            server.delay = delay
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            trackers[name] = f"http://127.0.0.1:{server.server_port}/announce"
+        trackers["udp-dead"] = f"udp://127.0.0.1:{unused_port(socket.SOCK_DGRAM)}/announce"
+        trackers["http-dead"] = f"http://127.0.0.1:{unused_port()}/announce"
+        TorrentGrabber.update_config(trackers=list(trackers.values()))
+        start = time.perf_counter()
+        ranked = await TorrentGrabber.best_trackers(refresh=True)
+        cold = time.perf_counter() - start
+        start = time.perf_counter()
+        await TorrentGrabber.best_trackers()
+        cached = time.perf_counter() - start
+        names = {url: name for name, url in trackers.items()}
+        return [names[url] for url in ranked], cold, cached
+
+    ranked, cold, cached = asyncio.run(run())
+    return {"ranking": ranked, "cold_ms": round(cold * 1000), "cached_ms": round(cached * 1000, 2),
+            # Probed concurrently: bounded by the probe timeout, not the sum of the slow ones
+            "ok": ranked == ["udp-fast", "http-fast", "udp-slow", "http-slow"]
+                  and cold < TorrentGrabber.TRACKER_PROBE_TIMEOUT + 0.5}
+
+def micro_endpoint_discovery():
+    """Find a qBittorrent Web UI among dead and slow ports; concurrent probing vs. one port at a time"""
+    live = FakeQBittorrent()
+    threading.Thread(target=live.serve_forever, daemon=True).start()
+    # Accepts connections (the kernel backlog does) but never answers
+    slow = socket.socket()
+    slow.bind(('127.0.0.1', 0))
+    slow.listen(16)
+    slow_port = slow.getsockname()[1]
+    TorrentGrabber.update_config(qbittorrent={"host": "127.0.0.1", "port": slow_port, "username": live.username,
+                                              "password": live.password, "persist_session": True})
+    TorrentGrabber.QBITTORRENT_FALLBACK_PORTS = [unused_port(), unused_port(), live.server_port]
+    candidates = TorrentGrabber.qbittorrent_endpoint_candidates()
+    start = time.perf_counter()
+    sequential = next(url for url in candidates if TorrentGrabber.probe_qbittorrent_endpoint(url))
+    sequential_s = time.perf_counter() - start
+    start = time.perf_counter()
+    winner = TorrentGrabber.resolve_qbittorrent_endpoint(refresh=True)
+    cold_s = time.perf_counter() - start
+    start = time.perf_counter()
+    cached = TorrentGrabber.resolve_qbittorrent_endpoint()
+    cached_s = time.perf_counter() - start
+    live.shutdown()
+    slow.close()
+    # 127.0.0.1 and localhost both reach the live stand-in; either may answer first
+    expected = {f"http://{host}:{live.server_port}" for host in ("127.0.0.1", "localhost")}
+    return {"candidates": len(candidates), "sequential_ms": round(sequential_s * 1000),
+            "concurrent_ms": round(cold_s * 1000), "cached_ms": round(cached_s * 1000, 2),
+            "ok": sequential in expected and winner in expected and cached == winner and cold_s < 1}
+
+def micro_owned_scan(movies=1000, files_per_movie=20):
+    """Scan a synthetic library of movies * files_per_movie files: cold, unchanged, and after one new file"""
+    root = Path(tempfile.mkdtemp(dir=Path.home()))
+    for i in range(movies):
+        folder = root / f"Library Movie {i:04d} ({1950 + i % 75})"
+        (folder / "Subs").mkdir(parents=True)
+        (folder / f"Library.Movie.{i:04d}.{1950 + i % 75}.1080p.BluRay.mp4").touch()
+        (folder / "poster.jpg").touch()
+        for j in range(files_per_movie - 2):
+            (folder / "Subs" / f"{j}_Language.srt").touch()
+    index = TorrentGrabber.OwnedIndex(Path.home() / "owned.sqlite3")
+
+    def timed_scan():
+        start = time.perf_counter()
+        listed, checked = index.scan([str(root)])
+        return round((time.perf_counter() - start) * 1000, 1), listed, checked
+
+    cold_ms, cold_listed, checked = timed_scan()
+    unchanged_ms, unchanged_listed, _ = timed_scan()
+    # A new download lands in an existing folder: only that directory is listed again
+    (root / "Library Movie 0007 (1957)" / "Extra Movie.2001.720p.WEB.mkv").touch()
+    changed_ms, changed_listed, _ = timed_scan()
+    found = index.lookup("0" * 40, "extra movie 2001")
+    stats = index.stats()
+    index.close()
+    return {"files": movies * files_per_movie, "dirs": checked, "indexed_videos": stats["files"],
+            "cold_ms": cold_ms, "unchanged_ms": unchanged_ms, "one_change_ms": changed_ms,
+            "ok": cold_listed == checked and unchanged_listed == 0 and changed_listed == 1
+                  and found is not None and found[0] == "file" and unchanged_ms < cold_ms / 2}
+
+def micro_prefetch(latency=0.2, think=0.5, rounds=6):
+    """Time from picking a search result to its quality menu over a slow fake YTS, with and without prefetching"""
+    catalog, torrents, _ = build_catalog(generated=20)
+    yts = FakeYTS(catalog, torrents, latency=latency)
+    threading.Thread(target=yts.serve_forever, daemon=True).start()
+    TorrentGrabber.update_config(yts_mirrors=[yts.url])
+
+    async def run():
+        engine = TorrentGrabber.HttpSearchEngine()
+        movies = await engine.search("Benchmark Movie")
+        prefetcher = TorrentGrabber.QualityPrefetcher(engine, count=3, concurrency=2)
+        latencies = {"prefetched": [], "direct": []}
+        empty = 0
+        for i in range(rounds):
+            # The user reads the menu for `think` seconds, then picks one of the top three
+            answer = i % 3
+            tasks = prefetcher.start(movies)
+            await asyncio.sleep(think)
+            start = time.perf_counter()
+            qualities = await prefetcher.get_qualities(tasks, movies, answer)
+            latencies["prefetched"].append(time.perf_counter() - start)
+            empty += not qualities
+            start = time.perf_counter()
+            await engine.get_qualities(movies[answer])
+            latencies["direct"].append(time.perf_counter() - start)
+        return latencies, empty
+
+    latencies, empty = asyncio.run(run())
+    yts.shutdown()
+    prefetched = round(statistics.median(latencies["prefetched"]) * 1000, 2)
+    direct = round(statistics.median(latencies["direct"]) * 1000, 1)
+    return {"yts_latency_ms": round(latency * 1000), "think_ms": round(think * 1000),
+            "prefetched_p50_ms": prefetched, "direct_p50_ms": direct,
+            # A pick among the prefetched results must not wait on YTS at all
+            "ok": not empty and direct >= latency * 1000 and prefetched < latency * 1000 / 4}
+
+def micro_import_time(runs=3):
+    """`python -X importtime` totals for importing TorrentGrabber (best of `runs`), and its heaviest imports"""
+    best = None
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", "import TorrentGrabber"],
+                                 cwd=SCRIPT.parent, capture_output=True, text=True, check=True)
+        rows = []
+        for line in process.stderr.splitlines():
+            fields = line.split("|")
+            if len(fields) == 3 and fields[0].split()[-1].isdigit():
+                rows.append((int(fields[0].split()[-1]), int(fields[1]), fields[2].rstrip()))
+        total = sum(own for own, _, _ in rows)
+        if best is None or total < best[0]:
+            best = (total, rows)
+    total, rows = best
+    module_us = next(cumulative for _, cumulative, name in rows if name.strip() == "TorrentGrabber")
+    # Everything imported after the interpreter's own startup (site) comes from TorrentGrabber
+    start = next((i for i, (_, _, name) in enumerate(rows) if name.strip() == "site"), -1) + 1
+    # Direct imports sit one level (two spaces) below the top-level module
+    direct = [(cumulative, name.strip()) for _, cumulative, name in rows[start:]
+              if len(name) - len(name.lstrip()) == 3]
+    return {"total_ms": round(total / 1000, 1), "torrentgrabber_ms": round(module_us / 1000, 1),
+            "heaviest": [name for _, name in sorted(direct, reverse=True)[:3]],
+            "ok": module_us < 250_000}
+
+class MirrorStandIn(BaseHTTPRequestHandler):
+    """YTS mirror that answers after the server's delay, with every `tail_every`-th request slow
+    and every request past `fail_after` a 500"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+            count = self.server.requests
+        slow = self.server.tail_every and count % self.server.tail_every == 0
+        time.sleep(self.server.tail if slow else self.server.delay)
+        body = b"<html></html>"
+        self.send_response(500 if self.server.fail_after and count > self.server.fail_after else 200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def micro_mirror_fetch(requests_made=200):
+    """Fetch through dead, failing, tail-latency and steady mirror stand-ins, with and without hedging"""
+    servers = {}
+    # The fastest mirror starts failing partway through; the slow-tail one stalls on every 20th request
+    for name, delay, fail_after, tail_every in (("failing", 0.005, 50, 0), ("slow-tail", 0.01, 0, 20),
+                                                ("steady", 0.03, 0, 0)):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), MirrorStandIn)
+        server.daemon_threads = True
+        server.delay, server.fail_after, server.tail_every, server.tail = delay, fail_after, tail_every, 0.5
+        server.lock, server.requests = threading.Lock(), 0
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers[name] = f"http://127.0.0.1:{server.server_port}"
+    servers["dead"] = f"http://127.0.0.1:{unused_port()}"
+
+    def run(fetcher):
+        latencies = []
+        for _ in range(requests_made):
+            start = time.perf_counter()
+            fetcher.get("/browse-movies").close()
+            latencies.append(time.perf_counter() - start)
+        quantiles = statistics.quantiles(latencies, n=100)
+        return round(quantiles[49] * 1000, 1), round(quantiles[98] * 1000, 1)
+
+    hedged = TorrentGrabber.MirrorFetcher([servers[name] for name in ("dead", "failing", "slow-tail", "steady")])
+    p50, p99 = run(hedged)
+    # The same tail-latency mirror on its own: nothing to hedge or fail over to
+    single = TorrentGrabber.MirrorFetcher([servers["slow-tail"]])
+    single_p50, single_p99 = run(single)
+    now = time.monotonic()
+    open_circuits = sorted(name for name, url in servers.items() if hedged.health[url]["open_until"] > now)
+    ranked = hedged.ranked_mirrors()
+    return {"requests": requests_made, "p50_ms": p50, "p99_ms": p99, "hedges": hedged.hedges,
+            "unhedged_p50_ms": single_p50, "unhedged_p99_ms": single_p99, "open_circuits": open_circuits,
+            # The mirror that went bad is cut off, the dead one (one refused connection) is routed
+            # around, and hedging on the steady mirror hides the slow tail
+            "ok": open_circuits == ["failing"] and ranked[-1] == servers["dead"] and servers["failing"] not in ranked
+                  and hedged.hedges > 0 and p99 < single_p99 / 2}
+
+MICRO_BENCHMARKS = {
+    "tracing-overhead": micro_tracing,
+    "catalog-50k": micro_catalog,
+    "watch-handoff": micro_watch_handoff,
+    "tracker-probe": micro_tracker_probe,
+    "endpoint-discovery": micro_endpoint_discovery,
+    "mirror-fetch": micro_mirror_fetch,
+    "owned-scan-20k": micro_owned_scan,
+    "prefetch-menu": micro_prefetch,
+    "import-time": micro_import_time,
+}
+
+def run_micro(name):
+    """Run one micro benchmark in a child process with a scratch HOME; returns its result dict"""
+    home = Path(tempfile.mkdtemp(prefix="ytsbench-"))
+    try:
+        process = subprocess.run([sys.executable, __file__, "--micro-child", name], capture_output=True, text=True,
+                                 env=dict(os.environ, HOME=str(home)), timeout=600)
+        try:
+            return json.loads(process.stdout.strip().splitlines()[-1])
+        except (IndexError, ValueError):
+            return {"ok": False, "output_tail": (process.stdout + process.stderr).strip().splitlines()[-3:]}
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+# Changes smaller than this are run-to-run noise however large they are relative to a tiny
+# baseline (a 200 ms scenario easily varies by 25% between single runs)
+NOISE_FLOOR = {"wall_s": 0.1, "cpu_s": 0.1, "first_byte_s": 0.1, "peak_rss_kb": 2048, "requests": 0}
+
+def compare(old, new, threshold):
+    """Print per-scenario changes against an earlier baseline; returns the regressed scenarios"""
+    regressed = []
+    print(f"\n{'scenario':<20} {'metric':<14} {'baseline':>10} {'now':>10} {'change':>8}")
+    for name, result in new["scenarios"].items():
+        before = old.get("scenarios", {}).get(name)
+        if before is None:
+            print(f"{name:<20} (new scenario)")
+            continue
+        metrics = ["wall_s", "cpu_s", "peak_rss_kb", "requests"]
+        if "first_byte_s" in before and "first_byte_s" in result:
+            metrics.append("first_byte_s")
+        for metric in metrics:
+            if metric == "requests":
+                was = sum(before["yts_requests"].values()) + sum(before["qbt_requests"].values())
+                now = sum(result["yts_requests"].values()) + sum(result["qbt_requests"].values())
+            else:
+                was, now = before[metric], result[metric]
+            change = (now - was) / was if was else 0.0
+            flag = ""
+            if change > threshold and now - was > NOISE_FLOOR[metric]:
+                flag = "  ⚠️"
+                regressed.append(name)
+            print(f"{name:<20} {metric:<14} {was:>10} {now:>10} {change:>+7.0%}{flag}")
+    return sorted(set(regressed))
+
+def find_chromium():
+    """pyppeteer's downloaded Chromium, if it starts on this machine"""
+    try:
+        from pyppeteer.chromium_downloader import check_chromium, chromium_executable
+    except ImportError:
+        return None
+    if not check_chromium():
+        return None
+    executable = str(chromium_executable())
+    try:
+        subprocess.run([executable, "--headless", "--no-sandbox", "--version"], capture_output=True, timeout=10,
+                       check=True)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return executable
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Offline benchmark of TorrentGrabber against fake YTS and qBittorrent servers')
+    parser.add_argument('--scenario', action='append', choices=[s["name"] for s in SCENARIOS],
+                        help='Only run this scenario (repeatable; default: all)')
+    parser.add_argument('--micro', action='append', choices=list(MICRO_BENCHMARKS),
+                        help='Only run this in-process micro benchmark (repeatable; default: all)')
+    parser.add_argument('--micro-child', choices=list(MICRO_BENCHMARKS), help=argparse.SUPPRESS)
+    parser.add_argument('--repeat', type=int, default=1, metavar='N', help='Runs per scenario (medians are reported)')
+    parser.add_argument('--latency', type=float, default=20, metavar='MS', help='Simulated YTS response latency (default: 20)')
+    parser.add_argument('--output', metavar='FILE', default=str(DEFAULT_BASELINE),
+                        help=f'Where to write the JSON results (default: {DEFAULT_BASELINE.name})')
+    parser.add_argument('--chromium', metavar='PATH',
+                        help="Chromium for the browser-* scenarios (default: pyppeteer's own, if downloaded)")
+    parser.add_argument('--compare', metavar='FILE', help='Compare against an earlier results file')
+    parser.add_argument('--threshold', type=float, default=0.25, metavar='FRACTION',
+                        help='With --compare, exit non-zero if a metric grows by more than this (default: 0.25)')
+    return parser.parse_args()
+
+def main():
+    args = parse_arguments()
+    if args.micro_child:
+        print(json.dumps(MICRO_BENCHMARKS[args.micro_child]()))
+        return 0
+    catalog, torrents, names = build_catalog()
+    yts = FakeYTS(catalog, torrents, latency=args.latency / 1000)
+    qbt = FakeQBittorrent(names=names)
+    jellyfin = FakeJellyfin()
+    for server in (yts, qbt, jellyfin):
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = {"python": sys.version.split()[0], "latency_ms": args.latency, "repeat": args.repeat,
+               "scenarios": {}, "micro": {}}
+    failed = False
+    chromium = args.chromium or find_chromium()
+    # --scenario and --micro pick what runs; with neither, everything does
+    chosen = args.scenario or args.micro
+    for scenario in SCENARIOS:
+        if chosen and scenario["name"] not in (args.scenario or []):
+            continue
+        if scenario.get("browser") and not chromium:
+            print(f"⏭️  {scenario['name']:<20} skipped: no runnable Chromium (pass --chromium PATH)")
+            continue
+        result = run_scenario(scenario, yts, qbt, jellyfin, max(1, args.repeat), chromium)
+        results["scenarios"][scenario["name"]] = result
+        requests_made = sum(result["yts_requests"].values()) + sum(result["qbt_requests"].values())
+        status = "✅" if result["ok"] else "❌"
+        print(f"{status} {scenario['name']:<20} {result['wall_s'] * 1000:8.0f} ms  cpu {result['cpu_s'] * 1000:6.0f} ms  "
+              f"rss {result['peak_rss_kb'] / 1024:6.1f} MB  {requests_made:4d} requests")
+        if result.get("simulation"):
+            simulation = result["simulation"]
+            print(f"   {simulation['titles']} titles: first complete {simulation.get('first_complete_s', '-')}s, "
+                  f"mean complete {simulation.get('mean_complete_s', '-')}s, first playable "
+                  f"{simulation.get('first_playable_s', '-')}s, mean playable {simulation.get('mean_playable_s', '-')}s")
+        if "first_byte_s" in result:
+            print(f"   first byte {result['first_byte_s']}s after launch")
+        if "titles_per_min" in result:
+            print(f"   {result['titles_per_min']} titles per minute")
+        if result.get("browser"):
+            browser = result["browser"]
+            print(f"   {browser['page_loads']} page loads, {browser['mean_page_load_ms']} ms mean, "
+                  f"{browser['blocked']} requests blocked, {result['yts_bytes'] / 1024 ** 2:.1f} MB served, "
+                  f"Chromium peak RSS {browser['chromium_peak_rss_kb'] / 1024:.0f} MB")
+        if not result["ok"]:
+            failed = True
+            for line in result["output_tail"]:
+                print(f"    {line}")
+
+    for name in MICRO_BENCHMARKS:
+        if chosen and name not in (args.micro or []):
+            continue
+        result = run_micro(name)
+        results["micro"][name] = result
+        status = "✅" if result["ok"] else "❌"
+        print(f"{status} {name:<20} " + ", ".join(f"{key} {value}" for key, value in result.items() if key != "ok"))
+        if not result["ok"]:
+            failed = True
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(json.load(f), results, args.threshold)
+        if regressed:
+            print(f"\n⚠️  Regressed: {', '.join(regressed)}")
+            failed = True
+    for server in (yts, qbt, jellyfin):
+        server.shutdown()
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())